@@ -0,0 +1,269 @@
+# archive.py — eski buyurtmalarni oylik arxiv bazalariga ko'chirish va hisobotlar uchun snapshot
+#   python archive.py orders.db --archive-dir archive --days 90 [--snapshot snapshot.db]
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import logging
+import argparse
+import calendar
+from contextlib import closing
+from typing import Any, Callable, List, Optional, Tuple
+
+from stats import TASHKENT_UTC_OFFSET
+from metrics import ORDERS_ARCHIVED
+import export
+
+log = logging.getLogger("davon-taksi-bot.archive")
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))    # shundan eski buyurtmalar arxivga; 0 — o'chiq
+ARCHIVE_EVERY      = float(os.getenv("ARCHIVE_EVERY", "21600"))    # arxivlash oralig'i, s
+ARCHIVE_BATCH      = int(os.getenv("ARCHIVE_BATCH", "500"))        # bitta tranzaksiya — yozuvchilar shuncha kutadi
+SNAPSHOT_EVERY     = float(os.getenv("SNAPSHOT_EVERY", "900"))     # snapshot oralig'i, s; 0 — hisobotlar jonli bazadan
+MAINTENANCE_DELAY  = 30.0      # startdan keyin birinchi ishgacha — ishga tushish IO'si bilan to'qnashmasin
+ARCHIVE_MARK       = ".archived"   # arxiv papkasida: oxirgi chegara; mtime — qatorlar ko'chirilgan vaqt
+
+SQL_MONTHS = """
+    SELECT DISTINCT strftime('%Y-%m', created_at + ?, 'unixepoch') FROM orders
+    WHERE created_at < ? ORDER BY 1
+"""
+# Hali operatorga yetkazilmagan buyurtmalar jonli bazada qoladi (outbox JOIN orders)
+SQL_BATCH_IDS = """
+    SELECT id FROM main.orders
+    WHERE created_at >= ? AND created_at < ?
+      AND id NOT IN (SELECT order_id FROM main.operator_outbox WHERE status='pending')
+    ORDER BY created_at LIMIT ?
+"""
+_CREATE_RE = re.compile(r'^CREATE TABLE\s+("orders"|`orders`|\[orders\]|orders)', re.I)
+
+
+def month_of(ts: float) -> str:
+    return time.strftime("%Y-%m", time.gmtime(ts + TASHKENT_UTC_OFFSET))
+
+def month_bounds(month: str) -> Tuple[int, int]:
+    """"2024-05" (Toshkent) -> [oy boshi, keyingi oy boshi) unix vaqtida."""
+    y, m = map(int, month.split("-"))
+    start = calendar.timegm((y, m, 1, 0, 0, 0)) - TASHKENT_UTC_OFFSET
+    end = calendar.timegm((y + m // 12, m % 12 + 1, 1, 0, 0, 0)) - TASHKENT_UTC_OFFSET
+    return start, end
+
+def archive_path(archive_dir: str, month: str) -> str:
+    return os.path.join(archive_dir, f"orders-{month}.db")
+
+def archived_at(archive_dir: Optional[str]) -> Optional[float]:
+    """Oxirgi marta qatorlar arxivga ko'chirilgan vaqt yoki None."""
+    try:
+        return os.path.getmtime(os.path.join(archive_dir, ARCHIVE_MARK)) if archive_dir else None
+    except OSError:
+        return None
+
+def _mark_archived(archive_dir: str, before_ts: int):
+    path = os.path.join(archive_dir, ARCHIVE_MARK)
+    with open(path + ".tmp", "w") as f:
+        f.write(f"{before_ts}\n")
+    os.replace(path + ".tmp", path)
+
+def archive_paths(archive_dir: Optional[str], since_ts: int, until_ts: int) -> List[str]:
+    """[since_ts, until_ts) oralig'iga tushadigan mavjud arxiv fayllari, xronologik tartibda."""
+    if not archive_dir or until_ts <= since_ts:
+        return []
+    out, month = [], month_of(since_ts)
+    last = month_of(until_ts - 1)
+    while month <= last:
+        path = archive_path(archive_dir, month)
+        if os.path.exists(path):
+            out.append(path)
+        month = month_of(month_bounds(month)[1])
+    return out
+
+
+# ================= ARCHIVE =================
+def _ensure_archive(conn: sqlite3.Connection, cols: List[Tuple[str, str]]):
+    sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type='table' AND name='orders'").fetchone()[0]
+    conn.execute(_CREATE_RE.sub("CREATE TABLE IF NOT EXISTS arc.orders", sql, count=1))
+    # Arxiv oylari turli sxema versiyalarida yaratilgan bo'lishi mumkin — yetishmagan ustunlar qo'shiladi
+    have = {r[1] for r in conn.execute("PRAGMA arc.table_info(orders)")}
+    for name, type_ in cols:
+        if name not in have:
+            conn.execute(f"ALTER TABLE arc.orders ADD COLUMN {name} {type_}")
+    conn.execute("CREATE INDEX IF NOT EXISTS arc.idx_orders_created ON orders(created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS arc.idx_orders_user ON orders(tg_user_id, created_at)")
+    conn.commit()
+
+def archive_orders(db_path: str, archive_dir: str, before_ts: int, batch: int = ARCHIVE_BATCH) -> int:
+    """created_at < before_ts buyurtmalarni oylik arxivlarga ko'chiradi; ko'chirilganlar soni.
+
+    Har partiya ikki qadam: avval arxivga INSERT OR IGNORE (commit, FULL fsync), keyin
+    jonli bazadan DELETE. Orada uzilsa qatorlar ikkala joyda qoladi va keyingi ishga
+    tushishda takrorlanmasdan tugallanadi. Partiyalar qisqa — write-behind kutib qolmaydi."""
+    os.makedirs(archive_dir, exist_ok=True)
+    moved = 0
+    try:
+        with closing(sqlite3.connect(db_path, check_same_thread=False)) as conn:
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("PRAGMA main.synchronous=NORMAL")   # jonli baza ilova bilan bir xil; arxiv — FULL
+            cols = [(r[1], r[2] or "") for r in conn.execute("PRAGMA main.table_info(orders)")]
+            names = ", ".join(c for c, _ in cols)
+            months = [r[0] for r in conn.execute(SQL_MONTHS, (TASHKENT_UTC_OFFSET, before_ts))]
+            for month in months:
+                start, end = month_bounds(month)
+                conn.execute("ATTACH DATABASE ? AS arc", (archive_path(archive_dir, month),))
+                try:
+                    _ensure_archive(conn, cols)
+                    while True:
+                        ids = [r[0] for r in conn.execute(SQL_BATCH_IDS, (start, min(end, before_ts), batch))]
+                        if not ids:
+                            break
+                        marks = ",".join("?" * len(ids))
+                        with conn:
+                            conn.execute(f"INSERT OR IGNORE INTO arc.orders({names}) "
+                                         f"SELECT {names} FROM main.orders WHERE id IN ({marks})", ids)
+                        with conn:
+                            conn.execute(f"DELETE FROM main.operator_outbox WHERE order_id IN ({marks})", ids)
+                            conn.execute(f"DELETE FROM main.orders WHERE id IN ({marks})", ids)
+                        moved += len(ids)
+                        ORDERS_ARCHIVED.inc(n=len(ids))
+                finally:
+                    conn.execute("DETACH DATABASE arc")
+                log.info("[ARCHIVE] %s: done, %d moved so far", month, moved)
+    finally:
+        if moved:   # hisobot manbai shu vaqtdan eski snapshot'ni ishlatmaydi
+            _mark_archived(archive_dir, before_ts)
+    return moved
+
+
+# ================= SNAPSHOT =================
+def snapshot(db_path: str, out_path: str) -> int:
+    """SQLite backup API bilan onlayn nusxa; tayyor bo'lgach atomar almashtiriladi. Hajm qaytadi.
+
+    pages=-1: bitta o'qish tranzaksiyasida — WAL'da yozuvchilarni to'smaydi, bosqichma-bosqich
+    nusxadagi kabi har yozuvda qaytadan boshlanmaydi."""
+    tmp = out_path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    with closing(sqlite3.connect(db_path, check_same_thread=False)) as src, \
+            closing(sqlite3.connect(tmp, check_same_thread=False)) as dst:
+        src.execute("PRAGMA busy_timeout=5000")
+        src.backup(dst, pages=-1)
+        dst.execute("PRAGMA journal_mode=DELETE")   # faqat o'qiladi: -wal/-shm fayllari kerak emas
+    os.replace(tmp, out_path)
+    return os.path.getsize(out_path)
+
+def read_source(db_path: str, snapshot_path: Optional[str], archive_dir: Optional[str] = None,
+                snapshot_every: float = SNAPSHOT_EVERY) -> str:
+    """Hisobot/eksport uchun baza: yangi snapshot bo'lsa — u, aks holda jonli baza.
+
+    Snapshot eskirgan hisoblanadi: 2 * snapshot_every dan eski bo'lsa (masalan, snapshot
+    xato berib turibdi yoki restartdan oldingi fayl) yoki oxirgi arxivlashdan oldin olingan
+    bo'lsa — unda arxivga ko'chgan qatorlar hali bor."""
+    if not snapshot_path or snapshot_every <= 0:
+        return db_path
+    try:
+        taken = os.path.getmtime(snapshot_path)
+    except OSError:
+        return db_path
+    if time.time() - taken > 2 * snapshot_every:
+        return db_path
+    moved = archived_at(archive_dir)
+    if moved is not None and taken < moved:
+        return db_path
+    return snapshot_path
+
+def read_with(path: str, fn: Callable[..., Any], *args) -> Any:
+    """fn(conn, *args) ni alohida faqat-o'qish ulanishida (pul va write yo'lidan tashqarida)."""
+    with closing(export.open_readonly(path)) as conn:
+        return fn(conn, *args)
+
+
+class Maintenance:
+    """Fon vazifasi (faqat leader): vaqti-vaqti bilan arxivlash va snapshot.
+    Og'ir ishlar default executor'da o'z ulanishlari bilan — db pul'i band bo'lmaydi.
+    Arxivlashdan keyin snapshot darhol yangilanadi; u tayyor bo'lguncha (yoki xato bersa)
+    read_source jonli bazani qaytaradi, eksport esa arxivdagi id'larni asosiy manbadan
+    chiqarib tashlaydi — qatorlar ikki marta sanalmaydi."""
+
+    def __init__(self, db_path: str, archive_dir: str, snapshot_path: str,
+                 after_days: int = ARCHIVE_AFTER_DAYS, archive_every: float = ARCHIVE_EVERY,
+                 snapshot_every: float = SNAPSHOT_EVERY):
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.snapshot_path = snapshot_path
+        self.after_days = after_days
+        self.archive_every = max(60.0, archive_every)
+        self.snapshot_every = snapshot_every
+        self.snapshot_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if (self.after_days > 0 or self.snapshot_every > 0) and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._loop(), name="maintenance")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(MAINTENANCE_DELAY)
+        next_archive = next_snapshot = loop.time()
+        while True:
+            now = loop.time()
+            moved = 0
+            if self.after_days > 0 and now >= next_archive:
+                next_archive = now + self.archive_every
+                try:
+                    moved = await self.archive()
+                except Exception as e:
+                    log.exception("[ARCHIVE] failed: %s", e)
+            if self.snapshot_every > 0 and (now >= next_snapshot or moved):
+                next_snapshot = now + self.snapshot_every
+                try:
+                    await self.snapshot()
+                except Exception as e:
+                    log.exception("[SNAPSHOT] failed: %s", e)
+            wake = min(t for t, on in ((next_archive, self.after_days > 0),
+                                       (next_snapshot, self.snapshot_every > 0)) if on)
+            await asyncio.sleep(max(1.0, wake - loop.time()))
+
+    async def archive(self) -> int:
+        before = int(time.time()) - self.after_days * 86400
+        t0 = time.perf_counter()
+        moved = await asyncio.get_running_loop().run_in_executor(
+            None, archive_orders, self.db_path, self.archive_dir, before)
+        if moved:
+            log.info("[ARCHIVE] %d orders moved in %.1fs", moved, time.perf_counter() - t0)
+        return moved
+
+    async def snapshot(self) -> int:
+        t0 = time.perf_counter()
+        size = await asyncio.get_running_loop().run_in_executor(None, snapshot, self.db_path, self.snapshot_path)
+        self.snapshot_at = time.time()
+        log.info("[SNAPSHOT] %.1f MiB in %.2fs", size / 1048576, time.perf_counter() - t0)
+        return size
+
+
+def main_():
+    ap = argparse.ArgumentParser(description="Archive old orders into monthly DBs and/or snapshot the live DB")
+    ap.add_argument("db", help="orders.db yo'li")
+    ap.add_argument("--archive-dir", default="archive")
+    ap.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="shundan eski buyurtmalar; 0 — arxivlamaslik")
+    ap.add_argument("--snapshot", default=None, help="snapshot fayli (ixtiyoriy)")
+    args = ap.parse_args()
+    if args.days > 0:
+        t0 = time.perf_counter()
+        n = archive_orders(args.db, args.archive_dir, int(time.time()) - args.days * 86400)
+        print(f"archived {n} orders into {args.archive_dir}/ in {time.perf_counter() - t0:.2f}s")
+    if args.snapshot:
+        t0 = time.perf_counter()
+        size = snapshot(args.db, args.snapshot)
+        print(f"{args.snapshot}: {size / 1048576:.1f} MiB in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main_()
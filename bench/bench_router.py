@@ -0,0 +1,70 @@
+# bench/bench_router.py — bitta update'ni yo'naltirish narxi: FAST_PATH=1 va FAST_PATH=0
+#   python bench/bench_router.py [N]
+import os
+import sys
+import json
+import time
+import asyncio
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    # (nom, holat, matn) — sahifa ko'rsatkichi handler'i bo'sh, ya'ni faqat dispatch narxi
+    ("page indicator (dispatch only)", "OrderForm:from_district", "2/8"),
+    ("NEXT in to_district",            "OrderForm:to_district",   "➡️ Кейинги"),
+    ("district pick",                  "OrderForm:from_district", "Химик"),
+    ("any-state button",               None,                      "📞 Mening raqamim"),
+    ("typed text (falls through)",     "OrderForm:from_district", "chilonzor"),
+]
+
+
+async def _measure(n: int) -> dict:
+    from fakes import prepare_env, FakeSession, message_update
+    prepare_env(FSM_STORAGE="memory")
+    import main
+    from aiogram.fsm.storage.base import StorageKey
+    main.bot.session = FakeSession()
+    uid = 1000
+    key = StorageKey(bot_id=main.bot.id, chat_id=uid, user_id=uid)
+    base = {"route_from": "Қўқон", "route_to": "Тошкент", "from_page": 1, "to_page": 1, "phone": "+998900000000"}
+    logging_off()
+    out = {}
+    for name, st, text in CASES:
+        upd = [message_update(uid, text) for _ in range(n + n // 10)]
+        for u in upd[n:]:   # isitish
+            await main.dp.storage.set_state(key, st)
+            await main.dp.feed_update(main.bot, u)
+        upd = upd[:n]
+        t0 = time.perf_counter()
+        for u in upd:
+            await main.dp.storage.set_state(key, st)
+            await main.dp.storage.set_data(key, base)
+            await main.dp.feed_update(main.bot, u)
+        out[name] = (time.perf_counter() - t0) / n * 1e6
+    await main.wb.stop()
+    return out
+
+
+def logging_off():
+    import logging
+    logging.disable(logging.CRITICAL)
+
+
+def main_(n: int):
+    if os.getenv("_BENCH_CHILD"):
+        print(json.dumps(asyncio.run(_measure(n))))
+        return
+    res = {}
+    for mode in ("0", "1"):
+        env = dict(os.environ, FAST_PATH=mode, _BENCH_CHILD="1")
+        out = subprocess.run([sys.executable, __file__, str(n)], env=env, capture_output=True, text=True, check=True)
+        res[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+    print(f"{'case':34} {'filters':>10} {'fast':>10} {'speedup':>8}   (µs/update, N={n})")
+    for name, _, _ in CASES:
+        a, b = res["0"][name], res["1"][name]
+        print(f"{name:34} {a:10.1f} {b:10.1f} {a / b:7.2f}x")
+
+
+if __name__ == "__main__":
+    main_(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,82 @@
+# bench/fakes.py — tarmoqsiz Bot sessiyasi va sintetik Update'lar (benchmark'lar uchun)
+import os
+import sys
+import time
+import tempfile
+import itertools
+from typing import Any, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare_env(tmpdir: Optional[str] = None, **overrides: str) -> str:
+    """main.py import qilinishidan OLDIN chaqiriladi: vaqtinchalik baza, soxta token."""
+    tmpdir = tmpdir or tempfile.mkdtemp(prefix="davon-bench-")
+    os.environ["DB_PATH"] = os.path.join(tmpdir, "orders.db")
+    os.environ["FSM_DB_PATH"] = os.path.join(tmpdir, "fsm.db")
+    os.environ["BOT_TOKEN"] = "123456:BENCHMARK-TOKEN"
+    os.environ["AUTO_ANNOUNCE"] = "0"
+    os.environ.setdefault("ADMIN_CHAT_ID", "-1001")
+    os.environ.setdefault("ADMIN_USER_ID", "1")
+    os.environ.setdefault("THROTTLE", "0")   # skriptlangan foydalanuvchilar odamdan tezroq bosadi
+    os.environ.update(overrides)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return tmpdir
+
+
+from aiogram.client.session.base import BaseSession   # noqa: E402
+from aiogram.types import Update, Message, Chat, User, CallbackQuery, Contact   # noqa: E402
+
+BOT_USER = User(id=123456, is_bot=True, first_name="bench-bot")
+
+
+class FakeSession(BaseSession):
+    """Har bir so'rovni xotirada "bajaradi": send* -> Message, qolganlari -> True."""
+
+    def __init__(self, latency: float = 0.0, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.calls: List[Any] = []
+        self._ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append(method)
+        if self.latency:
+            import asyncio
+            await asyncio.sleep(self.latency)
+        name = type(method).__name__
+        if name == "GetMe":
+            return BOT_USER
+        if name.startswith("Send"):
+            return Message(
+                message_id=next(self._ids), date=int(time.time()),
+                chat=Chat(id=int(method.chat_id), type="private"),
+                from_user=BOT_USER, text=getattr(method, "text", None),
+            )
+        return True
+
+    async def stream_content(self, *args: Any, **kwargs: Any):
+        if False:
+            yield b""
+
+    async def close(self):
+        pass
+
+
+_ids = itertools.count(1)
+
+def _user(uid: int) -> User:
+    return User(id=uid, is_bot=False, first_name=f"U{uid}", username=f"u{uid}")
+
+def message_update(uid: int, text: Optional[str] = None, phone: Optional[str] = None) -> Update:
+    contact = Contact(phone_number=phone, first_name="x", user_id=uid) if phone else None
+    m = Message(message_id=next(_ids), date=int(time.time()), chat=Chat(id=uid, type="private"),
+                from_user=_user(uid), text=text, contact=contact)
+    return Update(update_id=next(_ids), message=m)
+
+def callback_update(uid: int, data: str, message_id: int = 1) -> Update:
+    bm = Message(message_id=message_id, date=int(time.time()), chat=Chat(id=uid, type="private"),
+                 from_user=BOT_USER, text="…")
+    cq = CallbackQuery(id=str(next(_ids)), from_user=_user(uid), chat_instance="bench", message=bm, data=data)
+    return Update(update_id=next(_ids), callback_query=cq)
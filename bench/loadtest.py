@@ -0,0 +1,133 @@
+# bench/loadtest.py — to'liq buyurtma suhbatini N ta parallel foydalanuvchi bilan yurgizadi
+#   python bench/loadtest.py --users 200 --orders 3 --api-latency 20
+# Tarmoq yo'q: Bot sessiyasi soxta, baza vaqtinchalik papkada.
+import os
+import sys
+import time
+import asyncio
+import argparse
+import resource
+import statistics
+import tracemalloc
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fakes import prepare_env, FakeSession, message_update, callback_update   # noqa: E402
+
+FIRST_UID = 10_000
+
+
+def _script(main, uid: int, i: int, inline: bool) -> List:
+    """Bitta buyurtma: /start → BOSHLASH → telefon → yo'nalish → sahifalar → hududlar → odam."""
+    forward = i % 2 == 0
+    steps = [
+        message_update(uid, "/start"),
+        callback_update(uid, "go_start"),
+    ]
+    if i == 0:
+        steps.append(message_update(uid, phone=f"99890{uid % 10_000_000:07d}"))
+    else:
+        steps.append(message_update(uid, "📞 Mening raqamim"))
+    src, dst = ("Қўқон", "Тошкент") if forward else ("Тошкент", "Қўқон")
+    pick_from, pick_to = ("Химик", "Чилонзор") if forward else ("Чилонзор", "Химик")
+    steps.append(message_update(uid, f"{src} ➡️ {dst}"))
+    if inline:
+        cf, ct = main.districts.city(src), main.districts.city(dst)
+        return steps + [
+            callback_update(uid, f"dp:f:{cf.index}:2"),
+            callback_update(uid, f"dp:f:{cf.index}:1"),
+            callback_update(uid, f"dk:f:{cf.index}:{cf.positions[pick_from]}"),
+            callback_update(uid, f"dp:t:{ct.index}:2"),
+            callback_update(uid, f"dk:t:{ct.index}:{ct.positions[pick_to]}"),
+            message_update(uid, str(1 + (uid + i) % 4)),   # bir xil buyurtma takror deb tashlanadi
+        ]
+    steps += [
+        message_update(uid, "➡️ Кейинги"),
+        message_update(uid, "⬅️ Олдинги"),
+        message_update(uid, pick_from),
+        message_update(uid, "➡️ Кейинги"),
+        message_update(uid, pick_to),
+        message_update(uid, str(1 + (uid + i) % 4)),
+    ]
+    return steps
+
+
+async def _user(main, uid: int, orders: int, lat: List[float], think: float, inline: bool):
+    for i in range(orders):
+        for upd in _script(main, uid, i, inline):
+            t0 = time.perf_counter()
+            await main.dp.feed_update(main.bot, upd)
+            lat.append(time.perf_counter() - t0)
+            if think:
+                await asyncio.sleep(think)
+
+
+def _pct(xs: List[float], p: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+async def run(args) -> Dict[str, float]:
+    tmp = prepare_env(args.tmpdir, FSM_STORAGE=args.storage, DISTRICT_UI=args.ui)
+    import logging
+    logging.disable(logging.CRITICAL)
+    if args.tracemalloc:
+        tracemalloc.start()
+    import main
+    session = FakeSession(latency=args.api_latency / 1000)
+    main.bot.session = session
+
+    lat: List[float] = []
+    uids = range(FIRST_UID, FIRST_UID + args.users)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_user(main, u, args.orders, lat, args.think / 1000, args.ui == "inline")
+                           for u in uids))
+    wall = time.perf_counter() - t0
+    await main.wb.stop()
+
+    orders = await main.db.run(lambda c: c.execute("SELECT COUNT(*) FROM orders").fetchone()[0])
+    res = {
+        "users": args.users,
+        "updates": len(lat),
+        "wall_s": wall,
+        "updates_per_s": len(lat) / wall if wall else 0.0,
+        "p50_ms": _pct(lat, 50) * 1000,
+        "p90_ms": _pct(lat, 90) * 1000,
+        "p99_ms": _pct(lat, 99) * 1000,
+        "max_ms": max(lat) * 1000 if lat else 0.0,
+        "mean_ms": statistics.fmean(lat) * 1000 if lat else 0.0,
+        "api_calls": len(session.calls),
+        "api_calls_per_order": len(session.calls) / max(1, args.users * args.orders),
+        "orders_saved": orders,
+        "db_transactions": main.wb.flushes,
+        "db_rows_written": main.wb.rows_written,
+        "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if args.tracemalloc:
+        res["py_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+    main.db.close()
+    res["tmpdir"] = tmp
+    return res
+
+
+def main_():
+    ap = argparse.ArgumentParser(description="Offline load test for the order conversation")
+    ap.add_argument("--users", type=int, default=100, help="parallel foydalanuvchilar")
+    ap.add_argument("--orders", type=int, default=2, help="har foydalanuvchi uchun buyurtmalar")
+    ap.add_argument("--api-latency", type=float, default=0.0, help="soxta Telegram API kechikishi, ms")
+    ap.add_argument("--think", type=float, default=0.0, help="qadamlar orasidagi pauza, ms")
+    ap.add_argument("--storage", default="sqlite", choices=["sqlite", "memory"], help="FSM storage")
+    ap.add_argument("--ui", default="reply", choices=["inline", "reply"], help="hudud tanlovi (DISTRICT_UI)")
+    ap.add_argument("--tmpdir", default=None)
+    ap.add_argument("--tracemalloc", action="store_true", help="Python heap cho'qqisini o'lchash (sekinroq)")
+    args = ap.parse_args()
+    res = asyncio.run(run(args))
+    width = max(map(len, res))
+    for k, v in res.items():
+        print(f"{k:<{width}}  {v:.2f}" if isinstance(v, float) else f"{k:<{width}}  {v}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,277 @@
+# broadcast.py — tezlik cheklangan, qayta tiklanadigan ommaviy yuborish
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError,
+)
+
+from db import Database
+from transport import prioritized, BULK
+
+log = logging.getLogger("davon-taksi-bot.broadcast")
+
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_RATE        = float(os.getenv("BROADCAST_RATE", "25"))   # msg/s; Telegram umumiy limiti ~30/s
+BROADCAST_CHUNK       = int(os.getenv("BROADCAST_CHUNK", "100"))   # progress shuncha qatordan keyin yoziladi
+BROADCAST_RETRIES     = 5
+STATUS_EVERY          = 3.0    # status xabarini tahrirlash oralig'i (chat bo'yicha limit uchun)
+
+SQL_CREATE = """
+    INSERT INTO broadcasts(text, status, cursor, total, sent, failed, blocked,
+                           status_chat_id, status_message_id, created_at, updated_at)
+    VALUES (?, 'running', 0, (SELECT COUNT(*) FROM users WHERE blocked_at IS NULL),
+            0, 0, 0, ?, NULL, ?, ?)
+"""
+SQL_GET = """
+    SELECT id, text, cursor, total, sent, failed, blocked, status_chat_id, status_message_id, created_at
+    FROM broadcasts WHERE id=?
+"""
+SQL_RUNNING    = "SELECT id FROM broadcasts WHERE status='running' ORDER BY id"
+SQL_SAME_TEXT  = """
+    SELECT id FROM broadcasts
+    WHERE text=? AND (status='running' OR created_at >= ?)
+    ORDER BY id DESC LIMIT 1
+"""
+SQL_NEXT_CHUNK = """
+    SELECT tg_user_id FROM users
+    WHERE tg_user_id > ? AND blocked_at IS NULL
+    ORDER BY tg_user_id LIMIT ?
+"""
+SQL_PROGRESS = """
+    UPDATE broadcasts SET cursor=?, sent=sent+?, failed=failed+?, blocked=blocked+?, updated_at=?
+    WHERE id=?
+"""
+SQL_BLOCK      = "UPDATE users SET blocked_at=? WHERE tg_user_id=?"
+SQL_STATUS_MSG = "UPDATE broadcasts SET status_message_id=? WHERE id=?"
+SQL_FINISH     = "UPDATE broadcasts SET status=?, updated_at=? WHERE id=?"
+
+SENT, FAILED, BLOCKED = "sent", "failed", "blocked"
+
+
+class RateLimiter:
+    """Token bucket: sekundiga `rate` ta, `burst` gacha yig'iladi.
+    RetryAfter kelganda `pause()` hamma yuboruvchilarni to'xtatib turadi."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = max(0.1, rate)
+        self.burst = burst if burst is not None else max(1.0, self.rate)
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._resume_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._resume_at:
+                    await asyncio.sleep(self._resume_at - now); continue
+                self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Broadcaster:
+    def __init__(self, bot: Bot, db: Database,
+                 concurrency: int = BROADCAST_CONCURRENCY, rate: float = BROADCAST_RATE,
+                 chunk: int = BROADCAST_CHUNK):
+        self.bot = bot
+        self.db = db
+        self.concurrency = max(1, concurrency)
+        self.chunk = max(1, chunk)
+        self.limiter = RateLimiter(rate)
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    # ---------- public API ----------
+    async def start(self, text: str, status_chat_id: Optional[int] = None) -> int:
+        bid = await self.db.run(_create, text, status_chat_id, int(time.time()))
+        self._spawn(bid)
+        return bid
+
+    async def start_once(self, text: str, status_chat_id: Optional[int] = None,
+                         within: float = 86400) -> Optional[int]:
+        """start(), lekin shu matnli broadcast ishlayotgan yoki `within` s ichida boshlangan
+        bo'lsa — yangisi yaratilmaydi (restart/crash-loop'da e'lon takrorlanmasin). None qaytadi."""
+        bid = await self.db.run(_create_once, text, status_chat_id, int(time.time()), int(within))
+        if bid is not None:
+            self._spawn(bid)
+        return bid
+
+    async def resume(self) -> List[int]:
+        """Restartdan oldin tugamay qolgan broadcast'larni cursor'dan davom ettiradi."""
+        ids = await self.db.run(_running_ids)
+        for bid in ids:
+            self._spawn(bid)
+        if ids:
+            log.info("[BROADCAST] resumed: %s", ids)
+        return ids
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, bid: int):
+        if bid in self._tasks and not self._tasks[bid].done():
+            return
+        t = asyncio.get_running_loop().create_task(self._run(bid), name=f"broadcast-{bid}")
+        self._tasks[bid] = t
+        t.add_done_callback(lambda _t, b=bid: self._tasks.pop(b, None))
+
+    # ---------- engine ----------
+    @prioritized(BULK)
+    async def _run(self, bid: int):
+        job = await self.db.run(_get, bid)
+        if not job:
+            return
+        _, text, cursor, total, sent, failed, blocked, chat_id, msg_id, _ = job
+        counts = {SENT: sent, FAILED: failed, BLOCKED: blocked}
+        started, base = time.monotonic(), sent + failed + blocked
+        sem = asyncio.Semaphore(self.concurrency)
+        last_status = 0.0
+
+        async def one(uid: int, results: Dict[int, str]):
+            async with sem:
+                results[uid] = await self._send(uid, text)
+
+        try:
+            while True:
+                uids = await self.db.run(_next_chunk, cursor, self.chunk)
+                if not uids:
+                    break
+                results: Dict[int, str] = {}
+                try:
+                    await asyncio.gather(*(one(u, results) for u in uids))
+                finally:
+                    # Bekor qilinsa ham uzluksiz bajarilgan qism yoziladi — resume qayta yubormaydi
+                    done = _done_prefix(uids, results)
+                    if done:
+                        cursor = done[-1]
+                        delta = {k: 0 for k in counts}
+                        for u in done:
+                            delta[results[u]] += 1
+                        for k in counts:
+                            counts[k] += delta[k]
+                        await asyncio.shield(self.db.run(
+                            _save_progress, bid, cursor, delta,
+                            [u for u in done if results[u] == BLOCKED], int(time.time())
+                        ))
+                if chat_id and time.monotonic() - last_status >= STATUS_EVERY:
+                    msg_id = await self._status(bid, chat_id, msg_id, counts, total, base, started, False)
+                    last_status = time.monotonic()
+            await self.db.run(_finish, bid, "done", int(time.time()))
+            if chat_id:
+                await self._status(bid, chat_id, msg_id, counts, total, base, started, True)
+        except asyncio.CancelledError:
+            log.info("[BROADCAST] #%s paused at cursor=%s", bid, cursor)
+            raise
+        except Exception as e:
+            log.exception("[BROADCAST] #%s failed: %s", bid, e)
+
+    async def _send(self, uid: int, text: str) -> str:
+        for attempt in range(BROADCAST_RETRIES):
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(uid, text)
+                return SENT
+            except TelegramRetryAfter as e:
+                self.limiter.pause(e.retry_after)
+            except TelegramForbiddenError:
+                return BLOCKED
+            except TelegramBadRequest:
+                return FAILED
+            except TelegramNetworkError:
+                await asyncio.sleep(1 + attempt)
+            except Exception as e:
+                log.warning("[BROADCAST] send to %s failed: %s", uid, e)
+                return FAILED
+        return FAILED
+
+    async def _status(self, bid: int, chat_id: int, msg_id: Optional[int], counts: Dict[str, int],
+                      total: int, base: int, started: float, finished: bool) -> Optional[int]:
+        done = counts[SENT] + counts[FAILED] + counts[BLOCKED]
+        elapsed = max(1e-6, time.monotonic() - started)
+        rate = (done - base) / elapsed
+        left = max(0, total - done)
+        eta = "—" if finished or rate <= 0 else _fmt_secs(left / rate)
+        text = (
+            f"📣 Broadcast #{bid} {'✅ tugadi' if finished else '⏳'}\n"
+            f"Yuborildi: {counts[SENT]}  |  Xato: {counts[FAILED]}  |  Bloklagan: {counts[BLOCKED]}\n"
+            f"{done}/{total}  •  {rate:.1f} msg/s  •  ETA {eta}"
+        )
+        try:
+            if msg_id:
+                await self.bot.edit_message_text(text=text, chat_id=chat_id, message_id=msg_id, parse_mode=None)
+                return msg_id
+            msg = await self.bot.send_message(chat_id, text, parse_mode=None)
+            await self.db.run(_set_status_msg, bid, msg.message_id)
+            return msg.message_id
+        except TelegramBadRequest:
+            return msg_id   # "message is not modified"
+        except Exception as e:
+            log.warning("[BROADCAST] status update failed: %s", e)
+            return msg_id
+
+
+def _done_prefix(uids: List[int], results: Dict[int, str]) -> List[int]:
+    out = []
+    for u in uids:
+        if u not in results:
+            break
+        out.append(u)
+    return out
+
+def _fmt_secs(s: float) -> str:
+    s = int(s)
+    return f"{s // 3600}:{s // 60 % 60:02d}:{s % 60:02d}" if s >= 3600 else f"{s // 60}:{s % 60:02d}"
+
+
+# ================= SYNC BODIES (db executor) =================
+def _create(conn: sqlite3.Connection, text: str, chat_id: Optional[int], ts: int) -> int:
+    with conn:
+        return conn.execute(SQL_CREATE, (text, chat_id, ts, ts)).lastrowid
+
+def _create_once(conn: sqlite3.Connection, text: str, chat_id: Optional[int], ts: int,
+                 within: int) -> Optional[int]:
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")   # tekshiruv va yaratish bitta yozuv tranzaksiyasida
+        if conn.execute(SQL_SAME_TEXT, (text, ts - within)).fetchone():
+            return None
+        return conn.execute(SQL_CREATE, (text, chat_id, ts, ts)).lastrowid
+
+def _get(conn: sqlite3.Connection, bid: int):
+    return conn.execute(SQL_GET, (bid,)).fetchone()
+
+def _running_ids(conn: sqlite3.Connection) -> List[int]:
+    return [r[0] for r in conn.execute(SQL_RUNNING)]
+
+def _next_chunk(conn: sqlite3.Connection, cursor: int, limit: int) -> List[int]:
+    return [r[0] for r in conn.execute(SQL_NEXT_CHUNK, (cursor, limit))]
+
+def _save_progress(conn: sqlite3.Connection, bid: int, cursor: int, delta: Dict[str, int],
+                   blocked: List[int], ts: int):
+    with conn:
+        conn.execute(SQL_PROGRESS, (cursor, delta[SENT], delta[FAILED], delta[BLOCKED], ts, bid))
+        if blocked:
+            conn.executemany(SQL_BLOCK, [(ts, u) for u in blocked])
+
+def _set_status_msg(conn: sqlite3.Connection, bid: int, msg_id: int):
+    with conn:
+        conn.execute(SQL_STATUS_MSG, (msg_id, bid))
+
+def _finish(conn: sqlite3.Connection, bid: int, status: str, ts: int):
+    with conn:
+        conn.execute(SQL_FINISH, (status, ts, bid))
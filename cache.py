@@ -0,0 +1,88 @@
+# cache.py — foydalanuvchi profillari uchun LRU + TTL kesh (write-through)
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+# uvicorn --workers ham shu o'zgaruvchidan o'qiydi. Bir nechta worker bo'lsa boshqa worker
+# yozgan o'zgarish bu keshga yetib kelmaydi — TTL bir necha sekundgacha qisqaradi.
+WEB_CONCURRENCY    = int(os.getenv("WEB_CONCURRENCY", "1"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "20000"))
+PROFILE_CACHE_TTL  = int(os.getenv("PROFILE_CACHE_TTL", "900" if WEB_CONCURRENCY <= 1 else "5"))   # sekund
+# Bo'sh natija (telefon/buyurtma hali yo'q) qisqa yashaydi: boshqa worker'da yozilgan
+# birinchi telefon yoki buyurtma shundan keyin ko'rinadi. O'z worker'idagi yozuv darhol almashtiradi.
+PROFILE_CACHE_NEG_TTL = int(os.getenv("PROFILE_CACHE_NEG_TTL", "30"))
+
+_MISS = (False, None)
+
+
+class _Empty:
+    """Keshlangan bo'sh natija va uning (qisqa) muddati."""
+    __slots__ = ("value", "expires")
+
+    def __init__(self, value: Any, expires: float):
+        self.value, self.expires = value, expires
+
+
+class ProfileCache:
+    """tg_user_id -> {"phone": ..., "last_order": ..., "recent": ...}.
+
+    Har bir maydon alohida yuklanadi: kalit yo'q bo'lsa — hali o'qilmagan.
+    None / bo'sh natijalar ham keshlanadi (yangi foydalanuvchi har sahifada bazaga
+    bormasin), lekin `neg_ttl` gacha: birinchi telefon yoki buyurtma boshqa worker'da
+    yozilgan bo'lishi mumkin."""
+
+    def __init__(self, maxsize: int = PROFILE_CACHE_SIZE, ttl: float = PROFILE_CACHE_TTL,
+                 neg_ttl: float = PROFILE_CACHE_NEG_TTL):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.neg_ttl = min(ttl, neg_ttl)
+        self._data: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, uid: int, field: str) -> Tuple[bool, Any]:
+        item = self._data.get(uid)
+        now = time.monotonic()
+        if item is None or item[0] < now or field not in item[1]:
+            if item is not None and item[0] < now:
+                del self._data[uid]
+            self.misses += 1
+            return _MISS
+        value = item[1][field]
+        if isinstance(value, _Empty):
+            if value.expires < now:
+                del item[1][field]
+                self.misses += 1
+                return _MISS
+            value = value.value
+        self._data.move_to_end(uid)
+        self.hits += 1
+        return True, value
+
+    def set(self, uid: int, field: str, value: Any):
+        item = self._data.get(uid)
+        now = time.monotonic()
+        if value is None or value == [] or value == {}:
+            value = _Empty(value, now + self.neg_ttl)
+        if item is None or item[0] < now:
+            self._data[uid] = (now + self.ttl, {field: value})
+        else:
+            item[1][field] = value
+            self._data[uid] = (now + self.ttl, item[1])
+        self._data.move_to_end(uid)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, uid: int):
+        self._data.pop(uid, None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data), "hits": self.hits, "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,245 @@
+# catalog.py — shahar/hudud/yo'nalish katalogi: JSON fayldan quriladi, klaviaturalar oldindan tayyor
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+
+from search import DistrictSearch
+
+LAST_PREFIX = "⭐ Oxirgi: "
+ROUTE_SEP = " ➡️ "
+
+# Inline rejim callback_data: nomlar o'rniga indekslar (64 bayt limiti, kirill 2 bayt)
+CB_PAGE = "dp"   # dp:<tag>:<shahar>:<sahifa>
+CB_PICK = "dk"   # dk:<tag>:<shahar>:<hudud>:<katalog versiyasi>
+CB_BACK = "db"   # db:<tag>
+CB_NOOP = "dn"
+
+
+def chunk(lst: Sequence[str], n: int) -> List[List[str]]:
+    return [list(lst[i:i+n]) for i in range(0, len(lst), n)]
+
+
+def parse_callback(data: str) -> Optional[Tuple[str, str, int, int, str]]:
+    """"dk:f:0:2:ab12cd" -> ("dk", "f", 0, 2, "ab12cd"); "db:f" -> ("db", "f", -1, -1, "");
+    noto'g'ri bo'lsa None. Versiyasiz eski tugmalarda versiya "" bo'ladi."""
+    parts = (data or "").split(":")
+    if parts[0] == CB_BACK and len(parts) == 2:
+        return CB_BACK, parts[1], -1, -1, ""
+    if parts[0] in (CB_PAGE, CB_PICK) and len(parts) in (4, 5) and parts[2].isdigit() and parts[3].isdigit():
+        return parts[0], parts[1], int(parts[2]), int(parts[3]), (parts[4] if len(parts) == 5 else "")
+    return None
+
+def route_label(src: str, dst: str) -> str:
+    return f"{src}{ROUTE_SEP}{dst}"
+
+
+class CityDistricts:
+    __slots__ = ("name", "index", "items", "members", "positions", "pages", "search")
+
+    def __init__(self, name: str, items: Sequence[str], per_page: int, cols: int,
+                 back: str, next_: str, prev: str, index: int = 0):
+        self.name = name
+        self.index = index
+        self.items: Tuple[str, ...] = tuple(items)
+        self.members = frozenset(self.items)
+        self.positions = {x: i for i, x in enumerate(self.items)}
+        self.search = DistrictSearch(self.items)
+        pages = chunk(self.items, per_page) or [[]]
+        total = len(pages)
+        built = []
+        for i, items_ in enumerate(pages, start=1):
+            rows = [[KeyboardButton(text=x) for x in r] for r in chunk(items_, cols)]
+            nav = []
+            if i > 1: nav.append(KeyboardButton(text=prev))
+            nav.append(KeyboardButton(text=f"{i}/{total}"))
+            if i < total: nav.append(KeyboardButton(text=next_))
+            rows.append(nav)
+            rows.append([KeyboardButton(text=back)])
+            built.append(ReplyKeyboardMarkup(keyboard=rows, resize_keyboard=True))
+        self.pages: Tuple[ReplyKeyboardMarkup, ...] = tuple(built)
+
+
+class DistrictCatalog:
+    """Shahar -> hududlar va yo'nalishlar. A'zolik frozenset orqali, har sahifa klaviaturasi
+    oldindan quriladi; faqat "⭐ Oxirgi" qatori so'rov vaqtida qo'shiladi.
+
+    Obyekt qurilgandan keyin o'zgarmaydi: qayta yuklashda yangisi quriladi va bitta
+    o'zlashtirish bilan almashtiriladi. `version` inline tanlov tugmalariga yoziladi —
+    katalog almashgach eski indeksli tugma boshqa hududni tanlab yubormaydi."""
+
+    def __init__(self, cities: Dict[str, Sequence[str]], default_city: str,
+                 back: str, next_: str, prev: str, per_page: int = 8, cols: int = 2,
+                 list_: str = "📋 Рўйхат", routes: Sequence[Tuple[str, str]] = (), version: str = ""):
+        self.per_page = per_page
+        self.cols = cols
+        self.back, self.next_, self.prev, self.list_ = back, next_, prev, list_
+        self.version = version
+        self._cities = {
+            name: CityDistricts(name, items, per_page, cols, back, next_, prev, index=i)
+            for i, (name, items) in enumerate(cities.items())
+        }
+        self._by_index = tuple(self._cities.values())
+        self._default = self._cities[default_city]
+        self._inline: Dict[Tuple[str, str, int], InlineKeyboardMarkup] = {}
+        self.routes: Tuple[Tuple[str, str], ...] = tuple((src, dst) for src, dst in routes)
+        self._by_label = {route_label(src, dst): (src, dst) for src, dst in self.routes}
+        self._routes_kb: Dict[bool, ReplyKeyboardMarkup] = {}
+
+    def city(self, name: Optional[str]) -> CityDistricts:
+        return self._cities.get(name, self._default)
+
+    def has_city(self, name: Optional[str]) -> bool:
+        return name in self._cities
+
+    def cities(self) -> Tuple[str, ...]:
+        return tuple(self._cities)
+
+    def city_at(self, index: int) -> Optional[CityDistricts]:
+        return self._by_index[index] if 0 <= index < len(self._by_index) else None
+
+    def districts(self, city: Optional[str]) -> Tuple[str, ...]:
+        return self.city(city).items
+
+    def contains(self, city: Optional[str], name: Optional[str]) -> bool:
+        return name in self.city(city).members
+
+    def page_count(self, city: Optional[str]) -> int:
+        return len(self.city(city).pages)
+
+    def clamp_page(self, city: Optional[str], page: int) -> int:
+        return max(1, min(page, self.page_count(city)))
+
+    def all_names(self) -> Tuple[str, ...]:
+        seen = {}
+        for c in self._cities.values():
+            for x in c.items:
+                seen.setdefault(x, None)
+        return tuple(seen)
+
+    def page_labels(self) -> Tuple[str, ...]:
+        labels = {}
+        for c in self._cities.values():
+            total = len(c.pages)
+            for i in range(1, total + 1):
+                labels.setdefault(f"{i}/{total}", None)
+        return tuple(labels)
+
+    # ---------- yo'nalishlar ----------
+    def route_labels(self) -> Tuple[str, ...]:
+        return tuple(self._by_label)
+
+    def route(self, label: Optional[str]) -> Optional[Tuple[str, str]]:
+        return self._by_label.get(label)
+
+    def route_at(self, code: str) -> Optional[Tuple[str, str]]:
+        """/trip uchun: "1" — birinchi yo'nalish va h.k."""
+        return self.routes[int(code) - 1] if code.isdigit() and 0 < int(code) <= len(self.routes) else None
+
+    def routes_keyboard(self, one_time: bool = False) -> ReplyKeyboardMarkup:
+        kb = self._routes_kb.get(one_time)
+        if kb is None:
+            rows = [[KeyboardButton(text=x)] for x in self._by_label]
+            rows.append([KeyboardButton(text=self.back)])
+            kb = self._routes_kb[one_time] = ReplyKeyboardMarkup(
+                keyboard=rows, resize_keyboard=True, one_time_keyboard=one_time)
+        return kb
+
+    # ---------- hududlar ----------
+    def keyboard(self, city: Optional[str], page: int = 1,
+                 last_district: Optional[str] = None) -> ReplyKeyboardMarkup:
+        c = self.city(city)
+        base = c.pages[self.clamp_page(city, page) - 1]
+        if not last_district or last_district not in c.members:
+            return base
+        star = [KeyboardButton(text=f"{LAST_PREFIX}{last_district}")]
+        return ReplyKeyboardMarkup(keyboard=[star, *base.keyboard], resize_keyboard=True)
+
+    def search(self, city: Optional[str], query: str, limit: int = 4) -> List[Tuple[str, float]]:
+        return self.city(city).search.search(query, limit=limit)
+
+    def suggestions_keyboard(self, city: Optional[str], names: Sequence[str]) -> ReplyKeyboardMarkup:
+        rows = [[KeyboardButton(text=x)] for x in names]
+        rows.append([KeyboardButton(text=self.list_), KeyboardButton(text=self.back)])
+        return ReplyKeyboardMarkup(keyboard=rows, resize_keyboard=True)
+
+    def suggestions_inline(self, city: Optional[str], names: Sequence[str], tag: str,
+                           page: int = 1) -> InlineKeyboardMarkup:
+        c = self.city(city)
+        rows = [[InlineKeyboardButton(text=x, callback_data=self._pick_data(c, tag, c.positions[x]))]
+                for x in names]
+        rows.append([InlineKeyboardButton(text=self.list_, callback_data=f"{CB_PAGE}:{tag}:{c.index}:{page}"),
+                     InlineKeyboardButton(text=self.back, callback_data=f"{CB_BACK}:{tag}")])
+        return InlineKeyboardMarkup(inline_keyboard=rows)
+
+    def inline_keyboard(self, city: Optional[str], page: int, tag: str,
+                        last_district: Optional[str] = None) -> InlineKeyboardMarkup:
+        """Reply klaviaturaning inline nusxasi; `tag` callback'ni qaysi qadamga tegishli
+        ekanini bildiradi. Sahifalar birinchi so'rovda quriladi va keshlanadi."""
+        c = self.city(city)
+        page = self.clamp_page(city, page)
+        key = (c.name, tag, page)
+        base = self._inline.get(key)
+        if base is None:
+            base = self._inline[key] = self._build_inline(c, page, tag)
+        if not last_district or last_district not in c.members:
+            return base
+        star = [InlineKeyboardButton(text=f"{LAST_PREFIX}{last_district}",
+                                     callback_data=self._pick_data(c, tag, c.positions[last_district]))]
+        return InlineKeyboardMarkup(inline_keyboard=[star, *base.inline_keyboard])
+
+    def _pick_data(self, c: CityDistricts, tag: str, n: int) -> str:
+        return f"{CB_PICK}:{tag}:{c.index}:{n}:{self.version}" if self.version else f"{CB_PICK}:{tag}:{c.index}:{n}"
+
+    def _build_inline(self, c: CityDistricts, page: int, tag: str) -> InlineKeyboardMarkup:
+        total = len(c.pages)
+        start = (page - 1) * self.per_page
+        items = c.items[start:start + self.per_page]
+        buttons = [InlineKeyboardButton(text=x, callback_data=self._pick_data(c, tag, start + i))
+                   for i, x in enumerate(items)]
+        rows = [buttons[i:i + self.cols] for i in range(0, len(buttons), self.cols)]
+        nav = []
+        if page > 1:
+            nav.append(InlineKeyboardButton(text=self.prev, callback_data=f"{CB_PAGE}:{tag}:{c.index}:{page - 1}"))
+        nav.append(InlineKeyboardButton(text=f"{page}/{total}", callback_data=CB_NOOP))
+        if page < total:
+            nav.append(InlineKeyboardButton(text=self.next_, callback_data=f"{CB_PAGE}:{tag}:{c.index}:{page + 1}"))
+        rows.append(nav)
+        rows.append([InlineKeyboardButton(text=self.back, callback_data=f"{CB_BACK}:{tag}")])
+        return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+# ================= FAYLDAN YUKLASH =================
+def _str_list(v: Any, what: str) -> List[str]:
+    if not isinstance(v, list) or not v or not all(isinstance(x, str) and x.strip() for x in v):
+        raise ValueError(f"catalog: {what} must be a non-empty list of non-empty strings")
+    return [x.strip() for x in v]
+
+def parse_catalog(raw: bytes, **ui: Any) -> DistrictCatalog:
+    """JSON: {"default_city": ..., "cities": {shahar: [hududlar]}, "routes": [[qayerdan, qayerga]]}.
+    Xato tuzilma — ValueError; `ui` — tugma matnlari va sahifa o'lchami (DistrictCatalog'ga)."""
+    try:
+        spec = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"catalog: invalid JSON: {e}") from e
+    cities = spec.get("cities") if isinstance(spec, dict) else None
+    if not isinstance(cities, dict) or not cities:
+        raise ValueError("catalog: 'cities' must be a non-empty object")
+    cities = {str(name).strip(): _str_list(items, f"cities[{name!r}]") for name, items in cities.items()}
+    routes = []
+    for r in spec.get("routes") or []:
+        if not (isinstance(r, list) and len(r) == 2 and r[0] in cities and r[1] in cities and r[0] != r[1]):
+            raise ValueError(f"catalog: bad route {r!r}, expected [from_city, to_city] of known cities")
+        routes.append((r[0], r[1]))
+    if not routes:
+        raise ValueError("catalog: 'routes' must list at least one city pair")
+    default = spec.get("default_city") or next(iter(cities))
+    if default not in cities:
+        raise ValueError(f"catalog: default_city {default!r} is not in cities")
+    version = hashlib.sha1(raw).hexdigest()[:6]
+    return DistrictCatalog(cities, default, routes=routes, version=version, **ui)
+
+def load_catalog(path: str, **ui: Any) -> DistrictCatalog:
+    with open(path, "rb") as f:
+        return parse_catalog(f.read(), **ui)
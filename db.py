@@ -0,0 +1,376 @@
+# db.py — SQLite ma'lumotlar qatlami (ulanishlar puli + alohida executor)
+import os
+import time
+import queue
+import sqlite3
+import asyncio
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import stats
+import recent
+from dedupe import DEDUPE_ORDER_WINDOW, previous_key
+from metrics import DB_SECONDS
+from migrations import migrate, check_drift
+
+log = logging.getLogger("davon-taksi-bot.db")
+
+DB_POOL_SIZE   = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")   # WAL'da NORMAL yetarli, FULL — har commit'da fsync
+DB_FLUSH_MS    = int(os.getenv("DB_FLUSH_MS", "250"))     # write-behind oynasi
+DB_FLUSH_ROWS  = int(os.getenv("DB_FLUSH_ROWS", "500"))   # shuncha qator yig'ilsa darhol flush
+ORDER_DURABILITY = os.getenv("ORDER_DURABILITY", "sync")  # "sync": tasdiqdan oldin FULL commit; "async": navbat bilan
+
+PRAGMAS = (
+    "PRAGMA busy_timeout=5000",   # birinchi: yangi bazada journal_mode=WAL ham qulf kutishi mumkin
+    "PRAGMA journal_mode=WAL",
+    f"PRAGMA synchronous={DB_SYNCHRONOUS}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+)
+
+# ================= STATEMENTS =================
+# SQL matnlari o'zgarmas — sqlite3 ularni har ulanishning statement cache'ida saqlaydi.
+SQL_UPSERT_USER = """
+    INSERT INTO users(tg_user_id, full_name, username, joined_at, last_seen)
+    VALUES(?, ?, ?, ?, ?)
+    ON CONFLICT(tg_user_id) DO UPDATE SET
+        full_name=excluded.full_name,
+        username=excluded.username,
+        last_seen=MAX(COALESCE(users.last_seen, 0), excluded.last_seen),
+        blocked_at=NULL
+"""
+SQL_SET_PHONE = """
+    INSERT INTO users(tg_user_id, joined_at, last_seen, phone, registered_at)
+    VALUES(?, ?, ?, ?, ?)
+    ON CONFLICT(tg_user_id) DO UPDATE SET
+        phone=excluded.phone,
+        registered_at=COALESCE(users.registered_at, excluded.registered_at)
+"""
+SQL_GET_PHONE    = "SELECT phone FROM users WHERE tg_user_id=?"
+SQL_LAST_ORDER = """
+    SELECT route_from, from_district, route_to, to_district
+    FROM orders
+    WHERE tg_user_id = ?
+    ORDER BY created_at DESC
+    LIMIT 1
+"""
+# dedupe_key bo'yicha UNIQUE indeks: takror buyurtma jim tashlanadi (rowcount 0).
+# Kalit vaqt oynasiga bo'lingan, shuning uchun oyna chegarasidan o'tgan takror oldingi oyna
+# kaliti bilan ham tekshiriladi — bitta statement ichida, yozish qulfi ostida.
+SQL_INSERT_ORDER = """
+    INSERT OR IGNORE INTO orders(tg_user_id, full_name, username, phone,
+                                 route_from, from_district, route_to, to_district,
+                                 people, cargo, note, created_at, dedupe_key)
+    SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+    WHERE NOT EXISTS (SELECT 1 FROM orders WHERE dedupe_key = ? AND created_at >= ?)
+"""
+SQL_ENQUEUE_NOTICE = """
+    INSERT OR IGNORE INTO operator_outbox(order_id, status, attempts, next_at, created_at)
+    VALUES (?, 'pending', 0, ?, ?)
+"""
+
+OrderRow = Tuple[Any, ...]   # SQL_INSERT_ORDER tartibidagi 13 ta qiymat
+DUPLICATE = 0                # id o'rniga: bu dedupe_key bilan buyurtma allaqachon bor
+
+
+class Database:
+    """Uzoq yashovchi ulanishlar puli; barcha so'rovlar `db` executor'ida bajariladi,
+    shuning uchun event loop fsync kutib qolmaydi."""
+
+    def __init__(self, path: str, pool_size: int = DB_POOL_SIZE):
+        self.path = path
+        self.pool_size = max(1, pool_size)
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._conns: List[sqlite3.Connection] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._open_lock = threading.Lock()
+        self.schema_version = 0
+
+    # ---------- lifecycle ----------
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=128)
+        for p in PRAGMAS:
+            conn.execute(p)
+        return conn
+
+    def open(self):
+        with self._open_lock:
+            if self._executor is not None:
+                return
+            first = self._connect()
+            self.schema_version = migrate(first)
+            for problem in check_drift(first):
+                log.warning("[DB] schema drift: %s", problem)
+            self._conns = [first] + [self._connect() for _ in range(self.pool_size - 1)]
+            for c in self._conns:
+                self._pool.put(c)
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="db")
+
+    async def start(self):
+        """open() fon thread'ida: migratsiya va drift tekshiruvi paytida event loop tarmoqni
+        sozlashda davom etadi. Undan oldin kelgan run() bazani o'zi ochadi (lock ostida)."""
+        await asyncio.get_running_loop().run_in_executor(None, self.open)
+
+    def close(self):
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        for c in self._conns:
+            try:
+                c.close()
+            except Exception:
+                pass
+        self._conns = []
+        self._pool = queue.LifoQueue()
+
+    # ---------- execution ----------
+    def _call(self, fn: Callable, args: tuple):
+        conn = self._pool.get()
+        try:
+            return fn(conn, *args)
+        finally:
+            self._pool.put(conn)
+
+    async def run(self, fn: Callable, *args):
+        """fn(conn, *args) ni pul ulanishida, executor thread'ida bajaradi."""
+        if self._executor is None:
+            self.open()
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, self._call, fn, args)
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - t0, fn.__name__.lstrip("_"))
+
+    # ---------- operations ----------
+    async def upsert_user(self, uid: int, full_name: Optional[str], username: Optional[str], ts: int):
+        await self.run(_upsert_user, uid, full_name, username, ts)
+
+    async def set_user_phone(self, uid: int, phone: str, ts: int):
+        await self.run(_set_user_phone, uid, phone, ts)
+
+    async def get_user_phone(self, uid: int) -> Optional[str]:
+        return await self.run(_get_user_phone, uid)
+
+    async def get_last_order(self, uid: int) -> Optional[dict]:
+        return await self.run(_get_last_order, uid)
+
+    async def recent_trips(self, uid: int) -> List[dict]:
+        return await self.run(recent.read_trips, uid)
+
+    async def insert_order(self, row: OrderRow, notify: bool = False) -> int:
+        return await self.run(_insert_order, row, notify)
+
+    async def summary(self, today: str) -> Tuple[int, int]:
+        """(jami foydalanuvchilar, bugun qo'shilganlar) — counters/daily_stats'dan."""
+        return await self.run(stats.read_summary, today)
+
+    async def report_rows(self, since_day: str) -> List[Tuple[str, str, str, int]]:
+        return await self.run(stats.read_range, since_day)
+
+
+# ================= SYNC BODIES (executor thread) =================
+def _upsert_user(conn: sqlite3.Connection, uid, full_name, username, ts):
+    with conn:
+        conn.execute(SQL_UPSERT_USER, (uid, full_name, username, ts, ts))
+
+def _set_user_phone(conn: sqlite3.Connection, uid, phone, ts):
+    with conn:
+        is_new = not stats.existing_users(conn, [uid])
+        conn.execute(SQL_SET_PHONE, (uid, ts, ts, phone, ts))
+        if is_new:
+            stats.record_users(conn, [(uid, ts)], [(uid, ts)])
+
+def _get_user_phone(conn: sqlite3.Connection, uid) -> Optional[str]:
+    row = conn.execute(SQL_GET_PHONE, (uid,)).fetchone()
+    return row[0] if row and row[0] else None
+
+def _get_last_order(conn: sqlite3.Connection, uid) -> Optional[dict]:
+    row = conn.execute(SQL_LAST_ORDER, (uid,)).fetchone()
+    if not row:
+        return None
+    return {"route_from": row[0], "from_district": row[1], "route_to": row[2], "to_district": row[3]}
+
+def _insert_order(conn: sqlite3.Connection, row: OrderRow, notify: bool = False) -> int:
+    with conn:
+        oid = _insert_one(conn, row)
+        if oid == DUPLICATE:
+            return oid
+        stats.record_orders(conn, [_order_stat(row)])
+        recent.record_trips(conn, [_order_stat(row)])
+        if notify:
+            conn.execute(SQL_ENQUEUE_NOTICE, (oid, row[11], row[11]))
+        return oid
+
+def _insert_one(conn: sqlite3.Connection, row: OrderRow) -> int:
+    cur = conn.execute(SQL_INSERT_ORDER, (*row, previous_key(row[12]), row[11] - DEDUPE_ORDER_WINDOW))
+    return cur.lastrowid if cur.rowcount else DUPLICATE
+
+def _order_stat(row: OrderRow) -> tuple:
+    # (uid, route_from, from_district, route_to, to_district, people, cargo, created_at)
+    return row[0], row[4], row[5], row[6], row[7], row[8], row[9], row[11]
+
+
+# ================= WRITE-BEHIND =================
+class WriteBehind:
+    """users upsert'larini tg_user_id bo'yicha birlashtiradi va buyurtmalar bilan
+    birga bitta tranzaksiyada yozadi: har DB_FLUSH_MS da yoki DB_FLUSH_ROWS qatorda.
+
+    Buyurtma `sync=True` bilan qo'shilsa, flush darhol boshlanadi, FULL synchronous
+    bilan commit qilinadi va chaqiruvchi yangi qator id'sini oladi. `sync=False` da id
+    hali yo'q (None) — kerak bo'lsa `on_saved(id)` qator yozilgandan keyin chaqiriladi
+    (takror bo'lib tashlangan buyurtma uchun chaqirilmaydi).
+
+    `notify=True` bo'lsa har buyurtma uchun operator_outbox qatori shu tranzaksiyada
+    yoziladi; `on_flush` esa buyurtmali muvaffaqiyatli flush'dan keyin chaqiriladi."""
+
+    def __init__(self, db: Database, flush_ms: int = DB_FLUSH_MS, flush_rows: int = DB_FLUSH_ROWS,
+                 notify: bool = False):
+        self.db = db
+        self.notify = notify
+        self.on_flush: Optional[Callable[[], None]] = None
+        self.flush_ms = max(1, flush_ms)
+        self.flush_rows = max(1, flush_rows)
+        self._users: Dict[int, list] = {}     # uid -> [full_name, username, first_ts, last_ts]
+        self._orders: List[Tuple[OrderRow, Optional[asyncio.Future], Optional[Callable[[int], Any]]]] = []
+        self._dirty: Optional[asyncio.Event] = None
+        self._urgent: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def pending(self) -> int:
+        return len(self._users) + len(self._orders)
+
+    # ---------- enqueue ----------
+    def upsert_user(self, uid: int, full_name: Optional[str], username: Optional[str], ts: int):
+        cur = self._users.get(uid)
+        if cur is None:
+            self._users[uid] = [full_name, username, ts, ts]
+        else:
+            cur[0], cur[1], cur[3] = full_name, username, max(cur[3], ts)
+        self._kick()
+
+    async def add_order(self, row: OrderRow, sync: bool = ORDER_DURABILITY == "sync",
+                        on_saved: Optional[Callable[[int], Any]] = None) -> Optional[int]:
+        if not sync:
+            self._orders.append((row, None, on_saved))
+            self._kick()
+            return None
+        fut = asyncio.get_running_loop().create_future()
+        self._orders.append((row, fut, None))
+        self._kick(urgent=True)
+        return await fut
+
+    def _kick(self, urgent: bool = False):
+        self._ensure_task()
+        self._dirty.set()
+        if urgent or self.pending() >= self.flush_rows:
+            self._urgent.set()
+
+    # ---------- lifecycle ----------
+    def _ensure_task(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._dirty, self._urgent, self._lock = asyncio.Event(), asyncio.Event(), asyncio.Lock()
+        self._task = asyncio.get_running_loop().create_task(self._loop(), name="db-write-behind")
+
+    async def _loop(self):
+        while True:
+            await self._dirty.wait()
+            try:
+                await asyncio.wait_for(self._urgent.wait(), self.flush_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                log.exception("[DB] write-behind flush failed: %s", e)
+
+    async def stop(self):
+        """Fon vazifasini to'xtatadi va navbatda qolgan hamma narsani yozib tugatadi."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.pending():
+            self._lock = asyncio.Lock()
+            await self.flush()
+
+    # ---------- flush ----------
+    async def flush(self):
+        async with self._lock:
+            self._dirty.clear(); self._urgent.clear()
+            users, self._users = self._users, {}
+            orders, self._orders = self._orders, []
+            if not users and not orders:
+                return
+            durable = any(f is not None for _, f, _ in orders)
+            try:
+                ids = await self.db.run(_flush_batch, users, [r for r, _, _ in orders], durable, self.notify)
+            except Exception as e:
+                # Tranzaksiya rollback bo'lgan: users va async buyurtmalar navbatga qaytadi,
+                # sync buyurtmalar esa xatoni chaqiruvchiga beradi.
+                for uid, v in users.items():
+                    cur = self._users.get(uid)
+                    if cur is None:
+                        self._users[uid] = v
+                    else:
+                        cur[2] = min(cur[2], v[2])
+                self._orders[:0] = [o for o in orders if o[1] is None]
+                for _, f, _ in orders:
+                    if f is not None and not f.done():
+                        f.set_exception(e)
+                raise
+            self.flushes += 1
+            self.rows_written += len(users) + len(orders)
+            for (_, f, on_saved), oid in zip(orders, ids):
+                if f is not None and not f.done():
+                    f.set_result(oid)
+                elif on_saved is not None and oid != DUPLICATE:
+                    try:
+                        on_saved(oid)
+                    except Exception as e:
+                        log.exception("[DB] on_saved callback failed: %s", e)
+            if orders and self.on_flush is not None:
+                self.on_flush()
+
+
+def _flush_batch(conn: sqlite3.Connection, users: Dict[int, list], orders: List[OrderRow],
+                 durable: bool, notify: bool = False) -> List[int]:
+    if durable:
+        conn.execute("PRAGMA synchronous=FULL")
+    try:
+        with conn:
+            if users:
+                known = stats.existing_users(conn, users.keys())
+                conn.executemany(SQL_UPSERT_USER, [
+                    (uid, v[0], v[1], v[2], v[3]) for uid, v in users.items()
+                ])
+                stats.record_users(
+                    conn,
+                    [(uid, v[2]) for uid, v in users.items() if uid not in known],
+                    [(uid, v[3]) for uid, v in users.items()],
+                )
+            ids = [_insert_one(conn, row) for row in orders]
+            saved = [(oid, r) for oid, r in zip(ids, orders) if oid != DUPLICATE]
+            if saved:
+                rows = [_order_stat(r) for _, r in saved]
+                stats.record_orders(conn, rows)
+                recent.record_trips(conn, rows)
+                if notify:
+                    conn.executemany(SQL_ENQUEUE_NOTICE, [(oid, r[11], r[11]) for oid, r in saved])
+            stats.prune_activity(conn, time.time())
+            return ids
+    finally:
+        if durable:
+            conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
@@ -0,0 +1,117 @@
+# dedupe.py — takror yangilanishlar va bir xil buyurtmalarni DB/tarmoqqa yetmasdan to'xtatish
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from metrics import DUPLICATES
+
+DEDUPE_UPDATE_TTL = float(os.getenv("DEDUPE_UPDATE_TTL", "600"))   # Telegram qayta yuborishi shu oynada
+DEDUPE_ORDER_WINDOW = int(os.getenv("DEDUPE_ORDER_WINDOW", "120")) # bir xil buyurtma shu s ichida — takror
+DEDUPE_MAX_KEYS = int(os.getenv("DEDUPE_MAX_KEYS", "100000"))
+
+# Barmoq izi shu maydonlardan: boshqa odam uchun (boshqa telefon) yoki boshqa son — yangi buyurtma
+ORDER_FIELDS = ("phone", "route_from", "from_district", "route_to", "to_district", "people", "cargo")
+
+
+def previous_key(key: Optional[str]) -> Optional[str]:
+    """dedupe_key "barmoq_izi:oyna" ning oldingi oynadagi juftligi."""
+    if not key:
+        return None
+    fp, _, bucket = key.rpartition(":")
+    return f"{fp}:{int(bucket) - 1}"
+
+
+class ExpiringSet:
+    """Cheklangan, muddati o'tadigan to'plam. TTL hammaga bir xil, shuning uchun
+    qo'shilish tartibi = eskirish tartibi: eskilari boshidan kesiladi."""
+
+    def __init__(self, ttl: float, maxsize: int = DEDUPE_MAX_KEYS):
+        self.ttl = ttl
+        self.maxsize = max(1, maxsize)
+        self._data: "OrderedDict[Any, float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def seen(self, key: Any) -> bool:
+        """key oynada bor bo'lsa True; bo'lmasa qo'shadi va False qaytaradi."""
+        now = time.monotonic()
+        data = self._data
+        while data:
+            k, exp = next(iter(data.items()))
+            if exp > now and len(data) < self.maxsize:
+                break
+            del data[k]
+        exp = data.get(key)
+        if exp is not None and exp > now:
+            return True
+        data[key] = now + self.ttl
+        return False
+
+    def discard(self, key: Any):
+        self._data.pop(key, None)
+
+
+def order_fingerprint(uid: int, data: Dict[str, Any]) -> str:
+    vals = {**data, "people": int(data.get("people") or 0), "cargo": data.get("cargo") or "Йўқ"}
+    raw = "\x1f".join([str(uid)] + [str(vals.get(f)) for f in ORDER_FIELDS])
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+class Dedupe:
+    """Ikki qatlam:
+    - update_id: Telegram tarmoq uzilishidan keyin qayta yuborgan yangilanish (middleware);
+    - buyurtma barmoq izi: ikki marta bosilgan oxirgi tugma yoki eski "🔁" xabari.
+    Ikkala to'plam ham faqat shu jarayon xotirasida. update_id qatlami saqlanmaydi: restartdan
+    keyin yoki webhook'da boshqa worker'ga tushgan qayta yuborish o'tib ketadi (har update
+    uchun DB yozuvi qimmat). Buyurtmalar uchun esa instanslar/restartlar orasida
+    orders.dedupe_key ustunidagi UNIQUE indeks himoya qiladi (kalit vaqt oynasi bo'yicha
+    bo'lingan, chegaradagi takrorni oldingi oyna kaliti ushlaydi — db.SQL_INSERT_ORDER)."""
+
+    def __init__(self, update_ttl: float = DEDUPE_UPDATE_TTL, order_window: int = DEDUPE_ORDER_WINDOW,
+                 maxsize: int = DEDUPE_MAX_KEYS):
+        self.window = max(1, order_window)
+        self.updates = ExpiringSet(update_ttl, maxsize)
+        self.orders = ExpiringSet(self.window, maxsize)
+
+    def claim_order(self, uid: int, data: Dict[str, Any], ts: Optional[int] = None) -> Optional[str]:
+        """Yangi buyurtma bo'lsa DB uchun dedupe_key, takror bo'lsa None."""
+        fp = order_fingerprint(uid, data)
+        if self.orders.seen(fp):
+            DUPLICATES.inc("order")
+            return None
+        ts = int(time.time()) if ts is None else ts
+        return f"{fp}:{ts // self.window}"
+
+    def release(self, uid: int, data: Dict[str, Any]):
+        """Saqlanmagan buyurtmaning da'vosini bekor qiladi — foydalanuvchi darhol qayta urina oladi."""
+        self.orders.discard(order_fingerprint(uid, data))
+
+
+class DedupeMiddleware(BaseMiddleware):
+    """dp.update outer middleware: takror update_id filtrlar, throttle va handler'larga yetmaydi.
+    Faqat shu jarayonga qayta kelgan update'lar (qarang: Dedupe).
+
+    update_id handler'dan oldin belgilanadi (ishlanayotgan paytda kelgan nusxa ham o'tmasin),
+    lekin handler xato bilan tugasa belgi olib tashlanadi: webhook xato javob qaytaradi va
+    Telegram'ning qayta yuborishi ishlanadi."""
+
+    def __init__(self, dedupe: Dedupe):
+        self.dedupe = dedupe
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        if isinstance(event, Update) and self.dedupe.updates.seen(event.update_id):
+            DUPLICATES.inc("update")
+            return None
+        try:
+            return await handler(event, data)
+        except BaseException:
+            if isinstance(event, Update):
+                self.dedupe.updates.discard(event.update_id)
+            raise
@@ -0,0 +1,156 @@
+# export.py — orders/users jadvallarini sana oralig'ida oqim bilan eksport (gzip CSV yoki Parquet)
+#   python export.py orders.db orders --since 2024-05-01 --until 2024-05-31 [--format parquet] [-o fayl]
+#   arxivlangan oylar bilan: ... --archive archive/orders-2024-0*.db
+import os
+import csv
+import gzip
+import time
+import sqlite3
+import argparse
+import calendar
+from contextlib import closing
+from typing import Iterator, List, Optional, Sequence, Set, Tuple
+
+from stats import TASHKENT_UTC_OFFSET, tashkent_day
+
+try:   # ixtiyoriy: Parquet faqat pyarrow o'rnatilgan bo'lsa
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK", "5000"))   # fetchmany hajmi — xotira shunga bog'liq, jadvalga emas
+
+# jadval -> sana bo'yicha filtrlanadigan ustun
+TABLES = {"orders": "created_at", "users": "joined_at"}
+FORMATS = ("csv", "parquet") if pa is not None else ("csv",)
+
+_ARROW_TYPES = {"INTEGER": "int64", "REAL": "float64"}
+
+
+def day_start(day: str) -> int:
+    """"YYYY-MM-DD" (Toshkent) -> o'sha kun boshining unix vaqti."""
+    return calendar.timegm(time.strptime(day, "%Y-%m-%d")) - TASHKENT_UTC_OFFSET
+
+def default_name(table: str, since: str, until: str, fmt: str) -> str:
+    return f"{table}_{since}_{until}." + ("csv.gz" if fmt == "csv" else "parquet")
+
+def open_readonly(path: str) -> sqlite3.Connection:
+    # Alohida ulanish: eksport pul/executor'ni band qilmaydi, WAL'da yozuvchilarni to'sib qo'ymaydi
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+def _columns(conn: sqlite3.Connection, table: str, schema: str = "main") -> List[Tuple[str, str]]:
+    return [(r[1], (r[2] or "").upper()) for r in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+def _fetch(conn: sqlite3.Connection, sql: str, params: tuple, chunk: int) -> Iterator[List[tuple]]:
+    cur = conn.execute(sql, params)
+    try:
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cur.close()
+
+def iter_chunks(conn: sqlite3.Connection, table: str, since_ts: int, until_ts: int,
+                chunk: int = EXPORT_CHUNK, archives: Sequence[str] = ()
+                ) -> Tuple[List[Tuple[str, str]], Iterator[List[tuple]]]:
+    """`archives` — oylik arxiv fayllari (xronologik): har biri navbat bilan faqat-o'qish
+    rejimida ATTACH qilinadi va asosiy bazadan oldin o'qiladi. Asosiy bazada hali turgan
+    arxivlangan qatorlar (eski snapshot, arxivlashning ikki qadami orasi) id bo'yicha
+    o'tkazib yuboriladi."""
+    if table not in TABLES:
+        raise ValueError(f"unknown table {table!r}, expected one of {sorted(TABLES)}")
+    cols = _columns(conn, table)
+    key = TABLES[table]
+
+    def select(schema: str) -> str:
+        # eski arxivda keyin qo'shilgan ustun bo'lmasa — NULL
+        have = {c for c, _ in _columns(conn, table, schema)}
+        names = ", ".join(c if c in have else f"NULL AS {c}" for c, _ in cols)
+        return f"SELECT {names} FROM {schema}.{table} WHERE {key} >= ? AND {key} < ? ORDER BY {key}"
+
+    names = [c for c, _ in cols]
+    both = (f"SELECT m.id FROM main.{table} m JOIN arc.{table} a ON a.id = m.id "
+            f"WHERE m.{key} >= ? AND m.{key} < ?")
+
+    def gen() -> Iterator[List[tuple]]:
+        dupes: Set[int] = set()
+        for path in archives:
+            conn.execute("ATTACH DATABASE ? AS arc", (f"file:{path}?mode=ro",))
+            try:
+                if "id" in names:
+                    dupes.update(r[0] for r in conn.execute(both, (since_ts, until_ts)))
+                yield from _fetch(conn, select("arc"), (since_ts, until_ts), chunk)
+            finally:
+                conn.execute("DETACH DATABASE arc")
+        main = _fetch(conn, select("main"), (since_ts, until_ts), chunk)
+        if not dupes:
+            yield from main
+            return
+        i = names.index("id")
+        for rows in main:
+            rows = [r for r in rows if r[i] not in dupes]
+            if rows:
+                yield rows
+    return cols, gen()
+
+def write_csv(out_path: str, cols: Sequence[Tuple[str, str]], chunks: Iterator[List[tuple]]) -> int:
+    n = 0
+    with gzip.open(out_path, "wt", encoding="utf-8", newline="", compresslevel=6) as f:
+        w = csv.writer(f)
+        w.writerow([c for c, _ in cols])
+        for rows in chunks:
+            w.writerows(rows)
+            n += len(rows)
+    return n
+
+def write_parquet(out_path: str, cols: Sequence[Tuple[str, str]], chunks: Iterator[List[tuple]]) -> int:
+    if pa is None:
+        raise RuntimeError("parquet export needs pyarrow (pip install pyarrow)")
+    schema = pa.schema([(c, getattr(pa, _ARROW_TYPES.get(t, "string"))()) for c, t in cols])
+    n = 0
+    with pq.ParquetWriter(out_path, schema, compression="zstd") as w:
+        for rows in chunks:
+            arrays = [pa.array([r[i] for r in rows], type=schema.field(i).type) for i in range(len(cols))]
+            w.write_batch(pa.record_batch(arrays, schema=schema))
+            n += len(rows)
+    return n
+
+def export(db_path: str, table: str, since: str, until: str, fmt: str = "csv",
+           out_path: Optional[str] = None, chunk: int = EXPORT_CHUNK,
+           archives: Sequence[str] = ()) -> Tuple[str, int]:
+    """[since, until] kunlari (ikkalasi ham kiradi) -> (fayl yo'li, qatorlar soni).
+    `archives` — orders uchun shu oraliqdagi oylik arxiv fayllari."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format {fmt!r} not available, expected one of {FORMATS}")
+    out_path = out_path or default_name(table, since, until, fmt)
+    with closing(open_readonly(db_path)) as conn:
+        cols, chunks = iter_chunks(conn, table, day_start(since), day_start(until) + 86400, chunk,
+                                   archives if table == "orders" else ())
+        n = (write_csv if fmt == "csv" else write_parquet)(out_path, cols, chunks)
+    return out_path, n
+
+
+def main_():
+    ap = argparse.ArgumentParser(description="Stream orders/users to gzip CSV or Parquet")
+    ap.add_argument("db", help="orders.db yo'li")
+    ap.add_argument("table", choices=sorted(TABLES))
+    ap.add_argument("--since", default=tashkent_day(time.time() - 29 * 86400), help="YYYY-MM-DD (Toshkent)")
+    ap.add_argument("--until", default=tashkent_day(), help="YYYY-MM-DD, shu kun ham kiradi")
+    ap.add_argument("--format", default="csv", choices=FORMATS)
+    ap.add_argument("-o", "--output", default=None)
+    ap.add_argument("--chunk", type=int, default=EXPORT_CHUNK)
+    ap.add_argument("--archive", nargs="*", default=[], help="oylik arxiv fayllari (archive/orders-YYYY-MM.db)")
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    path, n = export(args.db, args.table, args.since, args.until, args.format, args.output, args.chunk,
+                     sorted(args.archive))
+    print(f"{path}: {n} rows, {os.path.getsize(path) / 1024:.1f} KiB, {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main_()
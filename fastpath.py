@@ -0,0 +1,56 @@
+# fastpath.py — (holat, aniq matn) -> handler: tugma matnlari uchun dict orqali yo'naltirish
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple, Union
+
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.types import Message
+
+Handler = Callable[[Message, FSMContext], Awaitable[Any]]
+
+ANY_STATE = "*"
+
+
+class FastPath:
+    """dp.message'dagi birinchi handler sifatida ro'yxatdan o'tadi: filtri bitta dict
+    qidiruvi. Topilmasa aiogram odatdagidek qolgan filtrlar bo'yicha davom etadi.
+
+    ANY_STATE yozuvlari holatga bog'liq yozuvlardan oldin tekshiriladi — xuddi
+    holat filtrisiz handler'lar ro'yxatda oldinroq turgani kabi."""
+
+    def __init__(self):
+        self.routes: Dict[Tuple[Optional[str], str], Handler] = {}
+
+    def add(self, state: Union[State, str, None], texts: Iterable[str], handler: Handler):
+        key = state.state if isinstance(state, State) else state
+        for t in texts:
+            self.routes.setdefault((key, t), handler)
+
+    def rebind(self, handlers: Iterable[Handler],
+               entries: Iterable[Tuple[Union[State, str, None], Iterable[str], Handler]]):
+        """`handlers`ga olib boruvchi barcha yozuvlarni `entries` bilan almashtiradi (katalog
+        qayta yuklanganda). Yangi dict quriladi va bitta o'zlashtirish bilan qo'yiladi."""
+        drop = set(handlers)
+        routes = {k: h for k, h in self.routes.items() if h not in drop}
+        for state, texts, handler in entries:
+            key = state.state if isinstance(state, State) else state
+            for t in texts:
+                routes.setdefault((key, t), handler)
+        self.routes = routes
+
+    def lookup(self, raw_state: Optional[str], text: Optional[str]) -> Optional[Handler]:
+        if not text:
+            return None
+        routes = self.routes
+        return routes.get((ANY_STATE, text)) or routes.get((raw_state, text))
+
+    async def _filter(self, message: Message, raw_state: Optional[str] = None) -> Union[bool, Dict[str, Any]]:
+        h = self.lookup(raw_state, message.text)
+        return {"fast_handler": h} if h is not None else False
+
+    @staticmethod
+    async def _dispatch(message: Message, state: FSMContext, fast_handler: Handler):
+        return await fast_handler(message, state)
+
+    def register(self, observer: TelegramEventObserver):
+        observer.register(self._dispatch, self._filter)
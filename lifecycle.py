@@ -0,0 +1,233 @@
+# lifecycle.py — polling: restart paytidagi navbatni tashlamaslik, cheklangan parallellik, yumshoq to'xtash
+import os
+import asyncio
+import logging
+from contextlib import suppress
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.exceptions import TelegramConflictError
+from aiogram.methods import GetUpdates, TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+log = logging.getLogger("davon-taksi-bot.lifecycle")
+
+POLL_CONCURRENCY = int(os.getenv("POLL_CONCURRENCY", "32"))   # bir vaqtda ishlanayotgan yangilanishlar
+POLL_TIMEOUT     = int(os.getenv("POLL_TIMEOUT", "30"))       # getUpdates long-poll, s
+DRAIN_TIMEOUT    = float(os.getenv("DRAIN_TIMEOUT", "8"))     # SIGTERM'dan keyin kutish; docker stop — 10 s
+POLL_BUFFER      = int(os.getenv("POLL_BUFFER", "4"))         # xotirada: POLL_CONCURRENCY * shuncha yangilanish
+POLL_BACKOFF_MAX = 30.0
+
+
+def _user_key(update: Update) -> Optional[int]:
+    try:
+        user = getattr(update.event, "from_user", None)
+    except Exception:   # noma'lum yangilanish turi
+        return None
+    return user.id if user is not None else None
+
+
+class UpdatePoller:
+    """dp.start_polling o'rniga: getUpdates -> dp.feed_update.
+
+    - Parallellik semafor bilan cheklangan, joyni faqat hozir ishlanayotgan yangilanish
+      egallaydi. Xotiradagi yangilanishlar soni ham cheklangan (concurrency * POLL_BUFFER):
+      to'lsa keyingisi olinmaydi — restartdan keyingi katta navbat xotirani to'ldirmaydi.
+    - Bitta foydalanuvchining yangilanishlari kelish tartibida ketma-ket ishlanadi
+      (FSM holati poyga qilmaydi): band foydalanuvchining keyingi yangilanishlari uning
+      navbatida joysiz kutadi, shuning uchun bitta faol foydalanuvchi boshqalarni to'smaydi.
+    - offset (Telegram'ga tasdiq) eng kichik hali boshlanmagan yangilanishdan oshmaydi:
+      navbatda turganlar tasdiqlanmaydi. Keyingi getUpdates ularni qayta qaytarsa — tashlab
+      ketiladi, yangi hech narsa bo'lmasa biror yangilanish boshlanguncha kutiladi.
+    - stop(): long-poll darhol uziladi, navbatdagi yangilanishlar boshlanmaydi va offset
+      tasdiqlanadi — ular keyingi instansga qayta keladi (undan keyingi, allaqachon ishlangan
+      boshqa foydalanuvchilarnikilari ham: Telegram offset'i uzluksiz). Yangi instans 409
+      Conflict'siz ulanadi; eskisi boshlangan handler'larni drain() bilan tugatadi."""
+
+    def __init__(self, dp: Dispatcher, bot: Bot, allowed_updates: Optional[List[str]] = None,
+                 concurrency: int = POLL_CONCURRENCY, polling_timeout: int = POLL_TIMEOUT):
+        self.dp = dp
+        self.bot = bot
+        self.allowed_updates = allowed_updates
+        self.timeout = polling_timeout
+        self._next_id: Optional[int] = None   # olingan eng katta update_id + 1
+        self._unstarted: Set[int] = set()      # olingan, lekin hali boshlanmagan update_id'lar
+        self._progress = asyncio.Event()       # biror yangilanish boshlandi
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._buffer = asyncio.Semaphore(max(1, concurrency) * max(1, POLL_BUFFER))
+        self._buffered = 0
+        self._stop = asyncio.Event()
+        self._tasks: Set[asyncio.Task] = set()
+        self._queues: Dict[int, Deque[Update]] = {}   # band foydalanuvchi -> keyingi yangilanishlari
+        self._data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+
+    @property
+    def offset(self) -> Optional[int]:
+        """getUpdates offset'i: bundan oldingilari Telegram'da tasdiqlangan hisoblanadi."""
+        return min(self._unstarted) if self._unstarted else self._next_id
+
+    def in_flight(self) -> int:
+        """Olingan, lekin hali tugamagan yangilanishlar (ishlanayotgan + navbatdagi)."""
+        return self._buffered
+
+    def stop(self):
+        if not self._stop.is_set():
+            log.info("[POLL] stop requested, %d updates in flight", self._buffered)
+        self._stop.set()
+
+    # ---------- loop ----------
+    async def run(self):
+        backoff, first = 1.0, True
+        while not self._stop.is_set():
+            self._progress.clear()
+            try:
+                updates = await self._until_stop(self.bot(
+                    GetUpdates(offset=self.offset, timeout=self.timeout, allowed_updates=self.allowed_updates),
+                    request_timeout=self.timeout + 10,
+                ))
+            except TelegramConflictError as e:
+                # Deploy paytida eski instans hali polling qilmoqda — u to'xtaguncha kutamiz
+                log.warning("[POLL] conflict, retry in %.0fs: %s", backoff, e)
+                await self._until_stop(asyncio.sleep(backoff))
+                backoff = min(POLL_BACKOFF_MAX, backoff * 2)
+                continue
+            except Exception as e:
+                log.error("[POLL] getUpdates failed, retry in %.0fs: %s: %s", backoff, type(e).__name__, e)
+                await self._until_stop(asyncio.sleep(backoff))
+                backoff = min(POLL_BACKOFF_MAX, backoff * 2)
+                continue
+            if updates is None:
+                break
+            backoff = 1.0
+            if first and updates:
+                log.info("[POLL] backlog on startup: %d%s updates", len(updates), "+" if len(updates) >= 100 else "")
+            first = False
+            fresh = [u for u in updates if self._next_id is None or u.update_id >= self._next_id]
+            if updates and not fresh:
+                # Hammasi allaqachon navbatda (tasdiqlanmagan) — bo'sh aylanmaslik uchun
+                await self._until_stop(self._progress.wait())
+                continue
+            for update in fresh:
+                if not await self._until_stop(self._buffer.acquire()):
+                    break
+                self._buffered += 1
+                self._unstarted.add(update.update_id)
+                self._next_id = update.update_id + 1
+                self._submit(update)
+        await self._confirm()
+
+    async def _until_stop(self, aw) -> Any:
+        """`aw` natijasi; stop() avval kelsa — `aw` bekor qilinadi va None qaytadi."""
+        task = asyncio.ensure_future(aw)
+        if self._stop.is_set():
+            task.cancel()
+        else:
+            stop = asyncio.ensure_future(self._stop.wait())
+            await asyncio.wait({task, stop}, return_when=asyncio.FIRST_COMPLETED)
+            stop.cancel()
+            if not task.done():
+                task.cancel()
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if not self._stop.is_set():
+                raise
+            return None
+
+    async def _confirm(self):
+        # Keyingi getUpdates chaqiruvi bo'lmaydi — boshlangan yangilanishlarni hozir tasdiqlaymiz
+        if self.offset is None:
+            return
+        try:
+            await self.bot(GetUpdates(offset=self.offset, limit=1, timeout=0, allowed_updates=self.allowed_updates))
+        except Exception as e:
+            log.warning("[POLL] offset %s not confirmed, updates may repeat: %s", self.offset, e)
+
+    # ---------- handling ----------
+    def _submit(self, update: Update):
+        key = _user_key(update)
+        if key is not None:
+            queue = self._queues.get(key)
+            if queue is not None:   # foydalanuvchining worker'i bor — uning navbatiga
+                queue.append(update)
+                return
+            self._queues[key] = deque()
+        task = asyncio.create_task(self._worker(key, update), name=f"update-{update.update_id}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _next(self, key: Optional[int]) -> Optional[Update]:
+        queue = self._queues.get(key) if key is not None else None
+        if queue:
+            return queue.popleft()
+        if key is not None:
+            self._queues.pop(key, None)
+        return None
+
+    async def _worker(self, key: Optional[int], update: Optional[Update]):
+        """Bitta foydalanuvchining navbatini tartib bilan ishlaydi; joy har yangilanishga
+        alohida olinadi va orada bo'shatiladi. stop()'dan keyin yangisi boshlanmaydi."""
+        try:
+            while update is not None:
+                async with self._slots:
+                    if self._stop.is_set():
+                        break
+                    await self._handle(update)
+                update = self._next(key)
+        finally:
+            left = [update] if update is not None and update.update_id in self._unstarted else []
+            if key is not None:
+                left += self._queues.pop(key, ())
+            if left:   # tasdiqlanmagan — keyingi instansga qayta keladi
+                log.info("[POLL] %d queued updates of user %s left for redelivery", len(left), key)
+                for _ in left:
+                    self._done()
+
+    def _done(self):
+        self._buffered -= 1
+        self._buffer.release()
+
+    async def _handle(self, update: Update):
+        self._unstarted.discard(update.update_id)
+        self._progress.set()
+        try:
+            response = await self.dp.feed_update(self.bot, update, **self._data)
+            if isinstance(response, TelegramMethod):
+                await self.dp.silent_call_request(bot=self.bot, result=response)
+        except asyncio.CancelledError:
+            log.error("[POLL] update %s cancelled at shutdown", update.update_id)
+            raise
+        except Exception as e:
+            log.exception("[POLL] update %s failed: %s", update.update_id, e)
+        finally:
+            self._done()
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT) -> int:
+        """Ishlanayotgan yangilanishlarni `timeout` gacha kutadi; qolganlari bekor qilinadi.
+        Bekor qilinganlar soni qaytadi."""
+        if not self._tasks:
+            return 0
+        _, pending = await asyncio.wait(set(self._tasks), timeout=max(0.0, timeout))
+        for t in pending:
+            t.cancel()
+        with suppress(asyncio.CancelledError):
+            await asyncio.gather(*pending, return_exceptions=True)
+        if pending:
+            log.error("[POLL] drain deadline hit, %d updates cancelled", len(pending))
+        return len(pending)
+
+
+class FirstUpdateMiddleware(BaseMiddleware):
+    """dp.update outer middleware: birinchi yangilanish kelganda `on_first` bir marta chaqiriladi
+    (time-to-first-update; polling va webhook uchun bir xil)."""
+
+    def __init__(self, on_first: Callable[[], None]):
+        self._on_first: Optional[Callable[[], None]] = on_first
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        if self._on_first is not None:
+            on_first, self._on_first = self._on_first, None
+            on_first()
+        return await handler(event, data)
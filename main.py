@@ -1,27 +1,53 @@
 # main.py — DAVON EXPRESS TAXI (lokatsiyasiz, to‘liq)
 import os
 import re
+import json
 import time
-import sqlite3
+import hashlib
+import signal
 import asyncio
 import logging
-from contextlib import closing
-from typing import List, Optional
+from contextlib import suppress
+from functools import partial
+from typing import Callable, List, Optional, Set
+
+PROCESS_T0 = time.monotonic()   # aiogram importidan oldin: bot_startup_seconds shu nuqtadan
 
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import CommandStart, Command
 from aiogram.types import (
-    Message, CallbackQuery, BotCommand,
+    Message, CallbackQuery, BotCommand, FSInputFile, User,
     ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove,
     InlineKeyboardMarkup, InlineKeyboardButton,
 )
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
+from db import Database, WriteBehind, DUPLICATE
+from broadcast import Broadcaster
+from outbox import OperatorOutbox, CLAIM_PREFIX, mark_claimed
+from matching import DriverMatcher, TAKE_PREFIX, parse_depart, format_trip, fmt_time
+from cache import ProfileCache
+from catalog import (
+    DistrictCatalog, LAST_PREFIX, CB_PAGE, CB_PICK, CB_BACK, CB_NOOP, parse_callback, load_catalog, route_label,
+)
+from storage import make_storage
+from stats import tashkent_day, format_report, read_range, TASHKENT_UTC_OFFSET
+import export
+import archive
+import recent
+from fastpath import FastPath, ANY_STATE
+from throttle import ThrottleMiddleware
+from lifecycle import UpdatePoller, FirstUpdateMiddleware, DRAIN_TIMEOUT
+from dedupe import Dedupe, DedupeMiddleware
+from transport import TunedSession
+import metrics
+from metrics import timed
+
 # ================= ENV & LOG =================
 load_dotenv()
 BOT_TOKEN       = os.getenv("BOT_TOKEN")
@@ -30,6 +56,13 @@ ADMIN_CHAT_ID   = os.getenv("ADMIN_CHAT_ID")        # -100... ham bo'lishi mumki
 ADMIN_USER_ID   = os.getenv("ADMIN_USER_ID")        # bitta admin user id (ixtiyoriy)
 AUTO_ANNOUNCE   = os.getenv("AUTO_ANNOUNCE", "0")   # "1" bo'lsa restartda e'lon yuboradi
 ANNOUNCE_TEXT   = os.getenv("ANNOUNCE_TEXT", "Davon Express Taxi yangilandi!")
+ANNOUNCE_REPEAT_AFTER = float(os.getenv("ANNOUNCE_REPEAT_AFTER", "86400"))   # shu matn shundan keyingina qayta
+FAST_PATH       = os.getenv("FAST_PATH", "1") == "1"   # tugma matnlari uchun dict-yo'naltirish
+THROTTLE        = os.getenv("THROTTLE", "1") == "1"    # foydalanuvchi bo'yicha flood himoyasi
+INLINE_DISTRICTS = os.getenv("DISTRICT_UI", "reply") == "inline"   # "inline": callback + joyida tahrirlash
+METRICS_HOST    = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT    = int(os.getenv("METRICS_PORT", "0"))   # polling rejimida /metrics; 0 — o'chiq
+CATALOG_WATCH   = float(os.getenv("CATALOG_WATCH", "5"))   # katalog fayli shuncha s da tekshiriladi; 0 — faqat /catalog
 
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN topilmadi! .env faylni to‘ldiring.")
@@ -39,43 +72,53 @@ log = logging.getLogger("davon-taksi-bot")
 
 # ================= DB =================
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH  = os.path.join(BASE_DIR, "orders.db")
-
-def init_db():
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS users(
-            tg_user_id INTEGER PRIMARY KEY,
-            full_name  TEXT,
-            username   TEXT,
-            joined_at  INTEGER,
-            last_seen  INTEGER,
-            phone      TEXT,
-            registered_at INTEGER
-        );
-        """)
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS orders(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tg_user_id INTEGER,
-            full_name TEXT,
-            username TEXT,
-            phone TEXT,
-            route_from TEXT,
-            from_district TEXT,
-            route_to TEXT,
-            to_district TEXT,
-            people INTEGER,
-            cargo TEXT,
-            note TEXT,
-            created_at INTEGER
-        );
-        """)
-init_db()
+DB_PATH  = os.getenv("DB_PATH") or os.path.join(BASE_DIR, "orders.db")
+FSM_DB_PATH = os.getenv("FSM_DB_PATH") or os.path.join(os.path.dirname(DB_PATH), "fsm.db")
+ARCHIVE_DIR   = os.getenv("ARCHIVE_DIR") or os.path.join(os.path.dirname(DB_PATH), "archive")
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH") or os.path.join(os.path.dirname(DB_PATH), "snapshot.db")
+COMMANDS_CACHE = os.getenv("COMMANDS_CACHE") or os.path.join(os.path.dirname(DB_PATH), ".bot_commands.sha1")
+
+db = Database(DB_PATH)   # migratsiyalar importda emas — on_startup'da, tarmoq bilan parallel
+wb = WriteBehind(db, notify=bool(ADMIN_CHAT_ID))   # users/orders (+ operator_outbox) shu navbat orqali
+profiles = ProfileCache()   # phone / last_order / recent — write-through
 
 # ================= BOT/DP =================
-bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
-dp  = Dispatcher(storage=MemoryStorage())
+ALLOWED_UPDATES = ["message", "callback_query"]
+# Bitta umumiy sessiya: keep-alive pul, orjson; mijozlarga javoblar broadcast'dan oldin ketadi
+bot = Bot(BOT_TOKEN, session=TunedSession(), default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
+dp  = Dispatcher(storage=make_storage(FSM_DB_PATH))
+broadcaster = Broadcaster(bot, db)
+outbox = OperatorOutbox(bot, db, int(ADMIN_CHAT_ID)) if ADMIN_CHAT_ID else None
+if outbox is not None:
+    wb.on_flush = outbox.wake
+matcher = DriverMatcher(bot, db)
+maintenance = archive.Maintenance(DB_PATH, ARCHIVE_DIR, SNAPSHOT_PATH)   # arxiv + snapshot (leader)
+dedupe = Dedupe()
+dp.update.outer_middleware(DedupeMiddleware(dedupe))   # qayta yuborilgan update_id — handler'gacha yetmaydi
+
+# ================= METRICS =================
+dp.message.middleware(metrics.HandlerMetricsMiddleware())
+dp.callback_query.middleware(metrics.HandlerMetricsMiddleware())
+bot.session.middleware(metrics.ApiMetricsMiddleware())
+metrics.gauge("bot_profile_cache", "Profile cache size / hits / misses",
+              lambda: {(k,): float(v) for k, v in profiles.stats().items()}, labels=("stat",))
+metrics.gauge("bot_api_queue_depth", "Outbound Bot API requests waiting for a slot",
+              bot.session.queue_depths, labels=("priority",))
+metrics.gauge("bot_write_behind_pending", "Rows waiting in the write-behind queue",
+              lambda: {(): float(wb.pending())})
+def startup_mark(phase: str):
+    metrics.STARTUP_SECONDS.set(time.monotonic() - PROCESS_T0, phase)
+    log.info("[STARTUP] %s at %.0f ms", phase, (time.monotonic() - PROCESS_T0) * 1000)
+
+dp.update.outer_middleware(FirstUpdateMiddleware(partial(startup_mark, "first_update")))
+_background: List[asyncio.Task] = []
+_inflight: Set[asyncio.Task] = set()   # finalize'dan keyingi fon ishlari (taklif, zaxira xabar)
+
+def spawn(coro) -> asyncio.Task:
+    t = asyncio.create_task(coro)
+    _inflight.add(t)
+    t.add_done_callback(_inflight.discard)
+    return t
 
 async def setup_commands():
     cmds = [
@@ -88,8 +131,35 @@ async def setup_commands():
         cmds += [
             BotCommand(command="broadcast", description="(Admin) Hammaga matn"),
             BotCommand(command="announce",  description="(Admin) E’lon yuborish"),
+            BotCommand(command="report",    description="(Admin) Kunlik hisobot"),
+            BotCommand(command="driver",    description="(Admin) Haydovchini tasdiqlash"),
+            BotCommand(command="export",    description="(Admin) Eksport: orders/users"),
+            BotCommand(command="catalog",   description="(Admin) Katalogni qayta yuklash"),
         ]
-    await bot.set_my_commands(cmds)
+    # Ro'yxat o'zgarmagan bo'lsa har restartda set_my_commands chaqirilmaydi
+    raw = json.dumps([BOT_TOKEN.split(":", 1)[0], [(c.command, c.description) for c in cmds]])
+    digest = hashlib.sha1(raw.encode()).hexdigest()
+    with suppress(OSError), open(COMMANDS_CACHE) as f:
+        if f.read().strip() == digest:
+            return
+    try:
+        await bot.set_my_commands(cmds)
+    except Exception as e:
+        log.warning("[STARTUP] set_my_commands failed: %s", e); return
+    try:
+        with open(COMMANDS_CACHE, "w") as f:
+            f.write(digest)
+    except OSError as e:
+        log.warning("[STARTUP] commands hash not cached: %s", e)
+
+async def auto_announce():
+    try:
+        status_chat = int(ADMIN_USER_ID) if ADMIN_USER_ID else None
+        bid = await broadcaster.start_once(ANNOUNCE_TEXT, status_chat_id=status_chat, within=ANNOUNCE_REPEAT_AFTER)
+        if bid is None:
+            log.info("[AUTO_ANNOUNCE] same announcement running or sent recently, skipped")
+    except Exception as e:
+        log.exception("[AUTO_ANNOUNCE] failed: %s", e)
 
 # ================= STATES =================
 class OrderForm(StatesGroup):
@@ -103,6 +173,7 @@ class OrderForm(StatesGroup):
 BACK = "🔙 Орқага"
 NEXT = "➡️ Кейинги"
 PREV = "⬅️ Олдинги"
+LIST = "📋 Рўйхат"
 
 WELCOME_TEXT = (
     "🚖 *DAVON EXPRESS TAXI*\n"
@@ -115,12 +186,16 @@ PROMPT_PHONE_CHOICE= "📱 Telefon tanlang:\n— *📞 Mening raqamim*\n— *
 PROMPT_ROUTE       = "🧭 *Yo'nalishni tanlang.*"
 PROMPT_PICKUP      = "🚏 *Qaysi hududdan sizni olib ketamiz?*"
 PROMPT_DROP        = "🏁 *Qaysi hududga borasiz?*"
-PROMPT_DISTRICTS   = "— ҳудудни танланг!"
+PROMPT_DISTRICTS   = "— ҳудудни танланг ёки номини ёзинг!"
+PROMPT_SUGGEST     = "🔎 Шулардан бирими? Танланг ёки «📋 Рўйхат» ни босинг:"
+PROMPT_CHOICE      = "👥 Одам сонини танланг ёки «📦 Почта бор» ни босинг:"
+DUPLICATE_ORDER    = "✅ Бу буюртма ҳозиргина қабул қилинган. Янги буюртма учун /start ни босинг."
 
-def kb_inline_start() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🚖 БОШЛАШ", callback_data="go_start")]
-    ])
+def kb_inline_start(trips: List[dict] = ()) -> InlineKeyboardMarkup:
+    rows = [[InlineKeyboardButton(text=recent.label(t), callback_data=recent.CB_REPEAT + recent.trip_key(t))]
+            for t in trips[:recent.RECENT_SHOW]]
+    rows.append([InlineKeyboardButton(text="🚖 БОШЛАШ", callback_data="go_start")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
 
 def kb_request_phone() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
@@ -131,22 +206,15 @@ def kb_request_phone() -> ReplyKeyboardMarkup:
         resize_keyboard=True
     )
 
-ROUTE_QQ_TO_T = "Қўқон ➡️ Тошкент"
-ROUTE_T_TO_QQ = "Тошкент ➡️ Қўқон"
-
 def kb_routes() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text=ROUTE_QQ_TO_T)],
-            [KeyboardButton(text=ROUTE_T_TO_QQ)],
-            [KeyboardButton(text=BACK)],
-        ],
-        resize_keyboard=True
-    )
+    # inline hudud tanlovida pastda eski tugmalar qolmasin
+    return districts.routes_keyboard(one_time=INLINE_DISTRICTS)
 
-def kb_phone_choice() -> ReplyKeyboardMarkup:
+def kb_phone_choice(trips: List[dict] = ()) -> ReplyKeyboardMarkup:
+    # "🔁" tugmalari — oldingi safarni bir bosishda takrorlash
+    rows = [[KeyboardButton(text=recent.label(t))] for t in trips[:recent.RECENT_SHOW]]
     return ReplyKeyboardMarkup(
-        keyboard=[
+        keyboard=rows + [
             [KeyboardButton(text="📞 Mening raqamim")],
             [KeyboardButton(text="👤 Boshqa odam uchun"), KeyboardButton(text=BACK)],
         ],
@@ -188,171 +256,141 @@ def is_page_indicator(txt: str) -> bool:
     return bool(re.fullmatch(r"\d+/\d+", (txt or "").strip()))
 
 # ================= CITY & DISTRICTS =================
-QOQON_DISTRICTS: List[str] = [
-    "Қўқон шахар","Янгибозор/Опт","Янгибозор 65","Навоий","Урганжибоғ","Янгичорсу","Чорсу",
-    "Космонавт","Химик","Вокзал","Бабушкин","Тўҳлимерган","Дегрезлик","Гор/Ҳокимият",
-    "Гор/Дилшод","Гор больница","Чархий","Ғозиёғлиқ","Романка","Азиз тепа","Ғишткўприк",
-    "Спортивный","Водоканал","40 лет","Зелённый","ЧПК","Гор. отдель","Большевик",
-    "Ғиштли масжид","Минг тут","Автовокзал","МЖК","Калвак","Арчазор","Горгаз","Шиша бозор",
-    "Саодат масжиди","Тулабой","Данғара","Учкўприк","Бака чорсу","Динам","Сарботир",
-    "Найманча","Мяс комбинат","Мел комбинат","Городской","Айрилиш","10 автобаза",
-    "Пед колледж","Ипак йўли","Ярмарка","Авғонбоқ","Охак бозор","Автодарож","Городок",
-    "Ойим қишлоқ","Аерапорт","Қўқонбой","Оқ жар",
-]
-TOSHKENT_DISTRICTS: List[str] = [
-    "Алгаритим","Абу сахий","Авиасозлар 22","Авиасозлар 4","Аерапорт","Ахмад","Ахмад олтин жужа",
-    "Алмалик","Амир Темур сквер","Ангрен","Ашхабод боғи","Бек барака","Беруний Метро","Битонка",
-    "Болалар миллий тиббиёт","Буюк ипак йули метро","ВОДНИК","Ғишт кўприк чегара","Ғофур Ғулом метро",
-    "Ғунча","Дўстлик метро","Еркин мост","Жангох","Жарарик","Зангота Зиёратгоҳ","Жоме масжид",
-    "Ибн сино 1","Ипадром","Камолон","Кардиалогия маркази","Кафе квартал","Кафедра... (йўқ экан)",
-    "Келес","Корасув","Косманавтлар метро","Кока кола завод","Куйлюк 1","Куйлюк 2","Куйлюк 4",
-    "Куйлюк 5","Куйлюк 6","Курувчи","Миробод Бозори","Миробод тумани","Мирзо Улугбек","Минор метро",
-    "Минг урик","Маъруф ота масжиди","Машинасозлар метро","Межик ситий","Миллий боғ метро",
-    "Мустақиллик майдони","Навоий куча","Некст маал","Олмазор","Олмалик","Охангарон","Олой бозори",
-    "Олим полвон","Панелний","Паркент Бозори","Паркент тумани","Перевал","Рохат","Сағбон","Себзор",
-    "Сергили","Сергили 6","Северный вогзал","Солношка","Собир Рахимов","Тахтапул","Ташкент ситий",
-    "ТТЗ бозор","Фаргона йули","Фарход бозори","Фууд ситий","Хадра майдони","Халқлар дўстлиги",
-    "Хайвонот боги","Хумо Арена","Чигатой","Чилонзор","Чирчиқ","Чорсу","Чупон ота","Шайхон Тохур",
-    "Шаршара","Шота Руставили","Янги бозор","Янги йул","Янги Чош Тепа","Янги обод бозор","Янгиобод бозори",
-    "Яланғоч","Яшинобод тумани","Яккасaroy","Ёшлик метро","Юнусобод","Южный вогзал","Қафе квартал",
-    "Қушбеги","Қўйлиқ 5","Центр Бешкозон","Центрланый парк",
-]
-def districts_for_city(city: str) -> List[str]:
-    return TOSHKENT_DISTRICTS if city == "Тошкент" else QOQON_DISTRICTS
-
-def chunk(lst: List[str], n: int) -> List[List[str]]:
-    return [lst[i:i+n] for i in range(0, len(lst), n)]
+# Shaharlar, hududlar va yo'nalishlar — catalog.json da; o'zgarsa qayta deploysiz almashadi.
+CATALOG_PATH = os.getenv("CATALOG_PATH") or os.path.join(BASE_DIR, "catalog.json")
+CATALOG_UI = dict(back=BACK, next_=NEXT, prev=PREV, per_page=8, cols=2, list_=LIST)
+districts: DistrictCatalog = load_catalog(CATALOG_PATH, **CATALOG_UI)
+SEARCH_ACCEPT = 0.9    # yozilgan nom: shu balldan yuqori va yaqqol yagona bo'lsa — savolsiz qabul
+SEARCH_MARGIN = 0.15   # ...ya'ni ikkinchi natijadan kamida shuncha oldinda
 
 # ================= USER HELPERS =================
-def upsert_user_basic(m: Message):
-    now = int(time.time())
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
-        conn.execute("""
-            INSERT INTO users(tg_user_id, full_name, username, joined_at, last_seen)
-            VALUES(?, ?, ?, ?, ?)
-            ON CONFLICT(tg_user_id) DO UPDATE SET
-                full_name=excluded.full_name,
-                username=excluded.username,
-                last_seen=excluded.last_seen
-        """, (m.from_user.id, m.from_user.full_name, m.from_user.username, now, now))
-
-def set_user_phone(user_id: int, phone: str):
-    now = int(time.time())
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
-        conn.execute(
-            "UPDATE users SET phone=?, registered_at=COALESCE(registered_at, ?) WHERE tg_user_id=?",
-            (phone, now, user_id)
-        )
-
-def get_user_phone(user_id: int) -> Optional[str]:
-    with closing(sqlite3.connect(DB_PATH)) as conn:
-        cur = conn.execute("SELECT phone FROM users WHERE tg_user_id=?", (user_id,))
-        row = cur.fetchone()
-        return row[0] if row and row[0] else None
-
-def all_user_ids() -> List[int]:
-    with closing(sqlite3.connect(DB_PATH)) as conn:
-        cur = conn.execute("SELECT tg_user_id FROM users")
-        return [r[0] for r in cur.fetchall()]
+async def upsert_user_basic(m: Message):
+    wb.upsert_user(m.from_user.id, m.from_user.full_name, m.from_user.username, int(time.time()))
+
+@timed("set_user_phone")
+async def set_user_phone(user_id: int, phone: str):
+    await db.set_user_phone(user_id, phone, int(time.time()))
+    profiles.set(user_id, "phone", phone)
+
+@timed("get_user_phone")
+async def get_user_phone(user_id: int) -> Optional[str]:
+    hit, phone = profiles.get(user_id, "phone")
+    if hit:
+        return phone
+    phone = await db.get_user_phone(user_id)
+    profiles.set(user_id, "phone", phone)
+    return phone
 
 # ================= LAST ORDER HELPERS =================
-def get_last_order(tg_user_id: int) -> Optional[dict]:
+@timed("get_last_order")
+async def get_last_order(tg_user_id: int) -> Optional[dict]:
+    hit, last = profiles.get(tg_user_id, "last_order")
+    if hit:
+        return last
     try:
-        with closing(sqlite3.connect(DB_PATH)) as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT route_from, from_district, route_to, to_district
-                FROM orders
-                WHERE tg_user_id = ?
-                ORDER BY created_at DESC
-                LIMIT 1
-            """, (tg_user_id,))
-            row = cur.fetchone()
-            if not row:
-                return None
-            return {"route_from": row[0], "from_district": row[1], "route_to": row[2], "to_district": row[3]}
+        last = await db.get_last_order(tg_user_id)
+        profiles.set(tg_user_id, "last_order", last)
+        return last
     except Exception as e:
         log.exception("[DB] get_last_order failed: %s", e)
         return None
 
+@timed("get_recent_trips")
+async def get_recent_trips(tg_user_id: int) -> List[dict]:
+    hit, trips = profiles.get(tg_user_id, "recent")
+    if hit:
+        return trips
+    try:
+        trips = await db.recent_trips(tg_user_id)
+        profiles.set(tg_user_id, "recent", trips)
+        return trips
+    except Exception as e:
+        log.exception("[DB] recent_trips failed: %s", e)
+        return []
+
+def trip_available(t: dict) -> bool:
+    """Katalog almashgan bo'lsa eski safar yo'nalishi yoki hududi yo'q bo'lishi mumkin."""
+    return (districts.route(route_label(t["route_from"], t["route_to"])) is not None
+            and districts.contains(t["route_from"], t["from_district"])
+            and districts.contains(t["route_to"], t["to_district"]))
+
 def last_district_for_city(city: str, last: Optional[dict]) -> Optional[str]:
     if not last: return None
-    data = districts_for_city(city)
-    if last.get("route_from") == city and last.get("from_district") in data:
+    if last.get("route_from") == city and districts.contains(city, last.get("from_district")):
         return last["from_district"]
-    if last.get("route_to") == city and last.get("to_district") in data:
+    if last.get("route_to") == city and districts.contains(city, last.get("to_district")):
         return last["to_district"]
     return None
 
 def extract_last_choice(txt: str) -> Optional[str]:
-    pref = "⭐ Oxirgi: "
-    return txt[len(pref):].strip() if (txt or "").startswith(pref) else None
+    return txt[len(LAST_PREFIX):].strip() if (txt or "").startswith(LAST_PREFIX) else None
 
 # ================= KEYBOARDS (district lists) =================
-def kb_districts(city: str, page: int = 1, per_page: int = 8,
-                 cols: int = 2, last_district: Optional[str] = None) -> ReplyKeyboardMarkup:
-    data = districts_for_city(city)
-    total_pages = max(1, (len(data)+per_page-1)//per_page)
-    page = max(1, min(page, total_pages))
-    start = (page-1)*per_page
-    items = data[start:start+per_page]
-
-    rows: List[List[KeyboardButton]] = []
-    if last_district and last_district in data:
-        rows.append([KeyboardButton(text=f"⭐ Oxirgi: {last_district}")])
-    for r in chunk(items, cols):
-        rows.append([KeyboardButton(text=x) for x in r])
-    nav = []
-    if page>1: nav.append(KeyboardButton(text=PREV))
-    nav.append(KeyboardButton(text=f"{page}/{total_pages}"))
-    if page<total_pages: nav.append(KeyboardButton(text=NEXT))
-    rows.append(nav)
-    rows.append([KeyboardButton(text=BACK)])
-    return ReplyKeyboardMarkup(keyboard=rows, resize_keyboard=True)
+def kb_districts(city: str, page: int = 1, last_district: Optional[str] = None) -> ReplyKeyboardMarkup:
+    return districts.keyboard(city, page, last_district=last_district)
 
 # ================= SAVE/NOTIFY/FINALIZE =================
-async def save_order_safe(m: Message, data: dict):
+@timed("save_order_safe")
+async def save_order_safe(user: User, data: dict, dedupe_key: Optional[str] = None,
+                          on_saved: Optional[Callable[[int], None]] = None) -> bool:
+    """ORDER_DURABILITY=async da data["order_id"] None bo'lib qoladi; id kerak bo'lgan ish
+    `on_saved` orqali qator bazaga yozilgandan keyin bajariladi."""
     try:
-        with closing(sqlite3.connect(DB_PATH)) as conn, conn:
-            conn.execute("""
-                INSERT INTO orders(tg_user_id, full_name, username, phone,
-                                   route_from, from_district, route_to, to_district,
-                                   people, cargo, note, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                m.from_user.id, m.from_user.full_name, m.from_user.username,
-                data.get("phone"),
-                data.get("route_from"), data.get("from_district"),
-                data.get("route_to"), data.get("to_district"),
-                int(data.get("people", 0)),
-                data.get("cargo", "Йўқ"), data.get("note", "-"),
-                int(time.time())
-            ))
+        now = int(time.time())
+        data["order_id"] = await wb.add_order((
+            user.id, user.full_name, user.username,
+            data.get("phone"),
+            data.get("route_from"), data.get("from_district"),
+            data.get("route_to"), data.get("to_district"),
+            int(data.get("people", 0)),
+            data.get("cargo", "Йўқ"), data.get("note", "-"),
+            now, dedupe_key
+        ), on_saved=on_saved)
+        if data["order_id"] == DUPLICATE:
+            return True
+        hit, trips = profiles.get(user.id, "recent")
+        if hit:
+            profiles.set(user.id, "recent", recent.bump(trips, data, now))
+        profiles.set(user.id, "last_order", {
+            "route_from": data.get("route_from"), "from_district": data.get("from_district"),
+            "route_to": data.get("route_to"), "to_district": data.get("to_district"),
+        })
+        return True
     except Exception as e:
         log.exception("[DB] Save failed: %s", e)
+        return False
 
-async def notify_operator_safe(m: Message, data: dict):
-    if not ADMIN_CHAT_ID:
+def notify_unsaved(user: User, data: dict):
+    # Operator xabari outbox orqali, buyurtma bilan bitta tranzaksiyada; bazaga yozilmagan
+    # buyurtma esa yo'qolmasin — bir martalik to'g'ridan-to'g'ri xabar, tasdiqni kutdirmasdan.
+    if outbox is None:
         return
-    try:
-        txt = (
-            "🆕 *Янги буюртма*\n"
-            f"👤 {m.from_user.full_name} (@{m.from_user.username or '-'}, ID:`{m.from_user.id}`)\n"
-            f"📞 Телефон: {data.get('phone')}\n"
-            f"🚖 Йўналиш: {data.get('route_from')} ({data.get('from_district')}) → "
-            f"{data.get('route_to')} ({data.get('to_district')})\n"
-            f"👥 Одам: {data.get('people')}\n"
-            f"📦 Почта: {data.get('cargo','Йўқ')}\n"
-            f"📝 Изоҳ: {data.get('note','-')}"
-        )
-        await bot.send_message(int(ADMIN_CHAT_ID), txt)
-    except Exception as e:
-        log.exception("[ADMIN] Notify failed: %s", e)
+    spawn(outbox.send_direct({
+        **data, "tg_user_id": user.id,
+        "full_name": user.full_name, "username": user.username,
+    }))
 
 async def finalize(m: Message, state: FSMContext):
-    data = await state.get_data()
-    await save_order_safe(m, data)
-    await notify_operator_safe(m, data)
+    await place_order(m, m.from_user, await state.get_data())
+    await state.clear()
+
+async def place_order(m: Message, user: User, data: dict):
+    """Saqlash, tasdiq va haydovchilarga taklif. `m` — javob yoziladigan chat xabari
+    (callback'da bu botning xabari, shuning uchun buyurtmachi alohida uzatiladi)."""
+    key = dedupe.claim_order(user.id, data)
+    if key is None:
+        await m.answer(DUPLICATE_ORDER, reply_markup=ReplyKeyboardRemove()); return
+    def offer_later(order_id: int):   # ORDER_DURABILITY=async: id flush'dan keyin ma'lum bo'ladi
+        spawn(offer_to_drivers(user, {**data, "order_id": order_id}))
+
+    if not await save_order_safe(user, data, key, on_saved=offer_later):
+        dedupe.release(user.id, data)
+        notify_unsaved(user, data)
+    elif data.get("order_id") == DUPLICATE:
+        # boshqa instans/restartdan oldin yozilgan — UNIQUE indeks ushladi
+        metrics.DUPLICATES.inc("db")
+        await m.answer(DUPLICATE_ORDER, reply_markup=ReplyKeyboardRemove()); return
+    metrics.ORDERS_TOTAL.inc()
     confirm = (
         "✅ Буюртма қабул қилинди!\n\n"
         f"📞 Телефон: {data.get('phone')}\n"
@@ -364,47 +402,116 @@ async def finalize(m: Message, state: FSMContext):
         "Янги буюртма учун /start ни босинг."
     )
     await m.answer(confirm, reply_markup=ReplyKeyboardRemove())
-    await state.clear()
+    if data.get("order_id"):
+        spawn(offer_to_drivers(user, data))
+
+async def offer_to_drivers(user: User, data: dict):
+    try:
+        await matcher.offer({
+            **data, "id": data["order_id"], "tg_user_id": user.id,
+            "people": int(data.get("people", 0)),
+        })
+    except Exception as e:
+        log.exception("[MATCH] offer failed: %s", e)
 
 # ================= RENDER HELPERS =================
+SIDE_FROM, SIDE_TO = "f", "t"   # inline callback_data'dagi qadam belgisi
+
+def district_prompt(side: str, city: str) -> str:
+    return f"{PROMPT_PICKUP if side == SIDE_FROM else PROMPT_DROP}\n🏙 {city} {PROMPT_DISTRICTS}"
+
+async def district_markup(uid: int, side: str, city: str, page: int):
+    star = last_district_for_city(city, await get_last_order(uid))
+    if INLINE_DISTRICTS:
+        return districts.inline_keyboard(city, page, side, last_district=star)
+    return kb_districts(city, page, last_district=star)
+
+async def route_gone(m: Message, state: FSMContext, data: dict) -> bool:
+    """Katalog almashib, suhbatdagi shahar olib tashlangan bo'lsa — yo'nalish tanloviga qaytaramiz."""
+    if districts.has_city(data.get("route_from")) and districts.has_city(data.get("route_to")):
+        return False
+    await state.set_state(OrderForm.route_from)
+    await m.answer(PROMPT_ROUTE, reply_markup=kb_routes())
+    return True
+
 async def render_from_page(m: Message, state: FSMContext, delta: int = 0):
     data = await state.get_data()
+    if await route_gone(m, state, data):
+        return
     city = data.get("route_from")
     page = int(data.get("from_page", 1)) + delta
-    total = max(1, (len(districts_for_city(city)) + 7) // 8)
-    page = max(1, min(page, total))
+    page = districts.clamp_page(city, page)
     await state.update_data(from_page=page)
-    star = last_district_for_city(city, get_last_order(m.from_user.id))
-    await m.answer(
-        f"{PROMPT_PICKUP}\n🏙 {city} {PROMPT_DISTRICTS}",
-        reply_markup=kb_districts(city, page, last_district=star)
-    )
+    await m.answer(district_prompt(SIDE_FROM, city),
+                   reply_markup=await district_markup(m.from_user.id, SIDE_FROM, city, page))
 
 async def render_to_page(m: Message, state: FSMContext, delta: int = 0):
     data = await state.get_data()
+    if await route_gone(m, state, data):
+        return
     city = data.get("route_to")
     page = int(data.get("to_page", 1)) + delta
-    total = max(1, (len(districts_for_city(city)) + 7) // 8)
-    page = max(1, min(page, total))
+    page = districts.clamp_page(city, page)
     await state.update_data(to_page=page)
-    star = last_district_for_city(city, get_last_order(m.from_user.id))
-    await m.answer(
-        f"{PROMPT_DROP}\n🏙 {city} {PROMPT_DISTRICTS}",
-        reply_markup=kb_districts(city, page, last_district=star)
-    )
+    await m.answer(district_prompt(SIDE_TO, city),
+                   reply_markup=await district_markup(m.from_user.id, SIDE_TO, city, page))
+
+async def resolve_typed_district(m: Message, state: FSMContext, side: str, city: str, txt: str) -> Optional[str]:
+    """Ro'yxatda yo'q matn (lotincha, xato bilan): noaniq qidiruv. Ishonchli bitta natija
+    qaytariladi; bir nechta bo'lsa takliflar ko'rsatiladi, hech narsa bo'lmasa — sahifa."""
+    hits = districts.search(city, txt)
+    if hits and hits[0][1] >= SEARCH_ACCEPT and (len(hits) == 1 or hits[0][1] - hits[1][1] >= SEARCH_MARGIN):
+        return hits[0][0]
+    if not hits:
+        await (render_from_page if side == SIDE_FROM else render_to_page)(m, state, 0)
+        return None
+    names = [name for name, _ in hits]
+    if INLINE_DISTRICTS:
+        data = await state.get_data()
+        page = int(data.get("from_page" if side == SIDE_FROM else "to_page", 1))
+        markup = districts.suggestions_inline(city, names, side, page)
+    else:
+        markup = districts.suggestions_keyboard(city, names)
+    await m.answer(PROMPT_SUGGEST, reply_markup=markup)
+    return None
+
+async def edit_or_send(msg: Message, text: Optional[str], markup=None):
+    """Inline tanlov xabarini joyida yangilaydi; tahrirlab bo'lmasa (eski/o'chirilgan) — yangi xabar."""
+    try:
+        if text is None:
+            await msg.edit_reply_markup(reply_markup=markup)
+        else:
+            await msg.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest as e:
+        if "not modified" in str(e):
+            return
+        await msg.answer(text or msg.text or PROMPT_DISTRICTS, reply_markup=markup)
 
 # ================= HANDLERS =================
+# Throttle — outer middleware: tashlanadigan yangilanish filtrlargacha ham yetmaydi.
+if THROTTLE:
+    throttle = ThrottleMiddleware(page_texts=(NEXT, PREV, *districts.page_labels(), CB_PAGE),
+                                  exempt=lambda uid: _is_admin(uid))
+    dp.message.outer_middleware(throttle)
+    dp.callback_query.outer_middleware(throttle)
+
+# Fast path birinchi handler bo'lib turadi; jadval handler'lar e'lon qilingach to'ldiriladi.
+fast = FastPath()
+if FAST_PATH:
+    fast.register(dp.message)
+
 @dp.message(CommandStart())
 async def cmd_start(m: Message, state: FSMContext):
     await state.clear()
-    upsert_user_basic(m)
-    await m.answer(WELCOME_TEXT, reply_markup=kb_inline_start())
+    await upsert_user_basic(m)
+    await m.answer(WELCOME_TEXT, reply_markup=kb_inline_start(await get_recent_trips(m.from_user.id)))
 
 @dp.callback_query(F.data == "go_start")
 async def cb_go_start(c: CallbackQuery, state: FSMContext):
-    phone = get_user_phone(c.from_user.id)
+    phone = await get_user_phone(c.from_user.id)
     if phone:
-        await c.message.answer(PROMPT_PHONE_CHOICE, reply_markup=kb_phone_choice())
+        await c.message.answer(PROMPT_PHONE_CHOICE,
+                               reply_markup=kb_phone_choice(await get_recent_trips(c.from_user.id)))
     else:
         await state.set_state(OrderForm.phone)
         await c.message.answer(PROMPT_PHONE_FORCE, reply_markup=kb_request_phone())
@@ -413,13 +520,39 @@ async def cb_go_start(c: CallbackQuery, state: FSMContext):
 @dp.message(Command("new"))
 async def cmd_new(m: Message, state: FSMContext):
     await state.clear()
-    phone = get_user_phone(m.from_user.id)
+    phone = await get_user_phone(m.from_user.id)
     if phone:
-        await m.answer(PROMPT_PHONE_CHOICE, reply_markup=kb_phone_choice())
+        await m.answer(PROMPT_PHONE_CHOICE, reply_markup=kb_phone_choice(await get_recent_trips(m.from_user.id)))
     else:
         await state.set_state(OrderForm.phone)
         await m.answer(PROMPT_PHONE_FORCE, reply_markup=kb_request_phone())
 
+# --- bir bosishda takroriy buyurtma ---
+async def repeat_trip(m: Message, user: User, state: FSMContext, trip: Optional[dict]):
+    phone = await get_user_phone(user.id)
+    if not phone:
+        await state.set_state(OrderForm.phone)
+        await m.answer(PROMPT_PHONE_FORCE, reply_markup=kb_request_phone()); return
+    if trip is None or not trip_available(trip):
+        await m.answer("⚠️ Бу йўналиш энди мавжуд эмас. Янгисини танланг:",
+                       reply_markup=kb_phone_choice([t for t in await get_recent_trips(user.id) if t is not trip]))
+        return
+    await state.clear()
+    await place_order(m, user, {
+        "phone": phone, **{f: trip[f] for f in recent.FIELDS}, "note": "-",
+    })
+
+@dp.callback_query(F.data.startswith(recent.CB_REPEAT))
+async def cb_repeat(c: CallbackQuery, state: FSMContext):
+    await c.answer()
+    trip = recent.find(await get_recent_trips(c.from_user.id), key=c.data[len(recent.CB_REPEAT):])
+    await repeat_trip(c.message, c.from_user, state, trip)
+
+@dp.message(F.text.startswith(recent.REPEAT_PREFIX))
+async def msg_repeat(m: Message, state: FSMContext):
+    trip = recent.find(await get_recent_trips(m.from_user.id), text=m.text)
+    await repeat_trip(m, m.from_user, state, trip)
+
 @dp.message(Command("cancel"))
 async def cmd_cancel(m: Message, state: FSMContext):
     await state.clear()
@@ -428,7 +561,7 @@ async def cmd_cancel(m: Message, state: FSMContext):
 # --- phone choice ---
 @dp.message(F.text == "📞 Mening raqamim")
 async def use_my_phone(m: Message, state: FSMContext):
-    phone = get_user_phone(m.from_user.id)
+    phone = await get_user_phone(m.from_user.id)
     if not phone:
         await state.set_state(OrderForm.phone)
         await m.answer(PROMPT_PHONE_FORCE, reply_markup=kb_request_phone()); return
@@ -454,7 +587,7 @@ async def phone_from_contact(m: Message, state: FSMContext):
     if not is_valid_phone(ph):
         await m.answer("❗️ Telefon noto‘g‘ri. Qayta yuboring yoki qo‘lda yozing.",
                        reply_markup=kb_request_phone()); return
-    set_user_phone(m.from_user.id, ph)
+    await set_user_phone(m.from_user.id, ph)
     await state.update_data(phone=ph)
     await m.answer(PROMPT_ROUTE, reply_markup=kb_routes())
     await state.set_state(OrderForm.route_from)
@@ -467,26 +600,21 @@ async def phone_from_text(m: Message, state: FSMContext):
             "❗️ Telefon noto‘g‘ri. +99890XXXXXXX ko‘rinishida yozing yoki tugmadan foydalaning.",
             reply_markup=kb_request_phone()
         ); return
-    set_user_phone(m.from_user.id, ph)
+    await set_user_phone(m.from_user.id, ph)
     await state.update_data(phone=ph)
     await m.answer(PROMPT_ROUTE, reply_markup=kb_routes())
     await state.set_state(OrderForm.route_from)
 
 # --- route pair ---
-@dp.message(OrderForm.route_from)
-async def select_route_pair(m: Message, state: FSMContext):
-    txt = (m.text or "").strip()
-    if txt == BACK:
-        await m.answer("↩️ Menyu: /start yoki /new", reply_markup=ReplyKeyboardRemove())
-        await state.clear()
-        return
-    if txt not in (ROUTE_QQ_TO_T, ROUTE_T_TO_QQ):
-        await m.answer("❗️ Ro‘yxatdan tanlang.", reply_markup=kb_routes()); return
+async def route_back(m: Message, state: FSMContext):
+    await m.answer("↩️ Menyu: /start yoki /new", reply_markup=ReplyKeyboardRemove())
+    await state.clear()
 
-    if txt == ROUTE_QQ_TO_T:
-        from_city, to_city = "Қўқон", "Тошкент"
-    else:
-        from_city, to_city = "Тошкент", "Қўқон"
+async def route_pick(m: Message, state: FSMContext):
+    route = districts.route((m.text or "").strip())
+    if route is None:   # katalog shu orada almashgan
+        await m.answer("❗️ Ro‘yxatdan tanlang.", reply_markup=kb_routes()); return
+    from_city, to_city = route
 
     await state.update_data(
         route_from=from_city, route_to=to_city,
@@ -497,78 +625,265 @@ async def select_route_pair(m: Message, state: FSMContext):
     await render_from_page(m, state, delta=0)
     await state.set_state(OrderForm.from_district)
 
-# --- FROM district ---
-@dp.message(OrderForm.from_district)
-async def from_district_step(m: Message, state: FSMContext):
+@dp.message(OrderForm.route_from)
+async def select_route_pair(m: Message, state: FSMContext):
     txt = (m.text or "").strip()
-
     if txt == BACK:
-        await m.answer(PROMPT_ROUTE, reply_markup=kb_routes())
-        await state.set_state(OrderForm.route_from); return
-    if txt == NEXT: await render_from_page(m, state, delta=1); return
-    if txt == PREV: await render_from_page(m, state, delta=-1); return
-    if is_page_indicator(txt): return
+        await route_back(m, state); return
+    if districts.route(txt) is None:
+        await m.answer("❗️ Ro‘yxatdan tanlang.", reply_markup=kb_routes()); return
+    await route_pick(m, state)
+
+# --- FROM district ---
+async def from_back(m: Message, state: FSMContext):
+    await m.answer(PROMPT_ROUTE, reply_markup=kb_routes())
+    await state.set_state(OrderForm.route_from)
+
+async def from_next(m: Message, state: FSMContext):
+    await render_from_page(m, state, delta=1)
+
+async def from_prev(m: Message, state: FSMContext):
+    await render_from_page(m, state, delta=-1)
+
+async def from_list(m: Message, state: FSMContext):
+    await render_from_page(m, state, delta=0)
+
+async def page_indicator_noop(m: Message, state: FSMContext):
+    return
 
+async def from_pick(m: Message, state: FSMContext):
+    txt = (m.text or "").strip()
     data = await state.get_data()
+    if await route_gone(m, state, data):
+        return
     city = data.get("route_from")
     pick = extract_last_choice(txt) or txt
-    if pick not in districts_for_city(city):
-        await render_from_page(m, state, 0); return
+    if not districts.contains(city, pick):
+        pick = await resolve_typed_district(m, state, SIDE_FROM, city, pick)
+        if pick is None:
+            return
 
     await state.update_data(from_district=pick)
     await render_to_page(m, state, delta=0)
     await state.set_state(OrderForm.to_district)
 
-# --- TO district ---
-@dp.message(OrderForm.to_district)
-async def to_district_step(m: Message, state: FSMContext):
+@dp.message(OrderForm.from_district)
+async def from_district_step(m: Message, state: FSMContext):
     txt = (m.text or "").strip()
 
-    if txt == BACK:
-        await render_from_page(m, state, delta=0)
-        await state.set_state(OrderForm.from_district); return
-    if txt == NEXT: await render_to_page(m, state, delta=1); return
-    if txt == PREV: await render_to_page(m, state, delta=-1); return
+    if txt == BACK: await from_back(m, state); return
+    if txt == NEXT: await from_next(m, state); return
+    if txt == PREV: await from_prev(m, state); return
+    if txt == LIST: await from_list(m, state); return
     if is_page_indicator(txt): return
+    await from_pick(m, state)
+
+# --- TO district ---
+async def to_back(m: Message, state: FSMContext):
+    await render_from_page(m, state, delta=0)
+    await state.set_state(OrderForm.from_district)
+
+async def to_next(m: Message, state: FSMContext):
+    await render_to_page(m, state, delta=1)
+
+async def to_prev(m: Message, state: FSMContext):
+    await render_to_page(m, state, delta=-1)
 
+async def to_list(m: Message, state: FSMContext):
+    await render_to_page(m, state, delta=0)
+
+async def to_pick(m: Message, state: FSMContext):
+    txt = (m.text or "").strip()
     data = await state.get_data()
+    if await route_gone(m, state, data):
+        return
     city = data.get("route_to")
     pick = extract_last_choice(txt) or txt
-    if pick not in districts_for_city(city):
-        await render_to_page(m, state, 0); return
+    if not districts.contains(city, pick):
+        pick = await resolve_typed_district(m, state, SIDE_TO, city, pick)
+        if pick is None:
+            return
 
     await state.update_data(to_district=pick)
-    await m.answer("👥 Одам сонини танланг ёки «📦 Почта бор» ни босинг:", reply_markup=kb_choice())
+    await m.answer(PROMPT_CHOICE, reply_markup=kb_choice())
     await state.set_state(OrderForm.choice)
 
-# --- people / cargo ---
-@dp.message(OrderForm.choice)
-async def choice_step(m: Message, state: FSMContext):
+@dp.message(OrderForm.to_district)
+async def to_district_step(m: Message, state: FSMContext):
     txt = (m.text or "").strip()
-    if txt == BACK:
-        await render_to_page(m, state, delta=0); await state.set_state(OrderForm.to_district); return
 
-    if looks_like_cargo_only(txt):
-        await state.update_data(people=0, cargo="Бор"); await finalize(m, state); return
+    if txt == BACK: await to_back(m, state); return
+    if txt == NEXT: await to_next(m, state); return
+    if txt == PREV: await to_prev(m, state); return
+    if txt == LIST: await to_list(m, state); return
+    if is_page_indicator(txt): return
+    await to_pick(m, state)
+
+# --- inline hudud tanlovi (DISTRICT_UI=inline) ---
+@dp.callback_query(F.data == CB_NOOP)
+async def cb_district_noop(c: CallbackQuery):
+    await c.answer()
 
-    p = people_to_int(txt)
+@dp.callback_query(F.data.startswith((f"{CB_PAGE}:", f"{CB_PICK}:", f"{CB_BACK}:")))
+async def cb_district(c: CallbackQuery, state: FSMContext):
+    parsed = parse_callback(c.data)
+    side = parsed[1] if parsed else None
+    expected = OrderForm.from_district.state if side == SIDE_FROM else OrderForm.to_district.state
+    if parsed is None or c.message is None or await state.get_state() != expected:
+        await c.answer("⌛️ Бу тугма эскирган."); return
+    kind, _, ci, n, ver = parsed
+    data = await state.get_data()
+    city = data.get("route_from" if side == SIDE_FROM else "route_to")
+    cd = districts.city_at(ci)
+    if kind != CB_BACK and (cd is None or cd.name != city):
+        await c.answer("⌛️ Бу тугма эскирган."); return
+    uid = c.from_user.id
+
+    if kind == CB_PAGE:
+        page = districts.clamp_page(city, n)
+        await state.update_data(**{"from_page" if side == SIDE_FROM else "to_page": page})
+        await edit_or_send(c.message, None, await district_markup(uid, side, city, page))
+    elif kind == CB_PICK:
+        if ver and ver != districts.version:
+            # Katalog almashgan: indeks boshqa hududga tushishi mumkin — yangi ro'yxatni ko'rsatamiz
+            page = districts.clamp_page(city, int(data.get("from_page" if side == SIDE_FROM else "to_page", 1)))
+            await edit_or_send(c.message, None, await district_markup(uid, side, city, page))
+            await c.answer("🔄 Рўйхат янгиланди, қайта танланг."); return
+        if not 0 <= n < len(cd.items):
+            await c.answer("⌛️ Бу тугма эскирган."); return
+        pick = cd.items[n]
+        if side == SIDE_FROM:
+            to_city = data.get("route_to")
+            page = districts.clamp_page(to_city, int(data.get("to_page", 1)))
+            await state.update_data(from_district=pick, to_page=page)
+            await state.set_state(OrderForm.to_district)
+            await edit_or_send(c.message, f"✅ {city} ({pick})\n{district_prompt(SIDE_TO, to_city)}",
+                               await district_markup(uid, SIDE_TO, to_city, page))
+        else:
+            await state.update_data(to_district=pick)
+            await state.set_state(OrderForm.choice)
+            await edit_or_send(c.message, f"✅ {data.get('route_from')} ({data.get('from_district')}) → {city} ({pick})")
+            await c.message.answer(PROMPT_CHOICE, reply_markup=kb_choice())
+    elif side == SIDE_FROM:
+        await state.set_state(OrderForm.route_from)
+        await c.message.answer(PROMPT_ROUTE, reply_markup=kb_routes())
+    else:
+        from_city = data.get("route_from")
+        page = districts.clamp_page(from_city, int(data.get("from_page", 1)))
+        await state.set_state(OrderForm.from_district)
+        await edit_or_send(c.message, district_prompt(SIDE_FROM, from_city),
+                           await district_markup(uid, SIDE_FROM, from_city, page))
+    await c.answer()
+
+# --- people / cargo ---
+async def choice_back(m: Message, state: FSMContext):
+    await render_to_page(m, state, delta=0); await state.set_state(OrderForm.to_district)
+
+async def choice_cargo(m: Message, state: FSMContext):
+    await state.update_data(people=0, cargo="Бор"); await finalize(m, state)
+
+async def choice_people(m: Message, state: FSMContext):
+    p = people_to_int((m.text or "").strip())
     if p is None:
         await m.answer("❗️ 1,2,3,4,5+ ёки «📦 Почта бор».", reply_markup=kb_choice()); return
 
     await state.update_data(people=p)
     await finalize(m, state)
 
+@dp.message(OrderForm.choice)
+async def choice_step(m: Message, state: FSMContext):
+    txt = (m.text or "").strip()
+    if txt == BACK:
+        await choice_back(m, state); return
+    if looks_like_cargo_only(txt):
+        await choice_cargo(m, state); return
+    await choice_people(m, state)
+
+# --- fast path jadvali: aniq tugma matnlari ---
+fast.add(ANY_STATE, ["📞 Mening raqamim"], use_my_phone)
+fast.add(ANY_STATE, ["👤 Boshqa odam uchun"], other_person_phone)
+fast.add(OrderForm.phone, [BACK], phone_back_to_menu)
+fast.add(OrderForm.route_from, [BACK], route_back)
+fast.add(OrderForm.from_district, [BACK], from_back)
+fast.add(OrderForm.from_district, [NEXT], from_next)
+fast.add(OrderForm.from_district, [PREV], from_prev)
+fast.add(OrderForm.from_district, [LIST], from_list)
+fast.add(OrderForm.to_district, [BACK], to_back)
+fast.add(OrderForm.to_district, [NEXT], to_next)
+fast.add(OrderForm.to_district, [PREV], to_prev)
+fast.add(OrderForm.to_district, [LIST], to_list)
+fast.add(OrderForm.choice, [BACK], choice_back)
+fast.add(OrderForm.choice, ["📦 Почта бор"], choice_cargo)
+fast.add(OrderForm.choice, ["1", "2", "3", "4", "5+"], choice_people)
+
+# Katalogga bog'liq yozuvlar — katalog almashganda shu ro'yxat qayta quriladi
+CATALOG_HANDLERS = (route_pick, page_indicator_noop, from_pick, to_pick)
+
+def catalog_routes(cat: DistrictCatalog):
+    return [
+        (OrderForm.route_from, cat.route_labels(), route_pick),
+        (OrderForm.from_district, cat.page_labels(), page_indicator_noop),
+        (OrderForm.from_district, cat.all_names(), from_pick),
+        (OrderForm.to_district, cat.page_labels(), page_indicator_noop),
+        (OrderForm.to_district, cat.all_names(), to_pick),
+    ]
+
+fast.rebind(CATALOG_HANDLERS, catalog_routes(districts))
+
+# ================= CATALOG RELOAD =================
+def apply_catalog(cat: DistrictCatalog):
+    """Yangi katalogni o'rnatadi. Handler'lar `districts`ni har chaqiruvda o'qiydi, shuning
+    uchun almashtirish — bitta o'zlashtirish; FSM'dagi shahar/hudud nomlari o'z joyida qoladi."""
+    global districts
+    fast.rebind(CATALOG_HANDLERS, catalog_routes(cat))
+    if THROTTLE:
+        throttle.page_texts = frozenset((NEXT, PREV, *cat.page_labels(), CB_PAGE))
+    districts = cat
+
+async def reload_catalog() -> bool:
+    """Faylni executor'da o'qib quradi; o'zgargan bo'lsa almashtiradi. Xato fayl —
+    ValueError/OSError, eski katalog ishlashda davom etadi."""
+    try:
+        cat = await asyncio.get_running_loop().run_in_executor(
+            None, partial(load_catalog, CATALOG_PATH, **CATALOG_UI))
+    except (OSError, ValueError):
+        metrics.CATALOG_RELOADS.inc("error")
+        raise
+    if cat.version == districts.version:
+        metrics.CATALOG_RELOADS.inc("unchanged")
+        return False
+    apply_catalog(cat)
+    metrics.CATALOG_RELOADS.inc("applied")
+    log.info("[CATALOG] v%s: %d cities, %d routes", cat.version, len(cat.cities()), len(cat.routes))
+    return True
+
+def _file_stamp(path: str):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+async def catalog_watch(interval: float):
+    """Fayl o'zgarishini kuzatadi (mtime/hajm). Yarim yozilgan fayl xato beradi va keyingi
+    o'zgarishda qayta o'qiladi — faylni rename orqali atomar almashtirish tavsiya etiladi."""
+    last = _file_stamp(CATALOG_PATH)
+    while True:
+        await asyncio.sleep(interval)
+        stamp = _file_stamp(CATALOG_PATH)
+        if stamp == last or stamp is None:
+            continue
+        last = stamp
+        try:
+            await reload_catalog()
+        except (OSError, ValueError) as e:
+            log.error("[CATALOG] reload failed, keeping v%s: %s", districts.version, e)
+
 # ================= PUBLIC COMMANDS =================
 @dp.message(Command("stats"))
 async def cmd_stats(m: Message):
     try:
-        with closing(sqlite3.connect(DB_PATH)) as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM users")
-            total = cur.fetchone()[0]
-            now = int(time.time()); start_of_day = now - (now % 86400)
-            cur.execute("SELECT COUNT(*) FROM users WHERE joined_at >= ?", (start_of_day,))
-            today = cur.fetchone()[0]
+        total, today = await db.summary(tashkent_day())
         await m.answer(f"📊 Bot статистикаси:\n👥 Umumiy: {total} ta\n🆕 Bugun: {today} ta")
     except Exception as e:
         log.exception("[STATS] failed: %s", e)
@@ -591,48 +906,278 @@ async def cmd_broadcast(m: Message):
     text = m.text.partition(" ")[2].strip()
     if not text:
         await m.answer("Foydalanish: `/broadcast matn`", parse_mode=ParseMode.MARKDOWN); return
-    sent = fail = 0
-    for uid in all_user_ids():
-        try:
-            await bot.send_message(uid, text); sent += 1
-        except Exception:
-            fail += 1
-    await m.answer(f"Yuborildi: {sent}  |  Xato: {fail}")
+    bid = await broadcaster.start(text, status_chat_id=m.chat.id)
+    log.info("[BROADCAST] #%s started by %s", bid, m.from_user.id)
 
 @dp.message(Command("announce"))
 async def cmd_announce(m: Message):
     if not _is_admin(m.from_user.id): return
-    text = ANNOUNCE_TEXT
-    sent = fail = 0
-    for uid in all_user_ids():
+    bid = await broadcaster.start(ANNOUNCE_TEXT, status_chat_id=m.chat.id)
+    log.info("[ANNOUNCE] #%s started by %s", bid, m.from_user.id)
+
+@dp.callback_query(F.data.startswith(CLAIM_PREFIX))
+async def cb_claim(c: CallbackQuery):
+    if outbox is None or c.message is None or c.message.chat.id != outbox.chat_id:
+        await c.answer(); return
+    oid = c.data[len(CLAIM_PREFIX):]
+    if not oid.isdigit():
+        await c.answer(); return
+    who = c.from_user.full_name
+    ok, holder = await outbox.claim(int(oid), c.from_user.id, who)
+    if not ok:
+        await c.answer(f"#{oid} аллақачон олинган: {holder or '-'}", show_alert=True); return
+    await c.answer(f"✅ #{oid} сизга бириктирилди")
+    try:
+        await c.message.edit_reply_markup(reply_markup=mark_claimed(c.message.reply_markup, int(oid), who))
+    except Exception as e:
+        log.warning("[OUTBOX] claim markup edit failed: %s", e)
+
+# ================= DRIVERS =================
+def trip_usage() -> str:
+    routes = ", ".join(f"{i} — {route_label(*r)}" for i, r in enumerate(districts.routes, start=1))
+    return (
+        "Фойдаланиш: /trip <йўналиш> <ўрин> <СС:ДД> [ҳудуд] [pochta]\n"
+        f"йўналиш: {routes}\n"
+        "Мисол: /trip 1 4 14:30 Химик pochta\n"
+        "/trip off — рейсни ёпиш"
+    )
+
+@dp.message(Command("driver"))
+async def cmd_driver(m: Message):
+    if not _is_admin(m.from_user.id): return
+    args = m.text.split()[1:]
+    if not args or not args[0].isdigit():
+        await m.answer("Foydalanish: /driver <tg_user_id> [off]", parse_mode=None); return
+    approved = not (len(args) > 1 and args[1].lower() == "off")
+    await matcher.set_driver(int(args[0]), approved)
+    await m.answer(f"🚗 {args[0]}: {'tasdiqlandi' if approved else 'o‘chirildi'}", parse_mode=None)
+
+@dp.message(Command("trip"))
+async def cmd_trip(m: Message):
+    uid = m.from_user.id
+    if not await matcher.is_driver(uid):
+        await m.answer("❗️ Siz haydovchi sifatida ro‘yxatdan o‘tmagansiz."); return
+    args = m.text.split()[1:]
+    if not args:
+        cur = matcher.current_trip(uid)
+        await m.answer((format_trip(cur) + "\n\n" if cur else "") + trip_usage(), parse_mode=None); return
+    if args[0].lower() in ("off", "stop"):
+        closed = await matcher.close_trips(uid)
+        await m.answer("✅ Рейс ёпилди." if closed else "Очиқ рейс йўқ."); return
+    cargo = args[-1].lower() in ("pochta", "почта")
+    if cargo:
+        args = args[:-1]
+    route = districts.route_at(args[0]) if args else None
+    seats = int(args[1]) if len(args) > 1 and args[1].isdigit() else None
+    depart = parse_depart(args[2]) if len(args) > 2 else None
+    district = " ".join(args[3:]) or None
+    if route is None or seats is None or not 0 <= seats <= 8 or depart is None or (seats == 0 and not cargo):
+        await m.answer(trip_usage(), parse_mode=None); return
+    if district is not None and not districts.contains(route[0], district):
+        await m.answer(f"❗️ {route[0]} да «{district}» ҳудуди йўқ.", parse_mode=None); return
+    t = await matcher.open_trip(uid, m.from_user.full_name, await get_user_phone(uid),
+                                route[0], route[1], district, depart, seats, cargo)
+    await m.answer(format_trip(t) + "\n\nМос буюртмалар келганда таклиф юборамиз.", parse_mode=None)
+
+@dp.callback_query(F.data.startswith(TAKE_PREFIX))
+async def cb_take(c: CallbackQuery):
+    oid, _, tid = c.data[len(TAKE_PREFIX):].partition(":")
+    if not (oid.isdigit() and tid.isdigit()):
+        await c.answer(); return
+    order, trip, reason = await matcher.accept(int(oid), int(tid), c.from_user.id, c.from_user.full_name)
+    if order is None:
+        text = {"taken": "Бу буюртмани бошқа ҳайдовчи олди.", "full": "Рейсингизда жой етарли эмас.",
+                "closed": "Рейсингиз ёпилган."}.get(reason, "Буюртма топилмади.")
+        await c.answer(text, show_alert=True)
+        return
+    await c.answer("✅ Буюртма сизга бириктирилди")
+    try:
+        await c.message.edit_text(
+            f"{c.message.text}\n\n✅ Сиз олдингиз. 📞 Мижоз: {order.get('phone')}", parse_mode=None)
+    except Exception as e:
+        log.warning("[MATCH] offer edit failed: %s", e)
+    for chat_id, msg_id in matcher.other_offers(order["id"], c.from_user.id):
         try:
-            await bot.send_message(uid, text); sent += 1
+            await bot.edit_message_reply_markup(chat_id=chat_id, message_id=msg_id, reply_markup=None)
         except Exception:
-            fail += 1
-    await m.answer(f"ANNOUNCE yuborildi: {sent}  |  Xato: {fail}")
+            pass
+    depart = f", ⏰ {fmt_time(trip.depart_at)}" if trip else ""
+    phone = trip.phone if trip and trip.phone else "-"
+    try:
+        await bot.send_message(order["tg_user_id"],
+                               f"🚖 Ҳайдовчи топилди: {c.from_user.full_name}, 📞 {phone}{depart}", parse_mode=None)
+    except Exception as e:
+        log.warning("[MATCH] customer notify #%s failed: %s", order["id"], e)
 
-# ================= RUN =================
-async def main():
-    # Webhook ↔ Polling konflikti bo‘lmasligi uchun webhookni o‘chirib qo‘yamiz:
+@dp.message(Command("catalog"))
+async def cmd_catalog(m: Message):
+    if not _is_admin(m.from_user.id): return
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
-    except Exception:
-        pass
+        changed = await reload_catalog()
+    except (OSError, ValueError) as e:
+        await m.answer(f"❗️ Katalog yuklanmadi, v{districts.version} qoldi:\n{e}", parse_mode=None); return
+    cities = ", ".join(f"{c} ({len(districts.districts(c))})" for c in districts.cities())
+    head = "✅ Katalog yangilandi" if changed else "Katalog o‘zgarmagan"
+    await m.answer(f"{head}: v{districts.version}\n🏙 {cities}\n🚖 {len(districts.routes)} yo‘nalish", parse_mode=None)
+
+@dp.message(Command("report"))
+async def cmd_report(m: Message):
+    if not _is_admin(m.from_user.id): return
+    arg = m.text.partition(" ")[2].strip()
+    days = int(arg) if arg.isdigit() else 7
+    days = max(1, min(days, 366))
+    # Hisobot snapshot'dan o'qiladi — write yo'li va db pul'i bilan raqobatlashmaydi
+    src = archive.read_source(DB_PATH, SNAPSHOT_PATH, ARCHIVE_DIR)
+    try:
+        rows = await asyncio.get_running_loop().run_in_executor(
+            None, archive.read_with, src, read_range, tashkent_day(time.time() - (days - 1) * 86400))
+        text = format_report(rows) if rows else "Ma'lumot yo'q."
+        if src != DB_PATH:
+            text += f"\n\n🕒 Snapshot: {time.strftime('%d.%m %H:%M', time.gmtime(os.path.getmtime(src) + TASHKENT_UTC_OFFSET))}"
+        await m.answer(text, parse_mode=None)
+    except Exception as e:
+        log.exception("[REPORT] failed: %s", e)
+        await m.answer("❗️ Hisobot vaqtincha mavjud emas.")
 
-    await setup_commands()
+EXPORT_MAX_BYTES = 49 * 1024 * 1024   # Bot API hujjat yuklash limiti ~50 MB
+
+@dp.message(Command("export"))
+async def cmd_export(m: Message):
+    if not _is_admin(m.from_user.id): return
+    # /export [orders|users] [YYYY-MM-DD] [YYYY-MM-DD] [csv|parquet]
+    args = m.text.split()[1:]
+    table = args.pop(0) if args and args[0] in export.TABLES else "orders"
+    fmt = args.pop() if args and args[-1] in ("csv", "parquet") else "csv"
+    until = args[1] if len(args) > 1 else tashkent_day()
+    since = args[0] if args else tashkent_day(time.time() - 29 * 86400)
+    try:
+        export.day_start(since); export.day_start(until)
+    except ValueError:
+        await m.answer("Foydalanish: /export [orders|users] [YYYY-MM-DD] [YYYY-MM-DD] [csv|parquet]",
+                       parse_mode=None); return
+    if fmt not in export.FORMATS:
+        await m.answer("❗️ Parquet uchun serverda pyarrow o‘rnatilmagan — csv ishlating.", parse_mode=None); return
+    path = os.path.join(os.path.dirname(DB_PATH), f".{export.default_name(table, since, until, fmt)}")
+    src = archive.read_source(DB_PATH, SNAPSHOT_PATH, ARCHIVE_DIR)
+    archives = archive.archive_paths(ARCHIVE_DIR, export.day_start(since), export.day_start(until) + 86400)
+    try:
+        _, n = await asyncio.get_running_loop().run_in_executor(
+            None, partial(export.export, src, table, since, until, fmt, path, archives=archives))
+        if os.path.getsize(path) > EXPORT_MAX_BYTES:
+            await m.answer(f"❗️ Fayl juda katta ({n} qator). Serverda: python export.py {table} "
+                           f"--since {since} --until {until}", parse_mode=None); return
+        await m.answer_document(FSInputFile(path, filename=export.default_name(table, since, until, fmt)),
+                                caption=f"{table}: {since} … {until}, {n} qator", parse_mode=None)
+    except Exception as e:
+        log.exception("[EXPORT] failed: %s", e)
+        await m.answer("❗️ Eksport vaqtincha mavjud emas.")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+# ================= RUN =================
+async def on_startup(leader: bool = True, serve_metrics: bool = True):
+    """Birinchi yangilanishgacha faqat zarur ishlar; buyruqlar va e'lon — fon vazifalari."""
+    _background.append(asyncio.create_task(metrics.loop_lag_monitor(), name="loop-lag"))
+    await db.start()
+    startup_mark("db_ready")
+    if CATALOG_WATCH > 0:   # har worker o'z katalogini kuzatadi
+        _background.append(asyncio.create_task(catalog_watch(CATALOG_WATCH), name="catalog-watch"))
+    await matcher.load()
+    matcher.start()   # har worker o'z indeksini yangilab turadi
+    if serve_metrics and METRICS_PORT:
+        _background.append(asyncio.create_task(
+            metrics.serve_metrics(METRICS_HOST, METRICS_PORT), name="metrics-http"))
+
+    # leader=False — webhook rejimidagi qo'shimcha worker'lar: umumiy ishlarni takrorlamaydi
+    if not leader:
+        startup_mark("ready")
+        return
+    _background.append(asyncio.create_task(setup_commands(), name="set-commands"))
+
+    maintenance.start()
+
+    # Restartgacha tugamagan broadcast'lar cursor'dan davom etadi
+    await broadcaster.resume()
+    # Restartgacha yuborilmagan operator xabarlari ham shu yerdan davom etadi
+    if outbox is not None:
+        outbox.start()
+        outbox.wake()
 
     if AUTO_ANNOUNCE == "1":
+        _background.append(asyncio.create_task(auto_announce(), name="auto-announce"))
+    startup_mark("ready")
+
+async def on_shutdown(timeout: float = DRAIN_TIMEOUT, leader: bool = True):
+    """Yangi yangilanishlar allaqachon to'xtatilgan bo'lishi kerak (polling: UpdatePoller.drain,
+    webhook: uvicorn). Tartib: finalize'dan keyingi fon ishlari `timeout` gacha kutiladi ->
+    write-behind navbati bazaga -> operator xabarlari qolgan vaqt ichida yetkaziladi.
+    Qolgan pending qatorlarni faqat leader yetkazadi (on_startup'dagi kabi); boshqa worker'lar
+    faqat o'z bir martalik drain'ini to'xtatadi — olingan qatorlarni lease tugagach leader oladi."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    for t in _background:
+        t.cancel()
+    await asyncio.gather(*_background, return_exceptions=True)
+    _background.clear()
+    if _inflight:
+        _, pending = await asyncio.wait(set(_inflight), timeout=max(0.0, deadline - loop.time()))
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if pending:
+            log.error("[SHUTDOWN] %d background jobs cancelled at deadline", len(pending))
+    await matcher.stop()
+    await maintenance.stop()
+    await broadcaster.stop()   # cursor saqlanadi, restartda davom etadi
+    await wb.stop()            # navbatdagi buyurtmalar (va ularning outbox qatorlari) bazaga
+    if outbox is not None:
+        await outbox.stop()
+    if outbox is not None and leader:
+        left = deadline - loop.time()
+        if left > 0:
+            try:
+                await asyncio.wait_for(outbox.drain(), left)
+            except asyncio.TimeoutError:
+                log.warning("[SHUTDOWN] outbox not drained, will resume on start")
+            except Exception as e:
+                log.exception("[SHUTDOWN] outbox drain failed: %s", e)
+    db.close()
+
+async def drop_webhook():
+    # Webhook ↔ Polling konflikti bo‘lmasligi uchun webhookni o‘chirib qo‘yamiz. Navbatdagi
+    # yangilanishlar TASHLANMAYDI: restart paytida kelgan buyurtmalar ham ishlanadi.
+    try:
+        await bot.delete_webhook(drop_pending_updates=False)
+    except Exception as e:
+        log.warning("[POLL] delete_webhook failed: %s", e)
+
+async def main():
+    # Tarmoq (delete_webhook) va baza (migratsiyalar, drift) parallel
+    await asyncio.gather(drop_webhook(), on_startup())
+    await dp.emit_startup(bot=bot)
+
+    # Polling rejimi; webhook uchun: uvicorn webhook:app
+    poller = UpdatePoller(dp, bot, ALLOWED_UPDATES)
+    metrics.gauge("bot_updates_in_flight", "Updates being handled by the poller",
+                  lambda: {(): float(poller.in_flight())})
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, poller.stop)
+    startup_mark("polling")
+    try:
+        await poller.run()
+    finally:
+        started = loop.time()
+        await poller.drain(DRAIN_TIMEOUT)
         try:
-            for uid in all_user_ids():
-                try:
-                    await bot.send_message(uid, ANNOUNCE_TEXT)
-                except Exception:
-                    pass
-        except Exception as e:
-            log.exception("[AUTO_ANNOUNCE] failed: %s", e)
-
-    # Faqat polling ishlatiladi
-    await dp.start_polling(bot, allowed_updates=["message", "callback_query"])
+            await dp.emit_shutdown(bot=bot)   # FSM storage — handler'lar tugagach yopiladi
+        finally:
+            await on_shutdown(max(1.0, DRAIN_TIMEOUT - (loop.time() - started)))
+            await bot.session.close()
+
+startup_mark("imported")   # handler'lar ro'yxatdan o'tdi
 
 if __name__ == "__main__":
     asyncio.run(main())
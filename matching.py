@@ -0,0 +1,364 @@
+# matching.py — haydovchi reyslari va buyurtmalarni moslash: xotiradagi indeks + DB'da atomar biriktirish
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from db import Database
+from stats import TASHKENT_UTC_OFFSET
+from transport import prioritized, NOTIFY
+
+log = logging.getLogger("davon-taksi-bot.matching")
+
+MATCH_BUCKET  = int(os.getenv("MATCH_BUCKET", "1800"))     # vaqt savati, s
+MATCH_HORIZON = int(os.getenv("MATCH_HORIZON", "10800"))   # shuncha s ichida jo'naydigan reyslar
+MATCH_GRACE   = int(os.getenv("MATCH_GRACE", "900"))       # jo'nash vaqtidan keyin ham shuncha s ko'rinadi
+MATCH_OFFERS  = int(os.getenv("MATCH_OFFERS", "3"))        # buyurtma nechta haydovchiga taklif qilinadi
+MATCH_REFRESH = float(os.getenv("MATCH_REFRESH", "15"))    # indeksni bazadan qayta qurish oralig'i, s
+GRID_CELL     = 0.02           # ~2 km; koordinatali reys/buyurtmalar uchun panjara
+ANY_DISTRICT  = "*"
+TAKE_PREFIX   = "take:"
+
+IndexKey = Tuple[str, str, str, int]
+CellKey  = Tuple[str, str, int, int]
+
+
+class Trip:
+    __slots__ = ("id", "driver_id", "full_name", "phone", "route_from", "route_to", "district",
+                 "depart_at", "seats", "seats_left", "cargo", "lat", "lng")
+
+    def __init__(self, id: int, driver_id: int, full_name: Optional[str], phone: Optional[str],
+                 route_from: str, route_to: str, district: Optional[str], depart_at: int,
+                 seats: int, seats_left: int, cargo: bool,
+                 lat: Optional[float] = None, lng: Optional[float] = None):
+        self.id = id
+        self.driver_id = driver_id
+        self.full_name = full_name
+        self.phone = phone
+        self.route_from = route_from
+        self.route_to = route_to
+        self.district = district or ANY_DISTRICT
+        self.depart_at = depart_at
+        self.seats = seats
+        self.seats_left = seats_left
+        self.cargo = bool(cargo)
+        self.lat = lat
+        self.lng = lng
+
+    def fits(self, people: int) -> bool:
+        return self.seats_left >= people if people > 0 else self.cargo
+
+
+def _cell(lat: float, lng: float) -> Tuple[int, int]:
+    return int(lat // GRID_CELL), int(lng // GRID_CELL)
+
+
+class MatchIndex:
+    """(yo'nalish, hudud, vaqt savati) -> reyslar. Koordinatasi bor reyslar qo'shimcha
+    ravishda GRID_CELL panjarasida. Qidiruv — bir necha o'nlab dict o'qish, DB'siz.
+
+    Tanlov tartibi: mos hudud, so'ng "best fit" (o'rni kamroq qolgan mashina birinchi
+    to'ladi), so'ng eng yaqin jo'nash vaqti."""
+
+    def __init__(self, bucket: int = MATCH_BUCKET, horizon: int = MATCH_HORIZON, grace: int = MATCH_GRACE):
+        self.bucket = max(60, bucket)
+        self.horizon = horizon
+        self.grace = grace
+        self.trips: Dict[int, Trip] = {}
+        self._by_key: Dict[IndexKey, Set[int]] = {}
+        self._by_cell: Dict[CellKey, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.trips)
+
+    # ---------- write ----------
+    def _keys(self, t: Trip) -> Tuple[IndexKey, Optional[CellKey]]:
+        key = (t.route_from, t.route_to, t.district, t.depart_at // self.bucket)
+        cell = (t.route_from, t.route_to, *_cell(t.lat, t.lng)) if t.lat is not None and t.lng is not None else None
+        return key, cell
+
+    def add(self, t: Trip):
+        self.remove(t.id)
+        self.trips[t.id] = t
+        key, cell = self._keys(t)
+        self._by_key.setdefault(key, set()).add(t.id)
+        if cell is not None:
+            self._by_cell.setdefault(cell, set()).add(t.id)
+
+    def remove(self, trip_id: int) -> Optional[Trip]:
+        t = self.trips.pop(trip_id, None)
+        if t is None:
+            return None
+        key, cell = self._keys(t)
+        for idx, k in ((self._by_key, key), (self._by_cell, cell)):
+            ids = idx.get(k) if k is not None else None
+            if ids is not None:
+                ids.discard(trip_id)
+                if not ids:
+                    del idx[k]
+        return t
+
+    def take_seats(self, trip_id: int, seats_left: int):
+        t = self.trips.get(trip_id)
+        if t is None:
+            return
+        t.seats_left = seats_left
+        if seats_left <= 0 and not t.cargo:
+            self.remove(trip_id)
+
+    def prune(self, now: float) -> int:
+        old = [t.id for t in self.trips.values() if t.depart_at < now - self.grace]
+        for tid in old:
+            self.remove(tid)
+        return len(old)
+
+    # ---------- read ----------
+    def candidates(self, route_from: str, route_to: str, district: Optional[str], people: int,
+                   now: float, lat: Optional[float] = None, lng: Optional[float] = None,
+                   limit: int = MATCH_OFFERS) -> List[Trip]:
+        lo, hi = now - self.grace, now + self.horizon
+        ids: Set[int] = set()
+        for b in range(int(lo) // self.bucket, int(hi) // self.bucket + 1):
+            for d in (district, ANY_DISTRICT):
+                found = self._by_key.get((route_from, route_to, d, b))
+                if found:
+                    ids |= found
+        if lat is not None and lng is not None:
+            cx, cy = _cell(lat, lng)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    found = self._by_cell.get((route_from, route_to, cx + dx, cy + dy))
+                    if found:
+                        ids |= found
+        best = []
+        for tid in ids:
+            t = self.trips[tid]
+            if not (lo <= t.depart_at <= hi) or not t.fits(people):
+                continue
+            best.append((t.district != district, t.seats_left - people, abs(t.depart_at - now), t.id, t))
+        best.sort(key=lambda x: x[:4])
+        return [x[-1] for x in best[:limit]]
+
+
+# ================= FORMAT / PARSE =================
+def parse_depart(hhmm: str, now: Optional[float] = None, grace: int = MATCH_GRACE) -> Optional[int]:
+    """"14:30" (Toshkent vaqti) -> eng yaqin kelgusi unix vaqt."""
+    h, sep, m = hhmm.partition(":")
+    if not sep or not (h.isdigit() and m.isdigit()) or int(h) > 23 or int(m) > 59:
+        return None
+    now = time.time() if now is None else now
+    local = now + TASHKENT_UTC_OFFSET
+    ts = int(local - local % 86400 + int(h) * 3600 + int(m) * 60 - TASHKENT_UTC_OFFSET)
+    return ts + 86400 if ts < now - grace else ts
+
+def fmt_time(ts: int) -> str:
+    return time.strftime("%H:%M", time.gmtime(ts + TASHKENT_UTC_OFFSET))
+
+def format_trip(t: Trip) -> str:
+    where = "исталган ҳудуд" if t.district == ANY_DISTRICT else t.district
+    return (f"🚗 Рейс #{t.id}: {t.route_from} ({where}) → {t.route_to}, ⏰ {fmt_time(t.depart_at)}\n"
+            f"💺 Бўш ўрин: {t.seats_left}/{t.seats}  📦 Почта: {'ҳа' if t.cargo else 'йўқ'}")
+
+def format_offer(o: Dict[str, Any], t: Trip) -> str:
+    return (f"🆕 Буюртма #{o['id']}\n"
+            f"🚖 {o.get('route_from')} ({o.get('from_district')}) → {o.get('route_to')} ({o.get('to_district')})\n"
+            f"👥 Одам: {o.get('people')}  📦 Почта: {o.get('cargo') or 'Йўқ'}\n"
+            f"Рейсингиз #{t.id}: ⏰ {fmt_time(t.depart_at)}, бўш ўрин {t.seats_left}")
+
+
+class DriverMatcher:
+    """Reyslar DB'da (driver_trips), qidiruv esa MatchIndex'da. Har worker indeksni
+    MATCH_REFRESH da bazadan qayta quradi — biriktirish baribir DB tranzaksiyasida
+    tekshiriladi, shuning uchun eskirgan indeks faqat taklif ro'yxatiga ta'sir qiladi."""
+
+    def __init__(self, bot: Bot, db: Database, offers: int = MATCH_OFFERS, refresh: float = MATCH_REFRESH):
+        self.bot = bot
+        self.db = db
+        self.offers = max(1, offers)
+        self.refresh = max(1.0, refresh)
+        self.index = MatchIndex()
+        self._sent: "OrderedDict[int, List[Tuple[int, int]]]" = OrderedDict()   # order -> [(chat, msg)]
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- lifecycle ----------
+    async def load(self):
+        rows = await self.db.run(_open_trips, int(time.time()) - MATCH_GRACE)
+        index = MatchIndex(self.index.bucket, self.index.horizon, self.index.grace)
+        for r in rows:
+            index.add(Trip(*r))
+        self.index = index   # butunlay almashtiriladi — yarim qurilgan indeks ko'rinmaydi
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop(), name="match-refresh")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.load()
+            except Exception as e:
+                log.warning("[MATCH] refresh failed: %s", e)
+            await asyncio.sleep(self.refresh)
+
+    # ---------- drivers ----------
+    async def is_driver(self, uid: int) -> bool:
+        return await self.db.run(_is_driver, uid)
+
+    async def set_driver(self, uid: int, approved: bool) -> None:
+        closed = await self.db.run(_set_driver, uid, approved, int(time.time()))
+        for tid in closed:
+            self.index.remove(tid)
+
+    async def open_trip(self, driver_id: int, full_name: str, phone: Optional[str], route_from: str,
+                        route_to: str, district: Optional[str], depart_at: int, seats: int,
+                        cargo: bool) -> Trip:
+        """Haydovchining oldingi ochiq reysi yopiladi — bir vaqtda bitta reys."""
+        tid, closed = await self.db.run(_create_trip, driver_id, full_name, phone, route_from, route_to,
+                                        district, depart_at, seats, int(cargo), int(time.time()))
+        for old in closed:
+            self.index.remove(old)
+        t = Trip(tid, driver_id, full_name, phone, route_from, route_to, district, depart_at, seats, seats, cargo)
+        self.index.add(t)
+        return t
+
+    async def close_trips(self, driver_id: int) -> List[int]:
+        closed = await self.db.run(_close_trips, driver_id)
+        for tid in closed:
+            self.index.remove(tid)
+        return closed
+
+    def current_trip(self, driver_id: int) -> Optional[Trip]:
+        return next((t for t in self.index.trips.values() if t.driver_id == driver_id), None)
+
+    # ---------- orders ----------
+    @prioritized(NOTIFY)
+    async def offer(self, order: Dict[str, Any]) -> List[int]:
+        """Eng mos MATCH_OFFERS ta haydovchiga "Оламан" tugmasi bilan taklif yuboradi."""
+        now = time.time()
+        self.index.prune(now)
+        people = int(order.get("people") or 0)
+        found = self.index.candidates(order.get("route_from"), order.get("route_to"),
+                                      order.get("from_district"), people, now,
+                                      order.get("from_lat"), order.get("from_lng"), limit=self.offers)
+        sent = []
+        for t in found:
+            if t.driver_id == order.get("tg_user_id"):
+                continue
+            kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(
+                text="✅ Оламан", callback_data=f"{TAKE_PREFIX}{order['id']}:{t.id}")]])
+            try:
+                msg = await self.bot.send_message(t.driver_id, format_offer(order, t), reply_markup=kb, parse_mode=None)
+                sent.append((t.driver_id, msg.message_id))
+            except Exception as e:
+                log.warning("[MATCH] offer #%s to %s failed: %s", order["id"], t.driver_id, e)
+        if sent:
+            self._sent[order["id"]] = sent
+            while len(self._sent) > 1000:
+                self._sent.popitem(last=False)
+        return [c for c, _ in sent]
+
+    async def accept(self, order_id: int, trip_id: int, driver_id: int, name: str
+                     ) -> Tuple[Optional[Dict[str, Any]], Optional[Trip], str]:
+        """(buyurtma, reys, "ok") yoki (None, None, sabab): taken|closed|full|missing."""
+        order, seats_left, reason = await self.db.run(
+            _assign, order_id, trip_id, driver_id, name, int(time.time()))
+        if order is None:
+            return None, None, reason
+        t = self.index.trips.get(trip_id)
+        self.index.take_seats(trip_id, seats_left)
+        if t is None:
+            await self.load()
+            t = self.index.trips.get(trip_id)
+        return order, t, "ok"
+
+    def other_offers(self, order_id: int, keep_chat: int) -> Iterable[Tuple[int, int]]:
+        return [(c, m) for c, m in self._sent.pop(order_id, []) if c != keep_chat]
+
+
+# ================= SYNC BODIES (db executor) =================
+SQL_OPEN_TRIPS = """
+    SELECT id, driver_id, full_name, phone, route_from, route_to, from_district,
+           depart_at, seats, seats_left, cargo, lat, lng
+    FROM driver_trips WHERE status='open' AND depart_at >= ?
+"""
+
+def _open_trips(conn: sqlite3.Connection, since: int) -> List[tuple]:
+    return conn.execute(SQL_OPEN_TRIPS, (since,)).fetchall()
+
+def _is_driver(conn: sqlite3.Connection, uid: int) -> bool:
+    row = conn.execute("SELECT approved FROM drivers WHERE tg_user_id=?", (uid,)).fetchone()
+    return bool(row and row[0])
+
+def _set_driver(conn: sqlite3.Connection, uid: int, approved: bool, ts: int) -> List[int]:
+    row = conn.execute("SELECT full_name FROM users WHERE tg_user_id=?", (uid,)).fetchone()
+    with conn:
+        conn.execute("""
+            INSERT INTO drivers(tg_user_id, full_name, approved, created_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(tg_user_id) DO UPDATE SET approved=excluded.approved
+        """, (uid, row[0] if row else None, int(approved), ts))
+        return [] if approved else _close_open(conn, uid)
+
+def _close_trips(conn: sqlite3.Connection, driver_id: int) -> List[int]:
+    with conn:
+        return _close_open(conn, driver_id)
+
+def _close_open(conn: sqlite3.Connection, driver_id: int) -> List[int]:
+    ids = [r[0] for r in conn.execute(
+        "SELECT id FROM driver_trips WHERE driver_id=? AND status='open'", (driver_id,))]
+    conn.execute("UPDATE driver_trips SET status='closed' WHERE driver_id=? AND status='open'", (driver_id,))
+    return ids
+
+def _create_trip(conn: sqlite3.Connection, driver_id, full_name, phone, route_from, route_to,
+                 district, depart_at, seats, cargo, ts) -> Tuple[int, List[int]]:
+    with conn:
+        closed = _close_open(conn, driver_id)
+        tid = conn.execute("""
+            INSERT INTO driver_trips(driver_id, full_name, phone, route_from, route_to, from_district,
+                                     depart_at, seats, seats_left, cargo, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'open', ?)
+        """, (driver_id, full_name, phone, route_from, route_to, district, depart_at,
+              seats, seats, cargo, ts)).lastrowid
+        return tid, closed
+
+def _assign(conn: sqlite3.Connection, order_id: int, trip_id: int, driver_id: int, name: str, ts: int
+            ) -> Tuple[Optional[Dict[str, Any]], int, str]:
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")   # o'qish va yozish bitta qulf ostida — ikki haydovchi bir buyurtmani ololmaydi
+        o = conn.execute("""
+            SELECT id, tg_user_id, phone, route_from, from_district, route_to, to_district, people, cargo, trip_id
+            FROM orders WHERE id=?
+        """, (order_id,)).fetchone()
+        if o is None:
+            return None, 0, "missing"
+        if o[9] is not None:
+            return None, 0, "taken"
+        t = conn.execute("SELECT driver_id, status, seats_left, cargo FROM driver_trips WHERE id=?",
+                         (trip_id,)).fetchone()
+        if t is None or t[0] != driver_id or t[1] != "open":
+            return None, 0, "closed"
+        people = int(o[7] or 0)
+        if (people > 0 and t[2] < people) or (people == 0 and not t[3]):
+            return None, t[2], "full"
+        conn.execute("UPDATE driver_trips SET seats_left=seats_left-? WHERE id=?", (people, trip_id))
+        conn.execute("UPDATE orders SET trip_id=? WHERE id=?", (trip_id, order_id))
+        conn.execute("""
+            UPDATE operator_outbox SET claimed_by=?, claimed_name=?, claimed_at=?
+            WHERE order_id=? AND claimed_by IS NULL
+        """, (driver_id, f"🚗 {name}", ts, order_id))
+        keys = ("id", "tg_user_id", "phone", "route_from", "from_district", "route_to", "to_district", "people", "cargo")
+        return dict(zip(keys, o)), t[2] - people, "ok"
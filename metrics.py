@@ -0,0 +1,298 @@
+# metrics.py — yengil Prometheus metrikalari (tashqi bog'liqliksiz) va aiogram middleware'lari
+import time
+import asyncio
+import logging
+import contextlib
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNotFound,
+    TelegramUnauthorizedError, TelegramConflictError, TelegramServerError, TelegramNetworkError,
+)
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import StateType
+from aiogram.types import TelegramObject
+
+log = logging.getLogger("davon-taksi-bot.metrics")
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Labels = Tuple[str, ...]
+
+
+# ================= PRIMITIVES =================
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_
+        self.labels = tuple(labels)
+
+    def _fmt_labels(self, values: Labels, extra: str = "") -> str:
+        parts = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, n: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + n
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        out = super().render()
+        out += [f"{self.name}{self._fmt_labels(k)} {v:g}" for k, v in self._values.items()]
+        return out
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *a, fn: Optional[Callable[[], Dict[Labels, float]]] = None, **kw):
+        super().__init__(*a, **kw)
+        self._values: Dict[Labels, float] = {}
+        self._fn = fn   # render paytida chaqiriladi (masalan, kesh hajmi)
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def render(self) -> List[str]:
+        out = super().render()
+        values = dict(self._values)
+        if self._fn is not None:
+            try:
+                values.update(self._fn())
+            except Exception as e:
+                log.warning("[METRICS] gauge %s failed: %s", self.name, e)
+        out += [f"{self.name}{self._fmt_labels(k)} {v:g}" for k, v in values.items()]
+        return out
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *a, buckets: Sequence[float] = LATENCY_BUCKETS, **kw):
+        super().__init__(*a, **kw)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, list] = {}   # labels -> [bucket counts..., +Inf, sum]
+
+    def observe(self, value: float, *labels: str):
+        s = self._series.get(labels)
+        if s is None:
+            s = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        s[bisect_left(self.buckets, value)] += 1
+        s[-1] += value
+
+    def count(self, *labels: str) -> int:
+        s = self._series.get(labels)
+        return sum(s[:-1]) if s else 0
+
+    def render(self) -> List[str]:
+        out = super().render()
+        for labels, s in self._series.items():
+            acc = 0
+            for b, n in zip(self.buckets, s):
+                acc += n
+                le = 'le="%g"' % b
+                out.append(f"{self.name}_bucket{self._fmt_labels(labels, le)} {acc}")
+            acc += s[len(self.buckets)]
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{self._fmt_labels(labels, le)} {acc}")
+            out.append(f"{self.name}_sum{self._fmt_labels(labels)} {s[-1]:.6f}")
+            out.append(f"{self.name}_count{self._fmt_labels(labels)} {acc}")
+        return out
+
+
+def _escape(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, m: _Metric) -> Any:
+        self._metrics.append(m)
+        return m
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines += m.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    "bot_handler_seconds", "Handler latency by handler and FSM state", ("handler", "state")))
+HANDLER_ERRORS  = REGISTRY.register(Counter(
+    "bot_handler_errors_total", "Handler exceptions", ("handler",)))
+STATE_ENTERED   = REGISTRY.register(Counter(
+    "bot_fsm_state_entered_total", "Conversation funnel: transitions into each FSM state", ("state",)))
+ORDERS_TOTAL    = REGISTRY.register(Counter(
+    "bot_orders_total", "Finalized orders (funnel end)"))
+DB_SECONDS      = REGISTRY.register(Histogram(
+    "bot_db_seconds", "SQLite call latency incl. executor wait", ("op",)))
+HELPER_SECONDS  = REGISTRY.register(Histogram(
+    "bot_helper_seconds", "Data helper latency as seen by handlers", ("helper",)))
+API_SECONDS     = REGISTRY.register(Histogram(
+    "bot_api_seconds", "Telegram Bot API call latency", ("method",)))
+API_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    "bot_api_queue_seconds", "Wait for an outbound request slot, by priority", ("priority",)))
+API_ERRORS      = REGISTRY.register(Counter(
+    "bot_api_errors_total", "Telegram Bot API errors by code", ("method", "code")))
+OUTBOX_DELIVERED = REGISTRY.register(Counter(
+    "bot_outbox_delivered_total", "Operator notifications delivered", ("mode",)))
+OUTBOX_FAILED   = REGISTRY.register(Counter(
+    "bot_outbox_failed_total", "Operator notification send failures (will retry)", ("error",)))
+THROTTLED       = REGISTRY.register(Counter(
+    "bot_throttled_total", "Updates dropped by per-user throttling", ("rule",)))
+ORDERS_ARCHIVED = REGISTRY.register(Counter(
+    "bot_orders_archived_total", "Orders moved from the live DB into monthly archives"))
+DUPLICATES      = REGISTRY.register(Counter(
+    "bot_duplicates_total", "Duplicate updates/orders suppressed", ("kind",)))
+CATALOG_RELOADS = REGISTRY.register(Counter(
+    "bot_catalog_reloads_total", "District catalog reload attempts", ("result",)))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    "bot_startup_seconds", "Seconds from process start to each startup phase (first_update = first update received)",
+    ("phase",)))
+LOOP_LAG        = REGISTRY.register(Histogram(
+    "bot_event_loop_lag_seconds", "Event loop scheduling lag",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)))
+
+
+# ================= HELPERS =================
+def timed(helper: str):
+    """async helper'ni bot_helper_seconds{helper} bilan o'lchaydi."""
+    def deco(fn: Callable[..., Awaitable[Any]]):
+        async def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                HELPER_SECONDS.observe(time.perf_counter() - t0, helper)
+        wrapper.__name__ = fn.__name__
+        wrapper.__wrapped__ = fn
+        return wrapper
+    return deco
+
+def gauge(name: str, help_: str, fn: Callable[[], Dict[Labels, float]], labels: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help_, labels, fn=fn))
+
+
+# ================= MIDDLEWARES =================
+class _TrackedState(FSMContext):
+    """FSMContext: handler o'rnatgan oxirgi holatni eslab qoladi — voronka uchun
+    storage'dan qayta o'qish shart emas."""
+
+    def __init__(self, ctx: FSMContext):
+        super().__init__(ctx.storage, ctx.key)
+        self.changed = False
+        self.last: Optional[str] = None
+
+    async def set_state(self, state: StateType = None) -> None:
+        await super().set_state(state)
+        self.changed = True
+        self.last = state.state if isinstance(state, State) else state
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: handler va holat bo'yicha kechikish, holatlar voronkasi.
+    Holat oldin — data["raw_state"] dan, keyin — handler'ning set_state chaqiruvidan."""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        fast = data.get("fast_handler")
+        h = data.get("handler")
+        name = fast.__name__ if fast is not None else (h.callback.__name__ if h is not None else "?")
+        before = data.get("raw_state")
+        state = data.get("state")
+        if isinstance(state, FSMContext):
+            state = data["state"] = _TrackedState(state)
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - t0, name, before or "-")
+            if isinstance(state, _TrackedState) and state.changed:
+                if state.last is not None and state.last != before:
+                    STATE_ENTERED.inc(state.last)
+
+
+_ERROR_CODES = (
+    (TelegramRetryAfter, "429"), (TelegramForbiddenError, "403"), (TelegramNotFound, "404"),
+    (TelegramUnauthorizedError, "401"), (TelegramConflictError, "409"), (TelegramBadRequest, "400"),
+    (TelegramServerError, "5xx"), (TelegramNetworkError, "network"),
+)
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """bot.session middleware: har bir Bot API chaqiruvi kechikishi va xato kodlari."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        t0 = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            code = next((c for cls, c in _ERROR_CODES if isinstance(e, cls)), "other")
+            API_ERRORS.inc(name, code)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - t0, name)
+
+
+async def loop_lag_monitor(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - t0 - interval))
+
+
+# ================= HTTP =================
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def add_metrics_route(app, token: Optional[str] = None):
+    """FastAPI ilovasiga GET /metrics qo'shadi. `token` berilsa so'rov
+    `Authorization: Bearer <token>` bilan kelishi kerak, aks holda 403."""
+    import hmac
+    from fastapi import Request, Response
+
+    async def metrics_endpoint(request: Request) -> Response:
+        if token is not None:
+            got = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(got.encode(), f"Bearer {token}".encode()):
+                return Response(status_code=403)
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+    return app
+
+async def serve_metrics(host: str, port: int):
+    """Polling rejimi uchun alohida uvicorn server (fastapi/uvicorn allaqachon requirements'da)."""
+    import uvicorn
+    from fastapi import FastAPI
+    app = add_metrics_route(FastAPI(docs_url=None, redoc_url=None, openapi_url=None))
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    server.capture_signals = contextlib.nullcontext   # signallar aiogram polling'ga qoladi
+    await server.serve()
@@ -0,0 +1,370 @@
+# migrations.py — versiyalangan sxema: schema_version + idempotent migratsiyalar
+#   python migrations.py [orders.db]   — versiya va drift hisobotini chiqaradi
+import sys
+import time
+import sqlite3
+import logging
+from contextlib import closing
+from typing import Callable, Dict, List, Tuple
+
+log = logging.getLogger("davon-taksi-bot.migrations")
+
+Migration = Tuple[int, str, Callable[[sqlite3.Connection], None]]
+
+# Bir nechta worker bir vaqtda ishga tushsa, bittasi migratsiya qiladi, qolganlari yozish
+# qulfini shuncha ms kutadi (backfill'li migratsiya odatiy busy_timeout'dan uzoq bo'lishi mumkin)
+MIGRATE_BUSY_TIMEOUT = 120000
+
+
+def add_column(conn: sqlite3.Connection, table: str, col: str, typ: str):
+    if col not in table_columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {typ}")
+
+def table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+def index_names(conn: sqlite3.Connection) -> List[str]:
+    return [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL"
+    )]
+
+
+# ================= MIGRATIONS =================
+def m001_base(conn: sqlite3.Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users(
+        tg_user_id INTEGER PRIMARY KEY,
+        full_name  TEXT,
+        username   TEXT,
+        joined_at  INTEGER,
+        last_seen  INTEGER,
+        phone      TEXT,
+        registered_at INTEGER
+    );
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS orders(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tg_user_id INTEGER,
+        full_name TEXT,
+        username TEXT,
+        phone TEXT,
+        route_from TEXT,
+        from_district TEXT,
+        route_to TEXT,
+        to_district TEXT,
+        people INTEGER,
+        cargo TEXT,
+        note TEXT,
+        created_at INTEGER
+    );
+    """)
+    # Eski bazalarda users keyinroq kengaytirilgan
+    add_column(conn, "users", "phone", "TEXT")
+    add_column(conn, "users", "registered_at", "INTEGER")
+
+def m002_order_coords(conn: sqlite3.Connection):
+    # Jonli bazada qo'lda qo'shilgan ustunlar — endi sxemaning rasmiy qismi
+    for col in ("from_lat", "from_lng", "to_lat", "to_lng"):
+        add_column(conn, "orders", col, "REAL")
+
+def m003_broadcasts(conn: sqlite3.Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS broadcasts(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        text TEXT,
+        status TEXT,
+        cursor INTEGER,
+        total INTEGER,
+        sent INTEGER,
+        failed INTEGER,
+        blocked INTEGER,
+        status_chat_id INTEGER,
+        status_message_id INTEGER,
+        created_at INTEGER,
+        updated_at INTEGER
+    );
+    """)
+    add_column(conn, "users", "blocked_at", "INTEGER")
+
+def m004_indexes(conn: sqlite3.Connection):
+    # get_last_order faqat indeksdan o'qiladi (covering)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_user_created
+        ON orders(tg_user_id, created_at DESC, route_from, from_district, route_to, to_district)
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_joined ON users(joined_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status)")
+
+def m005_daily_stats(conn: sqlite3.Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS daily_stats(
+        day    TEXT,
+        metric TEXT,
+        key    TEXT,
+        value  INTEGER,
+        PRIMARY KEY(day, metric, key)
+    ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS user_activity(
+        day        TEXT,
+        tg_user_id INTEGER,
+        PRIMARY KEY(day, tg_user_id)
+    ) WITHOUT ROWID;
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS counters(name TEXT PRIMARY KEY, value INTEGER)")
+    if conn.execute("SELECT 1 FROM daily_stats LIMIT 1").fetchone():
+        return
+    # Mavjud ma'lumotlardan bir martalik backfill (Toshkent kuni = UTC+5)
+    day = "strftime('%Y-%m-%d', {} + 18000, 'unixepoch')"
+    conn.execute(f"""
+        INSERT INTO daily_stats(day, metric, key, value)
+        SELECT {day.format('joined_at')}, 'new_users', '', COUNT(*)
+        FROM users WHERE joined_at IS NOT NULL GROUP BY 1
+    """)
+    for metric, key in (("orders", "''"),
+                        ("orders_route", "IFNULL(route_from, 'None') || '→' || IFNULL(route_to, 'None')"),
+                        ("orders_from", "IFNULL(route_from, 'None') || '/' || IFNULL(from_district, 'None')"),
+                        ("orders_to", "IFNULL(route_to, 'None') || '/' || IFNULL(to_district, 'None')")):
+        conn.execute(f"""
+            INSERT INTO daily_stats(day, metric, key, value)
+            SELECT {day.format('created_at')}, '{metric}', {key}, COUNT(*)
+            FROM orders WHERE created_at IS NOT NULL GROUP BY 1, 3
+        """)
+    conn.execute(f"""
+        INSERT INTO daily_stats(day, metric, key, value)
+        SELECT {day.format('created_at')}, 'people', '', SUM(people)
+        FROM orders WHERE created_at IS NOT NULL AND people > 0 GROUP BY 1
+    """)
+    conn.execute(f"""
+        INSERT INTO daily_stats(day, metric, key, value)
+        SELECT {day.format('created_at')}, CASE WHEN people > 0 THEN 'passenger' ELSE 'cargo' END, '', COUNT(*)
+        FROM orders WHERE created_at IS NOT NULL GROUP BY 1, 2
+    """)
+    conn.execute(f"""
+        INSERT OR IGNORE INTO user_activity(day, tg_user_id)
+        SELECT {day.format('last_seen')}, tg_user_id FROM users WHERE last_seen IS NOT NULL
+        UNION
+        SELECT {day.format('created_at')}, tg_user_id FROM orders WHERE created_at IS NOT NULL
+    """)
+    conn.execute("""
+        INSERT INTO daily_stats(day, metric, key, value)
+        SELECT day, 'active_users', '', COUNT(*) FROM user_activity GROUP BY day
+    """)
+    conn.execute("INSERT OR REPLACE INTO counters(name, value) SELECT 'total_users', COUNT(*) FROM users")
+    conn.execute("INSERT OR REPLACE INTO counters(name, value) SELECT 'total_orders', COUNT(*) FROM orders")
+
+def m006_operator_outbox(conn: sqlite3.Connection):
+    # Operatorga xabarnomalar navbati: buyurtma bilan bitta tranzaksiyada yoziladi
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS operator_outbox(
+        order_id     INTEGER PRIMARY KEY,
+        status       TEXT NOT NULL DEFAULT 'pending',
+        attempts     INTEGER NOT NULL DEFAULT 0,
+        next_at      INTEGER NOT NULL,
+        created_at   INTEGER NOT NULL,
+        sent_at      INTEGER,
+        message_id   INTEGER,
+        last_error   TEXT,
+        claimed_by   INTEGER,
+        claimed_name TEXT,
+        claimed_at   INTEGER
+    );
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_due
+        ON operator_outbox(next_at) WHERE status='pending'
+    """)
+
+def m007_drivers(conn: sqlite3.Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS drivers(
+        tg_user_id INTEGER PRIMARY KEY,
+        full_name  TEXT,
+        approved   INTEGER NOT NULL DEFAULT 0,
+        created_at INTEGER
+    );
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS driver_trips(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        driver_id     INTEGER NOT NULL,
+        full_name     TEXT,
+        phone         TEXT,
+        route_from    TEXT,
+        route_to      TEXT,
+        from_district TEXT,
+        depart_at     INTEGER,
+        seats         INTEGER,
+        seats_left    INTEGER,
+        cargo         INTEGER NOT NULL DEFAULT 0,
+        lat REAL,
+        lng REAL,
+        status        TEXT NOT NULL DEFAULT 'open',
+        created_at    INTEGER
+    );
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trips_open
+        ON driver_trips(depart_at) WHERE status='open'
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trips_driver ON driver_trips(driver_id, status)")
+    add_column(conn, "orders", "trip_id", "INTEGER")
+
+def m008_orders_created(conn: sqlite3.Connection):
+    # Eksport sana oralig'ini indeks bo'yicha, saralashsiz o'qiydi
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at)")
+
+def m009_recent_trips(conn: sqlite3.Connection):
+    # Har foydalanuvchining turli safarlari chastotasi bilan — "🔁" bir bosishda buyurtma
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS recent_trips(
+        tg_user_id    INTEGER NOT NULL,
+        route_from    TEXT NOT NULL,
+        from_district TEXT NOT NULL,
+        route_to      TEXT NOT NULL,
+        to_district   TEXT NOT NULL,
+        people        INTEGER NOT NULL,
+        cargo         TEXT NOT NULL,
+        uses          INTEGER NOT NULL,
+        last_at       INTEGER NOT NULL,
+        PRIMARY KEY(tg_user_id, route_from, from_district, route_to, to_district, people, cargo)
+    ) WITHOUT ROWID;
+    """)
+    if conn.execute("SELECT 1 FROM recent_trips LIMIT 1").fetchone():
+        return
+    # Backfill: har foydalanuvchiga eng so'nggi 8 ta safar (recent.RECENT_KEEP standarti)
+    conn.execute("""
+        INSERT INTO recent_trips
+        SELECT tg_user_id, route_from, from_district, route_to, to_district, people, cargo, uses, last_at
+        FROM (
+            SELECT tg_user_id, route_from, from_district, route_to, to_district,
+                   IFNULL(people, 0) AS people, IFNULL(cargo, 'Йўқ') AS cargo,
+                   COUNT(*) AS uses, MAX(created_at) AS last_at,
+                   ROW_NUMBER() OVER (PARTITION BY tg_user_id ORDER BY MAX(created_at) DESC) AS rn
+            FROM orders
+            WHERE tg_user_id IS NOT NULL AND created_at IS NOT NULL
+              AND route_from IS NOT NULL AND from_district IS NOT NULL
+              AND route_to IS NOT NULL AND to_district IS NOT NULL
+            GROUP BY 1, 2, 3, 4, 5, 6, 7
+        ) WHERE rn <= 8
+    """)
+
+def m010_order_dedupe(conn: sqlite3.Connection):
+    # Bir xil buyurtma (foydalanuvchi+yo'nalish+hududlar+son, vaqt oynasi) ikkinchi marta yozilmaydi
+    add_column(conn, "orders", "dedupe_key", "TEXT")
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_dedupe
+        ON orders(dedupe_key) WHERE dedupe_key IS NOT NULL
+    """)
+
+
+MIGRATIONS: List[Migration] = [
+    (1, "base", m001_base),
+    (2, "order_coords", m002_order_coords),
+    (3, "broadcasts", m003_broadcasts),
+    (4, "indexes", m004_indexes),
+    (5, "daily_stats", m005_daily_stats),
+    (6, "operator_outbox", m006_operator_outbox),
+    (7, "drivers", m007_drivers),
+    (8, "orders_created", m008_orders_created),
+    (9, "recent_trips", m009_recent_trips),
+    (10, "order_dedupe", m010_order_dedupe),
+]
+
+# Kod kutayotgan sxema — drift tekshiruvi uchun
+EXPECTED_COLUMNS: Dict[str, List[str]] = {
+    "users": ["tg_user_id", "full_name", "username", "joined_at", "last_seen",
+              "phone", "registered_at", "blocked_at"],
+    "orders": ["id", "tg_user_id", "full_name", "username", "phone",
+               "route_from", "from_district", "route_to", "to_district",
+               "people", "cargo", "note", "created_at",
+               "from_lat", "from_lng", "to_lat", "to_lng", "trip_id", "dedupe_key"],
+    "broadcasts": ["id", "text", "status", "cursor", "total", "sent", "failed", "blocked",
+                   "status_chat_id", "status_message_id", "created_at", "updated_at"],
+    "daily_stats": ["day", "metric", "key", "value"],
+    "user_activity": ["day", "tg_user_id"],
+    "counters": ["name", "value"],
+    "operator_outbox": ["order_id", "status", "attempts", "next_at", "created_at", "sent_at",
+                        "message_id", "last_error", "claimed_by", "claimed_name", "claimed_at"],
+    "drivers": ["tg_user_id", "full_name", "approved", "created_at"],
+    "driver_trips": ["id", "driver_id", "full_name", "phone", "route_from", "route_to", "from_district",
+                     "depart_at", "seats", "seats_left", "cargo", "lat", "lng", "status", "created_at"],
+    "recent_trips": ["tg_user_id", "route_from", "from_district", "route_to", "to_district",
+                     "people", "cargo", "uses", "last_at"],
+}
+EXPECTED_INDEXES = ["idx_orders_user_created", "idx_users_joined", "idx_users_phone",
+                    "idx_broadcasts_status", "idx_outbox_due", "idx_trips_open", "idx_trips_driver",
+                    "idx_orders_created", "idx_orders_dedupe"]
+
+
+# ================= RUNNER =================
+def current_version(conn: sqlite3.Connection) -> int:
+    if not table_columns(conn, "schema_version"):
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Qo'llanmagan migratsiyalarni har birini alohida tranzaksiyada bajaradi.
+
+    Bir nechta jarayon bir vaqtda chaqirsa ham xavfsiz: har qadam BEGIN IMMEDIATE bilan
+    yozish qulfini oladi va versiyani qulf ostida qayta o'qiydi — boshqa jarayon allaqachon
+    qo'llagan migratsiya o'tkazib yuboriladi."""
+    busy = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+    conn.execute(f"PRAGMA busy_timeout={max(busy, MIGRATE_BUSY_TIMEOUT)}")
+    try:
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version(
+                    version INTEGER PRIMARY KEY,
+                    name TEXT,
+                    applied_at INTEGER
+                )
+            """)
+        version = current_version(conn)
+        for v, name, fn in MIGRATIONS:
+            if v <= version:
+                continue
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")   # sqlite3 DDL oldidan o'zi tranzaksiya ochmaydi
+                version = current_version(conn)
+                if v <= version:   # boshqa jarayon qo'llab ulgurdi
+                    continue
+                fn(conn)
+                conn.execute("INSERT INTO schema_version(version, name, applied_at) VALUES (?, ?, ?)",
+                             (v, name, int(time.time())))
+            log.info("[DB] migration %03d_%s applied", v, name)
+            version = v
+        return version
+    finally:
+        conn.execute(f"PRAGMA busy_timeout={busy}")
+
+def check_drift(conn: sqlite3.Connection) -> List[str]:
+    """Kutilgan va haqiqiy sxema farqlari (bo'sh ro'yxat — hammasi joyida)."""
+    problems = []
+    for table, expected in EXPECTED_COLUMNS.items():
+        actual = table_columns(conn, table)
+        if not actual:
+            problems.append(f"{table}: table missing"); continue
+        missing = [c for c in expected if c not in actual]
+        extra = [c for c in actual if c not in expected]
+        if missing: problems.append(f"{table}: missing columns {missing}")
+        if extra:   problems.append(f"{table}: unexpected columns {extra}")
+    have = index_names(conn)
+    missing_idx = [i for i in EXPECTED_INDEXES if i not in have]
+    if missing_idx:
+        problems.append(f"missing indexes {missing_idx}")
+    version = current_version(conn)
+    if version != MIGRATIONS[-1][0]:
+        problems.append(f"schema_version={version}, code expects {MIGRATIONS[-1][0]}")
+    return problems
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "orders.db"
+    with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as c:
+        print("schema_version:", current_version(c), "/", MIGRATIONS[-1][0])
+        for p in check_drift(c) or ["no drift"]:
+            print(" -", p)
@@ -0,0 +1,260 @@
+# outbox.py — operatorga buyurtma xabarnomalari: bazadagi navbat, retry/backoff, digest, "olish" tugmasi
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from db import Database
+from metrics import OUTBOX_DELIVERED, OUTBOX_FAILED
+from transport import prioritized, NOTIFY
+
+log = logging.getLogger("davon-taksi-bot.outbox")
+
+OUTBOX_POLL         = float(os.getenv("OUTBOX_POLL", "5"))          # uyg'otishsiz ham shuncha s da tekshiradi
+OUTBOX_DIGEST_MIN   = int(os.getenv("OUTBOX_DIGEST_MIN", "3"))      # shuncha va ko'p buyurtma — bitta digest
+OUTBOX_DIGEST_WINDOW = float(os.getenv("OUTBOX_DIGEST_WINDOW", "3"))  # burst paytida yig'ish oynasi, s
+OUTBOX_BATCH        = 20       # bitta digest'dagi buyurtmalar (4096 belgi va tugmalar uchun)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF      = 2.0      # 2, 4, 8 ... s
+OUTBOX_BACKOFF_MAX  = 300.0
+# Olingan qatorlar shuncha s boshqa worker'larga "vaqti kelmagan" ko'rinadi; yuboruvchi
+# yiqilsa — shundan keyin leader qayta yuboradi
+OUTBOX_LEASE        = float(os.getenv("OUTBOX_LEASE", "60"))
+
+CLAIM_PREFIX = "claim:"
+
+SQL_DUE = """
+    SELECT o.id, o.tg_user_id, o.full_name, o.username, o.phone,
+           o.route_from, o.from_district, o.route_to, o.to_district,
+           o.people, o.cargo, o.note, ob.attempts
+    FROM operator_outbox ob JOIN orders o ON o.id = ob.order_id
+    WHERE ob.status='pending' AND ob.next_at <= ?
+    ORDER BY ob.order_id LIMIT ?
+"""
+SQL_LEASE = "UPDATE operator_outbox SET next_at=? WHERE order_id=?"
+SQL_SENT  = "UPDATE operator_outbox SET status='sent', sent_at=?, message_id=?, last_error=NULL WHERE order_id=?"
+SQL_RETRY = """
+    UPDATE operator_outbox
+    SET attempts=attempts+?, next_at=?, last_error=?,
+        status=CASE WHEN attempts+? >= ? THEN 'dead' ELSE 'pending' END
+    WHERE order_id=?
+"""
+SQL_CLAIM = """
+    UPDATE operator_outbox SET claimed_by=?, claimed_name=?, claimed_at=?
+    WHERE order_id=? AND claimed_by IS NULL
+"""
+SQL_CLAIMED_BY = "SELECT claimed_by, claimed_name FROM operator_outbox WHERE order_id=?"
+
+_COLS = ("id", "tg_user_id", "full_name", "username", "phone", "route_from", "from_district",
+         "route_to", "to_district", "people", "cargo", "note", "attempts")
+
+
+def format_order(o: Dict[str, Any]) -> str:
+    head = f"🆕 *Янги буюртма* #{o['id']}" if o.get("id") else "🆕 *Янги буюртма*"
+    return (
+        f"{head}\n"
+        f"👤 {o.get('full_name')} (@{o.get('username') or '-'}, ID:`{o.get('tg_user_id')}`)\n"
+        f"📞 Телефон: {o.get('phone')}\n"
+        f"🚖 Йўналиш: {o.get('route_from')} ({o.get('from_district')}) → "
+        f"{o.get('route_to')} ({o.get('to_district')})\n"
+        f"👥 Одам: {o.get('people')}\n"
+        f"📦 Почта: {o.get('cargo') or 'Йўқ'}\n"
+        f"📝 Изоҳ: {o.get('note') or '-'}"
+    )
+
+def format_digest(orders: Sequence[Dict[str, Any]]) -> str:
+    lines = [f"🆕 *{len(orders)} та янги буюртма*"]
+    for o in orders:
+        lines.append(
+            f"\n#{o['id']} {o.get('route_from')} ({o.get('from_district')}) → "
+            f"{o.get('route_to')} ({o.get('to_district')})\n"
+            f"   👥 {o.get('people')}  📦 {o.get('cargo') or 'Йўқ'}  📞 {o.get('phone')}  👤 {o.get('full_name')}"
+        )
+    return "\n".join(lines)
+
+def claim_keyboard(order_ids: Sequence[int], cols: int = 4) -> InlineKeyboardMarkup:
+    buttons = [InlineKeyboardButton(text=f"✋ Олиш #{i}" if len(order_ids) == 1 else f"✋ #{i}",
+                                    callback_data=f"{CLAIM_PREFIX}{i}") for i in order_ids]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons[i:i+cols] for i in range(0, len(buttons), cols)])
+
+def mark_claimed(markup: Optional[InlineKeyboardMarkup], order_id: int, who: str) -> Optional[InlineKeyboardMarkup]:
+    """Bosilgan tugmani "✅ #id — kim" ga almashtiradi; qolgan tugmalar o'z joyida."""
+    if markup is None:
+        return None
+    data = f"{CLAIM_PREFIX}{order_id}"
+    rows = [[InlineKeyboardButton(text=f"✅ #{order_id} — {who}", callback_data=data)
+             if b.callback_data == data else b for b in row] for row in markup.inline_keyboard]
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+class OperatorOutbox:
+    """operator_outbox navbatini ADMIN_CHAT_ID ga yetkazadi.
+
+    Buyurtma bilan birga yozilgan qatorlar fon vazifasida yuboriladi, shuning uchun
+    mijoz tasdig'i operator xabarini kutmaydi. Xatoda eksponensial backoff bilan qayta
+    urinadi, OUTBOX_MAX_ATTEMPTS dan keyin 'dead'. Bir vaqtda OUTBOX_DIGEST_MIN va ko'p
+    buyurtma navbatda bo'lsa (yoki oxirgi oynada shuncha yuborilgan bo'lsa) — bitta
+    digest xabar. Yetkazish kamida bir marta: yuborilib, belgilanmay qolsa qayta keladi.
+
+    Navbatni doimiy ravishda faqat leader kuzatadi (start()), lekin wake() har worker'da
+    ishlaydi: start qilinmagan worker o'zi yozgan qatorlarni darhol bir martalik drain bilan
+    yuboradi. Qatorlar BEGIN IMMEDIATE ostida OUTBOX_LEASE ga olinadi — ikki worker bitta
+    buyurtmani yubormaydi."""
+
+    def __init__(self, bot: Bot, db: Database, chat_id: int,
+                 digest_min: int = OUTBOX_DIGEST_MIN, window: float = OUTBOX_DIGEST_WINDOW,
+                 poll: float = OUTBOX_POLL):
+        self.bot = bot
+        self.db = db
+        self.chat_id = chat_id
+        self.digest_min = max(2, digest_min)
+        self.window = max(0.0, window)
+        self.poll = max(0.1, poll)
+        self._recent: Deque[float] = deque()   # yaqinda yuborilgan xabarnomalar vaqti
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._oneshot: Optional[asyncio.Task] = None   # leader bo'lmagan worker'dagi drain
+
+    # ---------- lifecycle ----------
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._loop(), name="operator-outbox")
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+        elif self._oneshot is None or self._oneshot.done():
+            self._oneshot = asyncio.get_running_loop().create_task(self._drain_once(), name="operator-outbox-once")
+
+    async def _drain_once(self):
+        try:
+            await self.drain()
+        except Exception as e:
+            log.exception("[OUTBOX] drain failed: %s", e)
+
+    async def stop(self):
+        for task in (self._task, self._oneshot):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._oneshot = None
+        self._wake = None
+
+    @prioritized(NOTIFY)
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                log.exception("[OUTBOX] drain failed: %s", e)
+
+    # ---------- delivery ----------
+    @prioritized(NOTIFY)
+    async def drain(self):
+        while True:
+            if self._bursting():
+                await asyncio.sleep(self.window)   # burst: oynada yig'ilganlar bitta digest bo'ladi
+            rows = await self.db.run(_due, int(time.time()), OUTBOX_BATCH, OUTBOX_LEASE)
+            if not rows:
+                return
+            if len(rows) >= self.digest_min:
+                await self._deliver(rows, digest=True)
+            else:
+                for o in rows:
+                    await self._deliver([o], digest=False)
+
+    def _bursting(self) -> bool:
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > self.window:
+            self._recent.popleft()
+        return len(self._recent) >= self.digest_min
+
+    async def _deliver(self, orders: List[Dict[str, Any]], digest: bool):
+        ids = [o["id"] for o in orders]
+        text = format_digest(orders) if digest else format_order(orders[0])
+        markup = claim_keyboard(ids)
+        try:
+            try:
+                msg = await self.bot.send_message(self.chat_id, text, reply_markup=markup)
+            except TelegramBadRequest as e:
+                if "parse entities" not in str(e):
+                    raise
+                # Ism/izohdagi Markdown belgilari — oddiy matn bilan qayta
+                msg = await self.bot.send_message(self.chat_id, text, reply_markup=markup, parse_mode=None)
+        except TelegramRetryAfter as e:
+            await self.db.run(_retry, orders, 0, float(e.retry_after), "429")
+            OUTBOX_FAILED.inc("429", n=len(ids))
+            return
+        except Exception as e:
+            await self.db.run(_retry, orders, 1, None, f"{type(e).__name__}: {e}"[:300])
+            OUTBOX_FAILED.inc(type(e).__name__, n=len(ids))
+            log.warning("[OUTBOX] send %s failed: %s", ids, e)
+            return
+        await self.db.run(_mark_sent, ids, msg.message_id, int(time.time()))
+        OUTBOX_DELIVERED.inc("digest" if digest else "single", n=len(ids))
+        now = time.monotonic()
+        self._recent.extend(now for _ in ids)
+
+    @prioritized(NOTIFY)
+    async def send_direct(self, data: Dict[str, Any]):
+        """Buyurtma bazaga yozilmay qolganda — navbatsiz, bir martalik urinish."""
+        try:
+            await self.bot.send_message(self.chat_id, format_order(data), parse_mode=None)
+        except Exception as e:
+            log.exception("[OUTBOX] direct notify failed: %s", e)
+
+    # ---------- claim ----------
+    async def claim(self, order_id: int, uid: int, name: str) -> Tuple[bool, Optional[str]]:
+        """(True, None) — biriktirildi; (False, kim) — allaqachon olingan yoki topilmadi."""
+        return await self.db.run(_claim, order_id, uid, name, int(time.time()))
+
+
+# ================= SYNC BODIES (db executor) =================
+def _due(conn: sqlite3.Connection, now: int, limit: int, lease: float = OUTBOX_LEASE) -> List[Dict[str, Any]]:
+    """Vaqti kelgan qatorlarni o'qiydi va `lease` s ga oladi (boshqa worker ularni ko'rmaydi)."""
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = [dict(zip(_COLS, r)) for r in conn.execute(SQL_DUE, (now, limit))]
+        conn.executemany(SQL_LEASE, [(int(now + lease), o["id"]) for o in rows])
+    return rows
+
+def _mark_sent(conn: sqlite3.Connection, ids: List[int], message_id: int, ts: int):
+    with conn:
+        conn.executemany(SQL_SENT, [(ts, message_id, i) for i in ids])
+
+def _retry(conn: sqlite3.Connection, orders: List[Dict[str, Any]], inc: int,
+           delay: Optional[float], error: str):
+    now = time.time()
+    rows = []
+    for o in orders:
+        d = delay if delay is not None else min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF * 2 ** o["attempts"])
+        rows.append((inc, int(now + d), error, inc, OUTBOX_MAX_ATTEMPTS, o["id"]))
+    with conn:
+        conn.executemany(SQL_RETRY, rows)
+    dead = [o["id"] for o in orders if inc and o["attempts"] + inc >= OUTBOX_MAX_ATTEMPTS]
+    if dead:
+        log.error("[OUTBOX] giving up on orders %s: %s", dead, error)
+
+def _claim(conn: sqlite3.Connection, order_id: int, uid: int, name: str, ts: int) -> Tuple[bool, Optional[str]]:
+    with conn:
+        if conn.execute(SQL_CLAIM, (uid, name, ts, order_id)).rowcount:
+            return True, None
+        row = conn.execute(SQL_CLAIMED_BY, (order_id,)).fetchone()
+    return False, (row[1] if row else None)
@@ -0,0 +1,90 @@
+# recent.py — foydalanuvchining tez-tez takrorlanadigan safarlari: bir bosishda qayta buyurtma
+import os
+import zlib
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+RECENT_KEEP = int(os.getenv("RECENT_KEEP", "8"))   # har foydalanuvchiga saqlanadigan turli safarlar
+RECENT_SHOW = int(os.getenv("RECENT_SHOW", "3"))   # "🔁" tugmalari soni
+
+REPEAT_PREFIX = "🔁 "
+CB_REPEAT = "rp:"
+
+# Safar = (route_from, from_district, route_to, to_district, people, cargo) kombinatsiyasi
+FIELDS = ("route_from", "from_district", "route_to", "to_district", "people", "cargo")
+
+SQL_BUMP_TRIP = """
+    INSERT INTO recent_trips(tg_user_id, route_from, from_district, route_to, to_district,
+                             people, cargo, uses, last_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+    ON CONFLICT(tg_user_id, route_from, from_district, route_to, to_district, people, cargo)
+    DO UPDATE SET uses=uses+1, last_at=MAX(last_at, excluded.last_at)
+"""
+# Eng so'nggi RECENT_KEEP tasi qoladi: yangi safar darhol chiqib ketmasligi uchun
+# kesish oxirgi foydalanish bo'yicha, ko'rsatish esa chastota bo'yicha.
+SQL_TRIM_TRIPS = """
+    DELETE FROM recent_trips
+    WHERE tg_user_id = ?1 AND last_at < (
+        SELECT last_at FROM recent_trips WHERE tg_user_id = ?1
+        ORDER BY last_at DESC LIMIT 1 OFFSET ?2)
+"""
+SQL_READ_TRIPS = """
+    SELECT route_from, from_district, route_to, to_district, people, cargo, uses, last_at
+    FROM recent_trips WHERE tg_user_id = ?
+    ORDER BY uses DESC, last_at DESC
+"""
+
+
+def _combo(t: dict) -> Tuple:
+    return (t.get("route_from"), t.get("from_district"), t.get("route_to"), t.get("to_district"),
+            int(t.get("people") or 0), t.get("cargo") or "Йўқ")
+
+def trip_key(t: dict) -> str:
+    """callback_data uchun qisqa, barqaror kalit (ro'yxatdagi o'rin emas — tartib o'zgarib turadi)."""
+    return f"{zlib.crc32(repr(_combo(t)).encode()):08x}"
+
+def label(t: dict) -> str:
+    who = f"{t['people']} киши" if t.get("people") else "📦 почта"
+    return f"{REPEAT_PREFIX}{t['from_district']} → {t['to_district']}, {who}"
+
+def find(trips: Iterable[dict], key: Optional[str] = None, text: Optional[str] = None) -> Optional[dict]:
+    for t in trips:
+        if (key is not None and trip_key(t) == key) or (text is not None and label(t) == text):
+            return t
+    return None
+
+def bump(trips: Optional[List[dict]], order: dict, ts: int, keep: int = RECENT_KEEP) -> List[dict]:
+    """Keshdagi ro'yxatni bazadagi record_trips bilan bir xil qoidada yangilaydi."""
+    combo = _combo(order)
+    if None in combo[:4]:
+        return list(trips or ())
+    out, found = [], False
+    for t in trips or ():
+        if _combo(t) == combo:
+            t = {**t, "uses": t["uses"] + 1, "last_at": max(t["last_at"], ts)}
+            found = True
+        out.append(t)
+    if not found:
+        out.append({**dict(zip(FIELDS, combo)), "uses": 1, "last_at": ts})
+    if len(out) > keep:
+        cut = sorted((t["last_at"] for t in out), reverse=True)[keep - 1]
+        out = [t for t in out if t["last_at"] >= cut]
+    out.sort(key=lambda t: (-t["uses"], -t["last_at"]))
+    return out
+
+
+# ================= DB (executor, chaqiruvchi tranzaksiyasi ichida) =================
+def record_trips(conn: sqlite3.Connection, orders: Iterable[Tuple[int, str, str, str, str, int, str, int]],
+                 keep: int = RECENT_KEEP):
+    """orders: stats.record_orders bilan bir xil kortejlar (uid, ..., created_at)."""
+    touched: Dict[int, None] = {}
+    for uid, rf, fd, rt, td, people, cargo, ts in orders:
+        if uid is None or None in (rf, fd, rt, td):
+            continue
+        conn.execute(SQL_BUMP_TRIP, (uid, rf, fd, rt, td, int(people or 0), cargo or "Йўқ", ts))
+        touched[uid] = None
+    for uid in touched:
+        conn.execute(SQL_TRIM_TRIPS, (uid, keep - 1))
+
+def read_trips(conn: sqlite3.Connection, uid: int) -> List[dict]:
+    return [dict(zip(FIELDS + ("uses", "last_at"), r)) for r in conn.execute(SQL_READ_TRIPS, (uid,))]
@@ -0,0 +1,87 @@
+# search.py — hudud nomlari bo'yicha noaniq qidiruv: lotin↔kirill, normallashtirish, trigram indeks
+import re
+from typing import Dict, List, Sequence, Tuple
+
+# O'zbek/rus kirill -> lotin. Keyin ikkala yozuv ham bir xil "kanonik" shaklga keltiriladi.
+_CYR = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo", "ж": "j", "з": "z",
+    "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
+    "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sh",
+    "ъ": "", "ы": "i", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    "ў": "o", "қ": "k", "ғ": "g", "ҳ": "h",
+}
+_TRANS = str.maketrans({**_CYR, **{k.upper(): v for k, v in _CYR.items()}})
+# Lotin yozuvdagi farqlar: q≈k, x≈h, o‘/g‘ apostroflari, w≈v. Unlilar ham yig'iladi:
+# rus va o'zbek yozuvi ko'pincha shu yerda farq qiladi (Чиланзар/Чилонзор, Сергели/Сергили).
+_LATIN_FOLD = str.maketrans({"q": "k", "x": "h", "w": "v", "c": "k",
+                             "o": "a", "u": "a", "e": "i"})
+_APOS_RE = re.compile(r"(?<=[og])['‘’ʻʼ`]")
+_JUNK_RE = re.compile(r"[^a-z0-9 ]+")
+_SPACE_RE = re.compile(r"\s+")
+_DIGRAPHS = (("ch", "č"), ("sh", "š"))   # 'c'->'k' dan oldin himoya
+
+
+def normalize(s: str) -> str:
+    """"Ғишт кўприк" va "G'isht ko'prik" -> "gisht kaprik"."""
+    s = (s or "").lower().translate(_TRANS)
+    s = _APOS_RE.sub("", s)
+    for a, b in _DIGRAPHS:
+        s = s.replace(a, b)
+    s = s.translate(_LATIN_FOLD)
+    for a, b in _DIGRAPHS:
+        s = s.replace(b, a)
+    s = _JUNK_RE.sub(" ", s)
+    return _SPACE_RE.sub(" ", s).strip()
+
+def trigrams(norm: str) -> Tuple[str, ...]:
+    padded = f"  {norm} "
+    return tuple({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+class DistrictSearch:
+    """Bitta shahar hududlari uchun: kanonik shakl -> nom va trigram -> hududlar indeksi.
+
+    Ball: umumiy trigramlar bo'yicha Dice koeffitsienti; so'z boshidan mos kelsa bonus.
+    Bir xil kanonik shaklga ega takror yozuvlar ("Кафе квартал"/"Қафе квартал") bitta
+    taklif sifatida qaytadi — ro'yxatdagi birinchisi."""
+
+    def __init__(self, items: Sequence[str]):
+        self.names: List[str] = []
+        self.norms: List[str] = []
+        self.exact: Dict[str, str] = {}
+        self._grams: List[int] = []
+        self._index: Dict[str, List[int]] = {}
+        for name in items:
+            norm = normalize(name)
+            if not norm or norm in self.exact:
+                continue
+            self.exact[norm] = name
+            i = len(self.names)
+            self.names.append(name)
+            self.norms.append(norm)
+            grams = trigrams(norm)
+            self._grams.append(len(grams))
+            for g in grams:
+                self._index.setdefault(g, []).append(i)
+
+    def search(self, query: str, limit: int = 4, min_score: float = 0.3) -> List[Tuple[str, float]]:
+        q = normalize(query)
+        if not q:
+            return []
+        if q in self.exact:
+            return [(self.exact[q], 1.0)]
+        qg = trigrams(q)
+        common: Dict[int, int] = {}
+        for g in qg:
+            for i in self._index.get(g, ()):
+                common[i] = common.get(i, 0) + 1
+        scored = []
+        for i, n in common.items():
+            score = 2 * n / (len(qg) + self._grams[i])
+            norm = self.norms[i]
+            if norm.startswith(q) or f" {q}" in norm:
+                score = min(0.99, score + 0.25)
+            if score >= min_score:
+                scored.append((score, i))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [(self.names[i], round(s, 3)) for s, i in scored[:limit]]
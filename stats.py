@@ -0,0 +1,138 @@
+# stats.py — kunlik agregatlar: yozuv paytida oshiriladi, /stats va /report O(kunlar) o'qiydi
+import time
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TASHKENT_UTC_OFFSET = 5 * 3600   # O'zbekistonda yozgi vaqt yo'q
+
+# daily_stats.metric qiymatlari
+NEW_USERS    = "new_users"
+ACTIVE_USERS = "active_users"
+ORDERS       = "orders"
+ORDERS_ROUTE = "orders_route"    # key: "Қўқон→Тошкент"
+ORDERS_FROM  = "orders_from"     # key: "Қўқон/Химик"
+ORDERS_TO    = "orders_to"
+PEOPLE       = "people"          # yo'lovchilar yig'indisi
+CARGO        = "cargo"           # faqat pochta buyurtmalari soni
+PASSENGER    = "passenger"       # yo'lovchili buyurtmalar soni
+
+SQL_BUMP = """
+    INSERT INTO daily_stats(day, metric, key, value) VALUES (?, ?, ?, ?)
+    ON CONFLICT(day, metric, key) DO UPDATE SET value=value+excluded.value
+"""
+SQL_BUMP_COUNTER = """
+    INSERT INTO counters(name, value) VALUES (?, ?)
+    ON CONFLICT(name) DO UPDATE SET value=value+excluded.value
+"""
+SQL_TOUCH_ACTIVE = "INSERT OR IGNORE INTO user_activity(day, tg_user_id) VALUES (?, ?)"
+
+
+def tashkent_day(ts: Optional[float] = None) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime((time.time() if ts is None else ts) + TASHKENT_UTC_OFFSET))
+
+def route_key(route_from: Optional[str], route_to: Optional[str]) -> str:
+    return f"{route_from}→{route_to}"
+
+
+# ================= WRITE SIDE (db executor, chaqiruvchi tranzaksiyasi ichida) =================
+def existing_users(conn: sqlite3.Connection, uids: Iterable[int]) -> set:
+    uids = list(uids)
+    found = set()
+    for i in range(0, len(uids), 500):
+        part = uids[i:i+500]
+        q = f"SELECT tg_user_id FROM users WHERE tg_user_id IN ({','.join('?' * len(part))})"
+        found.update(r[0] for r in conn.execute(q, part))
+    return found
+
+def record_users(conn: sqlite3.Connection, new: Iterable[Tuple[int, int]], seen: Iterable[Tuple[int, int]]):
+    """new: (uid, joined_ts) — bazada hali yo'q foydalanuvchilar; seen: (uid, ts)."""
+    bumps: Dict[Tuple[str, str, str], int] = {}
+    n_new = 0
+    for _, ts in new:
+        k = (tashkent_day(ts), NEW_USERS, "")
+        bumps[k] = bumps.get(k, 0) + 1
+        n_new += 1
+    for uid, ts in seen:
+        day = tashkent_day(ts)
+        if conn.execute(SQL_TOUCH_ACTIVE, (day, uid)).rowcount:
+            k = (day, ACTIVE_USERS, "")
+            bumps[k] = bumps.get(k, 0) + 1
+    _apply(conn, bumps)
+    if n_new:
+        conn.execute(SQL_BUMP_COUNTER, ("total_users", n_new))
+
+def record_orders(conn: sqlite3.Connection, orders: Iterable[Tuple[int, str, str, str, str, int, str, int]]):
+    """orders: (uid, route_from, from_district, route_to, to_district, people, cargo, created_at)."""
+    bumps: Dict[Tuple[str, str, str], int] = {}
+    def bump(day, metric, key, n=1):
+        bumps[(day, metric, key)] = bumps.get((day, metric, key), 0) + n
+    n_orders = 0
+    for uid, rf, fd, rt, td, people, cargo, ts in orders:
+        n_orders += 1
+        day = tashkent_day(ts)
+        bump(day, ORDERS, "")
+        bump(day, ORDERS_ROUTE, route_key(rf, rt))
+        bump(day, ORDERS_FROM, f"{rf}/{fd}")
+        bump(day, ORDERS_TO, f"{rt}/{td}")
+        if people:
+            bump(day, PASSENGER, "")
+            bump(day, PEOPLE, "", int(people))
+        else:
+            bump(day, CARGO, "")
+        if conn.execute(SQL_TOUCH_ACTIVE, (day, uid)).rowcount:
+            bump(day, ACTIVE_USERS, "")
+    _apply(conn, bumps)
+    if n_orders:
+        conn.execute(SQL_BUMP_COUNTER, ("total_orders", n_orders))
+
+def prune_activity(conn: sqlite3.Connection, ts: float, keep_days: int = 2):
+    # user_activity faqat kunlik "faol" sonini takrorlamaslik uchun; eski kunlar kerak emas
+    conn.execute("DELETE FROM user_activity WHERE day < ?", (tashkent_day(ts - keep_days * 86400),))
+
+def _apply(conn: sqlite3.Connection, bumps: Dict[Tuple[str, str, str], int]):
+    if bumps:
+        conn.executemany(SQL_BUMP, [(d, m, k, v) for (d, m, k), v in bumps.items()])
+
+
+# ================= READ SIDE =================
+def read_summary(conn: sqlite3.Connection, today: str) -> Tuple[int, int]:
+    row = conn.execute("SELECT value FROM counters WHERE name='total_users'").fetchone()
+    new = conn.execute(
+        "SELECT value FROM daily_stats WHERE day=? AND metric=? AND key=''", (today, NEW_USERS)
+    ).fetchone()
+    return (row[0] if row else 0), (new[0] if new else 0)
+
+def read_range(conn: sqlite3.Connection, since_day: str) -> List[Tuple[str, str, str, int]]:
+    return conn.execute(
+        "SELECT day, metric, key, value FROM daily_stats WHERE day >= ? ORDER BY day", (since_day,)
+    ).fetchall()
+
+def format_report(rows: List[Tuple[str, str, str, int]], top: int = 5) -> str:
+    days: Dict[str, Dict[str, int]] = {}
+    routes: Dict[str, int] = {}
+    froms: Dict[str, int] = {}
+    tos: Dict[str, int] = {}
+    for day, metric, key, value in rows:
+        if key == "":
+            days.setdefault(day, {})[metric] = value
+        elif metric == ORDERS_ROUTE:
+            routes[key] = routes.get(key, 0) + value
+        elif metric == ORDERS_FROM:
+            froms[key] = froms.get(key, 0) + value
+        elif metric == ORDERS_TO:
+            tos[key] = tos.get(key, 0) + value
+    lines = ["📈 Hisobot (Toshkent vaqti)", "kun | yangi | faol | buyurtma | odam | pochta"]
+    for day in sorted(days):
+        d = days[day]
+        lines.append(f"{day} | {d.get(NEW_USERS, 0)} | {d.get(ACTIVE_USERS, 0)} | "
+                     f"{d.get(ORDERS, 0)} | {d.get(PEOPLE, 0)} | {d.get(CARGO, 0)}")
+    def block(title: str, src: Dict[str, int]):
+        if src:
+            lines.append("")
+            lines.append(title)
+            for k, v in sorted(src.items(), key=lambda kv: -kv[1])[:top]:
+                lines.append(f"  {k}: {v}")
+    block("🚖 Yo'nalishlar:", routes)
+    block("🚏 Qayerdan (top):", froms)
+    block("🏁 Qayerga (top):", tos)
+    return "\n".join(lines)
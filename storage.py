@@ -0,0 +1,138 @@
+# storage.py — FSM holatlari uchun doimiy, worker'lar o'rtasida umumiy storage
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+log = logging.getLogger("davon-taksi-bot.storage")
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")        # "sqlite" | "memory" | "redis://host:6379/0"
+FSM_TTL     = int(os.getenv("FSM_TTL", str(6 * 3600)))  # tashlab ketilgan suhbatlar shu vaqtdan keyin o'chadi
+FSM_BUSY_TIMEOUT = int(os.getenv("FSM_BUSY_TIMEOUT", "5000"))   # ms; executor'da kutiladi, loop'da emas
+FSM_PURGE_EVERY = 300
+
+SQL_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS fsm(
+        key        TEXT PRIMARY KEY,
+        state      TEXT,
+        data       TEXT,
+        updated_at INTEGER
+    ) WITHOUT ROWID
+"""
+SQL_GET = "SELECT state, data, updated_at FROM fsm WHERE key=?"
+# Muddati o'tgan yozuvning ikkinchi yarmi qayta tirilmasligi uchun tozalanadi
+SQL_SET_STATE = """
+    INSERT INTO fsm(key, state, data, updated_at) VALUES (?, ?, NULL, ?)
+    ON CONFLICT(key) DO UPDATE SET
+        state=excluded.state,
+        data=CASE WHEN fsm.updated_at < ? THEN NULL ELSE fsm.data END,
+        updated_at=excluded.updated_at
+"""
+SQL_SET_DATA = """
+    INSERT INTO fsm(key, state, data, updated_at) VALUES (?, NULL, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET
+        data=excluded.data,
+        state=CASE WHEN fsm.updated_at < ? THEN NULL ELSE fsm.state END,
+        updated_at=excluded.updated_at
+"""
+SQL_DELETE_EMPTY = "DELETE FROM fsm WHERE key=? AND state IS NULL AND data IS NULL"
+SQL_PURGE        = "DELETE FROM fsm WHERE updated_at < ?"
+
+
+def _dumps(data: Dict[str, Any]) -> Optional[str]:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else None
+
+
+class SQLiteStorage(BaseStorage):
+    """aiogram BaseStorage SQLite ustida (WAL).
+
+    So'rovlar alohida bitta thread'li executor'da bajariladi: boshqa worker yozayotganda
+    busy_timeout kutishi event loop'ni to'xtatmaydi, ulanish esa doim bitta thread'da
+    ishlatiladi (so'rovlar ketma-ket, qulfsiz)."""
+
+    def __init__(self, path: str, ttl: int = FSM_TTL, key_builder: Optional[KeyBuilder] = None):
+        self.path = path
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, cached_statements=32)
+        for p in ("PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL",
+                  f"PRAGMA busy_timeout={FSM_BUSY_TIMEOUT}", "PRAGMA temp_store=MEMORY"):
+            self._conn.execute(p)
+        self._conn.execute(SQL_SCHEMA)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm")
+        self._last_purge = 0.0
+
+    async def _run(self, fn: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _expired_before(self, now: float) -> int:
+        return int(now - self.ttl) if self.ttl else 0
+
+    # ---------- sync (executor thread) ----------
+    def _row(self, k: str):
+        row = self._conn.execute(SQL_GET, (k,)).fetchone()
+        if row is None or row[2] < self._expired_before(time.time()):
+            return None
+        return row
+
+    def _touch(self, k: str):
+        self._conn.execute(SQL_DELETE_EMPTY, (k,))
+        now = time.time()
+        if self.ttl and now - self._last_purge > FSM_PURGE_EVERY:
+            self._last_purge = now
+            n = self._conn.execute(SQL_PURGE, (self._expired_before(now),)).rowcount
+            if n:
+                log.info("[FSM] purged %s abandoned conversations", n)
+
+    def _write(self, sql: str, k: str, value: Optional[str]):
+        now = int(time.time())
+        self._conn.execute(sql, (k, value, now, self._expired_before(now)))
+        if value is None:
+            self._touch(k)
+
+    # ---------- BaseStorage ----------
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._run(self._write, SQL_SET_STATE, self.key_builder.build(key), value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self._run(self._row, self.key_builder.build(key))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._run(self._write, SQL_SET_DATA, self.key_builder.build(key), _dumps(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self._run(self._row, self.key_builder.build(key))
+        return json.loads(row[1]) if row and row[1] else {}
+
+    async def close(self) -> None:
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=False)
+
+
+def redis_storage(redis: Any, ttl: int = FSM_TTL) -> BaseStorage:
+    """Tayyor redis.asyncio klientidan storage: kalitlar va TTL SQLiteStorage bilan bir xil."""
+    from aiogram.fsm.storage.redis import RedisStorage
+    return RedisStorage(redis, key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+                        state_ttl=ttl or None, data_ttl=ttl or None)
+
+def make_storage(path: str) -> BaseStorage:
+    """FSM_STORAGE bo'yicha storage tanlaydi. Redis ixtiyoriy: `redis` paketi kerak."""
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    if FSM_STORAGE.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise RuntimeError("FSM_STORAGE=redis uchun `pip install redis` kerak") from e
+        return redis_storage(Redis.from_url(FSM_STORAGE))
+    return SQLiteStorage(path)
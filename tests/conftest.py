@@ -0,0 +1,94 @@
+# Testlar tarmoqsiz: Bot sessiyasi soxta, baza vaqtinchalik papkada. main import qilinishidan
+# oldin muhit shu yerda o'rnatiladi.
+import os
+import sys
+import time
+import tempfile
+import itertools
+
+_TMP = tempfile.mkdtemp(prefix="davon-test-")
+os.environ.update({
+    "DB_PATH": os.path.join(_TMP, "orders.db"),
+    "FSM_DB_PATH": os.path.join(_TMP, "fsm.db"),
+    "BOT_TOKEN": "123456:TEST-TOKEN",
+    "ADMIN_USER_ID": "1",
+    "ADMIN_CHAT_ID": "-1001",
+    "AUTO_ANNOUNCE": "0",
+    "THROTTLE": "0",
+    "CATALOG_WATCH": "0",
+    "WEBHOOK_SECRET": "test-secret",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from aiogram.client.session.base import BaseSession
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+_ids = itertools.count(1000)
+
+
+class FakeSession(BaseSession):
+    """Har Bot API chaqiruvini yozib boradi; SendMessage'ga Message, qolganiga True."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append(method)
+        name = type(method).__name__
+        if name in ("SendMessage", "SendDocument"):
+            return Message(message_id=next(_ids), date=int(time.time()),
+                           chat=Chat(id=method.chat_id, type="private"), text=getattr(method, "text", None))
+        if name == "GetUpdates":
+            return []
+        return True
+
+    async def stream_content(self, *a, **k):
+        if False:
+            yield b""
+
+    async def close(self):
+        pass
+
+    def sent(self, name: str = "SendMessage"):
+        return [m for m in self.calls if type(m).__name__ == name]
+
+
+def message_update(uid: int, text: str = None, update_id: int = None, **kw) -> Update:
+    user = User(id=uid, is_bot=False, first_name=f"U{uid}", username=f"u{uid}")
+    msg = Message(message_id=next(_ids), date=int(time.time()), chat=Chat(id=uid, type="private"),
+                  from_user=user, text=text, **kw)
+    return Update(update_id=update_id if update_id is not None else next(_ids), message=msg)
+
+
+def callback_update(uid: int, data: str) -> Update:
+    user = User(id=uid, is_bot=False, first_name=f"U{uid}")
+    bot_msg = Message(message_id=1, date=int(time.time()), chat=Chat(id=uid, type="private"),
+                      from_user=User(id=42, is_bot=True, first_name="bot"), text="x")
+    return Update(update_id=next(_ids), callback_query=CallbackQuery(
+        id=str(next(_ids)), from_user=user, chat_instance="c", message=bot_msg, data=data))
+
+
+@pytest.fixture
+def main_module():
+    import main
+    session = FakeSession()
+    main.bot.session = session
+    main.fake = session
+    return main
+
+
+@pytest.fixture
+def database(tmp_path):
+    from db import Database
+    db = Database(str(tmp_path / "orders.db"), pool_size=2)
+    db.open()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def fake_bot():
+    from aiogram import Bot
+    return Bot("123456:TEST-TOKEN", session=FakeSession())
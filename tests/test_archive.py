@@ -0,0 +1,52 @@
+import asyncio
+import csv
+import gzip
+import os
+import time
+
+import archive
+import export
+
+OLD = int(time.time()) - 200 * 86400
+
+
+def _row(uid, ts):
+    return (uid, f"U{uid}", None, "+998901234567", "Тошкент", "Чилонзор", "Андижон", "Асака",
+            1, "Йўқ", "-", ts, None)
+
+
+def _exported(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_stale_snapshot_after_archive_is_not_double_counted(database, tmp_path):
+    async def fill():
+        for uid in range(5):
+            await database.insert_order(_row(uid, OLD + uid))
+        await database.insert_order(_row(9, int(time.time())))
+    asyncio.run(fill())
+    snap, arc_dir = str(tmp_path / "snapshot.db"), str(tmp_path / "archive")
+    archive.snapshot(database.path, snap)   # arxivlashdan oldingi snapshot
+    assert archive.archive_orders(database.path, arc_dir, int(time.time()) - 90 * 86400) == 5
+
+    # Snapshot arxivdan eski — jonli baza ishlatiladi
+    assert archive.read_source(database.path, snap, arc_dir, snapshot_every=900) == database.path
+
+    # Eski snapshot baribir ishlatilsa ham (masalan, CLI) arxivdagi id'lar takrorlanmaydi
+    since, until = export.tashkent_day(OLD - 86400), export.tashkent_day()
+    archives = archive.archive_paths(arc_dir, export.day_start(since), export.day_start(until) + 86400)
+    out, n = export.export(snap, "orders", since, until, out_path=str(tmp_path / "o.csv.gz"), archives=archives)
+    ids = [r["id"] for r in _exported(out)]
+    assert n == 6 and len(set(ids)) == 6
+
+
+def test_read_source_freshness(tmp_path):
+    live, snap, arc_dir = str(tmp_path / "orders.db"), str(tmp_path / "snapshot.db"), str(tmp_path / "archive")
+    assert archive.read_source(live, snap, arc_dir, snapshot_every=900) == live   # snapshot yo'q
+    open(snap, "w").close()
+    assert archive.read_source(live, snap, arc_dir, snapshot_every=900) == snap
+    old = time.time() - 3 * 900   # restartdan oldingi yoki yangilanmay qolgan snapshot
+    os.utime(snap, (old, old))
+    assert archive.read_source(live, snap, arc_dir, snapshot_every=900) == live
+    assert archive.read_source(live, snap, arc_dir, snapshot_every=0) == live
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+from broadcast import Broadcaster
+
+
+def _add_users(database, n):
+    database._call(lambda c: c.executemany(
+        "INSERT INTO users(tg_user_id, joined_at, last_seen) VALUES (?, 0, 0)",
+        [(i,) for i in range(1, n + 1)]) and c.commit(), ())
+
+
+def _rows(database):
+    return database._call(lambda c: c.execute("SELECT id, status FROM broadcasts ORDER BY id").fetchall(), ())
+
+
+def test_start_once_skips_running_and_recent(database, fake_bot):
+    _add_users(database, 5)
+
+    async def run():
+        b = Broadcaster(fake_bot, database)
+        first = await b.start_once("salom", within=3600)
+        second = await b.start_once("salom", within=3600)      # birinchisi hali ishlayapti yoki yangi
+        other = await b.start_once("boshqa matn", within=3600)
+        await asyncio.gather(*b._tasks.values())
+        return first, second, other
+
+    first, second, other = asyncio.run(run())
+    assert first is not None and other is not None
+    assert second is None
+    assert len(_rows(database)) == 2
+
+
+def test_start_once_after_window(database, fake_bot):
+    old = int(time.time()) - 7200
+    database._call(lambda c: c.execute(
+        "INSERT INTO broadcasts(text, status, cursor, total, sent, failed, blocked, created_at, updated_at) "
+        "VALUES ('salom', 'done', 0, 0, 0, 0, 0, ?, ?)", (old, old)) and c.commit(), ())
+
+    async def run():
+        b = Broadcaster(fake_bot, database)
+        bid = await b.start_once("salom", within=3600)
+        await asyncio.gather(*b._tasks.values())
+        return bid
+
+    assert asyncio.run(run()) is not None
+
+
+def test_restart_resume_does_not_duplicate_announce(database, fake_bot):
+    _add_users(database, 50)
+    # restartdan oldin yarim yo'lda qolgan e'lon
+    now = int(time.time())
+    database._call(lambda c: c.execute(
+        "INSERT INTO broadcasts(text, status, cursor, total, sent, failed, blocked, created_at, updated_at) "
+        "VALUES ('salom', 'running', 25, 50, 25, 0, 0, ?, ?)", (now, now)) and c.commit(), ())
+
+    async def run():
+        b = Broadcaster(fake_bot, database)
+        await b.resume()
+        bid = await b.start_once("salom", within=3600)
+        await asyncio.gather(*b._tasks.values())
+        return bid
+
+    assert asyncio.run(run()) is None
+    sent = [m.chat_id for m in fake_bot.session.sent()]
+    assert sorted(sent) == list(range(26, 51))
@@ -0,0 +1,26 @@
+import time
+
+from cache import ProfileCache
+
+
+def test_empty_results_cached_briefly(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = ProfileCache(ttl=900, neg_ttl=30)
+    cache.set(1, "phone", None)
+    cache.set(1, "recent", [])
+    cache.set(1, "last_order", {"route_from": "A"})
+    assert cache.get(1, "phone") == (True, None)
+    assert cache.get(1, "recent") == (True, [])
+    now[0] += 31
+    # bo'sh natijalar eskirdi — bazadan qayta o'qiladi; to'liq qiymat hali yashaydi
+    assert cache.get(1, "phone") == (False, None)
+    assert cache.get(1, "recent") == (False, None)
+    assert cache.get(1, "last_order") == (True, {"route_from": "A"})
+
+
+def test_write_replaces_cached_empty_value():
+    cache = ProfileCache(ttl=60, neg_ttl=30)
+    cache.set(1, "phone", None)
+    cache.set(1, "phone", "+998901234567")
+    assert cache.get(1, "phone") == (True, "+998901234567")
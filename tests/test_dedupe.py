@@ -0,0 +1,78 @@
+import asyncio
+
+from conftest import message_update
+from db import DUPLICATE
+from dedupe import Dedupe
+
+ORDER = {"phone": "+998901234567", "route_from": "Тошкент", "from_district": "Чилонзор",
+         "route_to": "Андижон", "to_district": "Асака", "people": 2, "cargo": "Йўқ"}
+
+
+def _row(key, ts):
+    return (5, "U5", "u5", ORDER["phone"], ORDER["route_from"], ORDER["from_district"],
+            ORDER["route_to"], ORDER["to_district"], 2, "Йўқ", "-", ts, key)
+
+
+def test_duplicate_straddling_window_boundary_is_caught(database):
+    boundary = 120 * 1000
+    # Har biri alohida instansda (xotiradagi qatlam ko'rmaydi) — faqat DB kaliti qoladi
+    first, second, later = (Dedupe(order_window=120).claim_order(5, ORDER, ts)
+                            for ts in (boundary - 1, boundary + 1, boundary + 200))
+    assert first != second   # turli oynalar
+
+    async def scenario():
+        assert await database.insert_order(_row(first, boundary - 1)) != DUPLICATE
+        assert await database.insert_order(_row(second, boundary + 1)) == DUPLICATE
+        # oyna o'tgach — yangi buyurtma
+        assert await database.insert_order(_row(later, boundary + 200)) != DUPLICATE
+
+    asyncio.run(scenario())
+
+
+def test_same_order_claimed_once_until_released():
+    d = Dedupe(order_window=120)
+    assert d.claim_order(5, ORDER) is not None
+    assert d.claim_order(5, ORDER) is None
+    assert d.claim_order(5, {**ORDER, "people": 3}) is not None
+    d.release(5, ORDER)
+    assert d.claim_order(5, ORDER) is not None
+
+
+def test_failed_save_releases_claim(main_module, monkeypatch):
+    main = main_module
+
+    async def failed_save(user, data, key=None, on_saved=None):
+        return False
+    monkeypatch.setattr(main, "save_order_safe", failed_save)
+    monkeypatch.setattr(main, "notify_unsaved", lambda user, data: None)
+    m = message_update(77, "x").message.as_(main.bot)
+
+    asyncio.run(main.place_order(m, m.from_user, dict(ORDER)))
+    assert main.dedupe.claim_order(77, ORDER) is not None
+
+
+def test_update_retried_after_failed_handler_is_handled(fake_bot):
+    from aiogram import Dispatcher
+    from dedupe import DedupeMiddleware
+
+    dp, calls = Dispatcher(), []
+    dp.update.outer_middleware(DedupeMiddleware(Dedupe()))
+
+    @dp.message()
+    async def handler(m):
+        calls.append(m.text)
+        if len(calls) == 1:
+            raise RuntimeError("db down")
+
+    update = message_update(5, "hi", update_id=4242)
+
+    async def scenario():
+        try:
+            await dp.feed_update(fake_bot, update)
+        except RuntimeError:
+            pass
+        await dp.feed_update(fake_bot, update)   # Telegram qayta yubordi
+        await dp.feed_update(fake_bot, update)   # muvaffaqiyatdan keyingi nusxa — tashlanadi
+
+    asyncio.run(scenario())
+    assert calls == ["hi", "hi"]
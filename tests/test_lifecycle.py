@@ -0,0 +1,122 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+
+from conftest import FakeSession, message_update
+from lifecycle import UpdatePoller
+
+CHATTY = 7
+
+
+def _dispatcher(gate: asyncio.Event, seen: list) -> Dispatcher:
+    dp = Dispatcher()
+
+    @dp.message()
+    async def handler(m):
+        seen.append((m.from_user.id, m.text))
+        if m.from_user.id == CHATTY:
+            await gate.wait()
+
+    return dp
+
+
+async def _feed(poller: UpdatePoller, update):
+    # run() siklidagi bilan bir xil: bufer joyi, keyin _submit
+    await poller._buffer.acquire()
+    poller._buffered += 1
+    poller._submit(update)
+
+
+def test_chatty_user_does_not_block_others(fake_bot):
+    async def scenario():
+        gate, seen = asyncio.Event(), []
+        poller = UpdatePoller(_dispatcher(gate, seen), fake_bot, concurrency=2)
+        for i in range(5):
+            await _feed(poller, message_update(CHATTY, f"c{i}"))
+        for uid in (8, 9):
+            await _feed(poller, message_update(uid, "hi"))
+        await asyncio.sleep(0.05)
+        # Faqat navbat boshi joy egallaydi: 8 va 9 kutib qolmaydi
+        assert (8, "hi") in seen and (9, "hi") in seen
+        assert [t for u, t in seen if u == CHATTY] == ["c0"]
+        gate.set()
+        assert await poller.drain(1.0) == 0
+        assert [t for u, t in seen if u == CHATTY] == [f"c{i}" for i in range(5)]
+        assert poller.in_flight() == 0 and not poller._queues
+
+    asyncio.run(scenario())
+
+
+def test_drain_cancels_after_timeout(fake_bot):
+    async def scenario():
+        gate, seen = asyncio.Event(), []
+        poller = UpdatePoller(_dispatcher(gate, seen), fake_bot, concurrency=2)
+        for i in range(3):
+            await _feed(poller, message_update(CHATTY, f"c{i}"))
+        await asyncio.sleep(0.01)
+        assert await poller.drain(0.05) == 1
+        assert poller.in_flight() == 0 and not poller._queues
+
+    asyncio.run(scenario())
+
+
+def test_stop_leaves_queued_updates_unconfirmed(fake_bot):
+    async def scenario():
+        gate, seen = asyncio.Event(), []
+        poller = UpdatePoller(_dispatcher(gate, seen), fake_bot, concurrency=2)
+        updates = [message_update(CHATTY, f"c{i}") for i in range(3)]
+        for u in updates:
+            poller._unstarted.add(u.update_id)
+            poller._next_id = u.update_id + 1
+            await _feed(poller, u)
+        await asyncio.sleep(0.01)
+        poller.stop()
+        gate.set()
+        assert await poller.drain(1.0) == 0
+        # c0 boshlangan edi — tugadi; c1, c2 boshlanmaydi va tasdiqlanmaydi
+        assert [t for _, t in seen] == ["c0"]
+        assert poller.offset == updates[1].update_id
+        assert poller.in_flight() == 0 and not poller._queues
+
+    asyncio.run(scenario())
+
+
+class TelegramStub(FakeSession):
+    """getUpdates: offset'dan oldingilarni tasdiqlangan deb o'chiradi, qolganini qaytaradi.
+    Yangi yangilanish bo'lmasa long-poll o'rniga qisqa kutish."""
+
+    def __init__(self, updates):
+        super().__init__()
+        self.pending, self.offsets = list(updates), []
+
+    async def make_request(self, bot, method, timeout=None):
+        if type(method).__name__ != "GetUpdates":
+            return await super().make_request(bot, method, timeout)
+        self.offsets.append(method.offset)
+        if method.offset is not None:
+            self.pending = [u for u in self.pending if u.update_id >= method.offset]
+        if method.limit == 1 or not self.pending:
+            await asyncio.sleep(0.01)
+        return self.pending[:1] if method.limit == 1 else list(self.pending)
+
+
+def test_poll_offset_never_passes_queued_updates():
+    async def scenario():
+        gate, seen = asyncio.Event(), []
+        c0, c1, other = message_update(CHATTY, "c0"), message_update(CHATTY, "c1"), message_update(8, "hi")
+        telegram = TelegramStub([c0, c1, other])
+        poller = UpdatePoller(_dispatcher(gate, seen), Bot("123456:TEST-TOKEN", session=telegram), concurrency=2)
+        run = asyncio.create_task(poller.run())
+        await asyncio.sleep(0.1)
+        # c0 ishlanmoqda, c1 navbatda: u tasdiqlanmaydi va bo'sh aylanish yo'q
+        assert telegram.pending[0] is c1
+        assert all(o in (None, c1.update_id) for o in telegram.offsets) and len(telegram.offsets) <= 3
+        gate.set()
+        await asyncio.sleep(0.05)
+        poller.stop()
+        await asyncio.wait_for(run, 1.0)
+        assert await poller.drain(1.0) == 0
+        assert sorted(t for _, t in seen) == ["c0", "c1", "hi"]   # qayta kelganlar takror ishlanmadi
+        assert telegram.pending == [] and telegram.offsets[-1] == other.update_id + 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,43 @@
+import asyncio
+
+from aiogram import Dispatcher
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import metrics
+from conftest import message_update
+
+
+class Form(StatesGroup):
+    phone = State()
+
+
+class CountingStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    async def get_state(self, key):
+        self.reads += 1
+        return await super().get_state(key)
+
+
+def test_state_funnel_without_extra_storage_read(fake_bot):
+    storage = CountingStorage()
+    dp = Dispatcher(storage=storage)
+    dp.message.middleware(metrics.HandlerMetricsMiddleware())
+
+    @dp.message()
+    async def handler(m, state):
+        if m.text == "go":
+            await state.set_state(Form.phone)
+
+    before = metrics.STATE_ENTERED.value(Form.phone.state)
+
+    async def scenario():
+        await dp.feed_update(fake_bot, message_update(5, "go"))
+        await dp.feed_update(fake_bot, message_update(5, "stay"))   # holat o'zgarmadi
+
+    asyncio.run(scenario())
+    assert metrics.STATE_ENTERED.value(Form.phone.state) == before + 1
+    assert storage.reads == 2   # faqat aiogram'ning raw_state o'qishi, har update'ga bitta
@@ -0,0 +1,36 @@
+import multiprocessing
+import sqlite3
+
+from db import PRAGMAS
+from migrations import MIGRATIONS, current_version, migrate
+
+
+def _worker(path, barrier, results):
+    conn = sqlite3.connect(path)
+    try:
+        for p in PRAGMAS:
+            conn.execute(p)
+        barrier.wait()
+        results.put(("ok", migrate(conn)))
+    except Exception as e:
+        results.put(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def test_concurrent_processes_migrate_fresh_db_once(tmp_path):
+    path = str(tmp_path / "orders.db")
+    ctx = multiprocessing.get_context("fork")
+    n = 4
+    barrier, results = ctx.Barrier(n), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(path, barrier, results)) for _ in range(n)]
+    for p in procs:
+        p.start()
+    out = [results.get(timeout=60) for _ in procs]
+    for p in procs:
+        p.join(10)
+    latest = MIGRATIONS[-1][0]
+    assert out == [("ok", latest)] * n
+    with sqlite3.connect(path) as conn:
+        assert current_version(conn) == latest
+        assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(MIGRATIONS)
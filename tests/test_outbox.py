@@ -0,0 +1,105 @@
+import asyncio
+
+from aiogram import Bot
+
+import outbox
+from conftest import FakeSession
+from outbox import OperatorOutbox
+
+CHAT = -1001
+
+
+class FailingSession(FakeSession):
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append(method)
+        raise RuntimeError("network down")
+
+
+def _row(uid, ts=1_700_000_000):
+    return (uid, f"U{uid}", None, "+998901234567", "Тошкент", "Чилонзор", "Андижон", "Асака",
+            uid % 4 + 1, "Йўқ", "-", ts, None)
+
+
+def _status(database):
+    def q(conn):
+        return conn.execute("SELECT order_id, status, attempts FROM operator_outbox ORDER BY order_id").fetchall()
+    return asyncio.run(database.run(q))
+
+
+def _make_due(database):
+    def q(conn):
+        with conn:
+            conn.execute("UPDATE operator_outbox SET next_at=0")
+    asyncio.run(database.run(q))
+
+
+def _drain(database, session, **kw):
+    async def scenario():
+        await OperatorOutbox(Bot("123456:TEST-TOKEN", session=session), database, CHAT, **kw).drain()
+    asyncio.run(scenario())
+
+
+def _enqueue(database, *uids):
+    async def scenario():
+        return [await database.insert_order(_row(uid), notify=True) for uid in uids]
+    return asyncio.run(scenario())
+
+
+def test_pending_order_is_delivered_once(database):
+    (oid,) = _enqueue(database, 5)
+    session = FakeSession()
+    _drain(database, session)
+    _drain(database, session)
+    assert len(session.sent()) == 1
+    assert _status(database) == [(oid, "sent", 0)]
+
+
+def test_burst_goes_out_as_one_digest(database):
+    _enqueue(database, 5, 6, 7)
+    session = FakeSession()
+    _drain(database, session, digest_min=3, window=0)
+    assert len(session.sent()) == 1
+    assert [s for _, s, _ in _status(database)] == ["sent"] * 3
+
+
+def test_failed_send_retries_then_goes_dead(database, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    (oid,) = _enqueue(database, 5)
+    _drain(database, FailingSession())
+    assert _status(database) == [(oid, "pending", 1)]
+    _drain(database, FailingSession())   # backoff: hali vaqti kelmagan
+    assert _status(database) == [(oid, "pending", 1)]
+    _make_due(database)
+    _drain(database, FailingSession())
+    assert _status(database) == [(oid, "dead", 2)]
+    _make_due(database)
+    session = FakeSession()
+    _drain(database, session)
+    assert session.sent() == []
+
+
+def test_non_leader_wake_delivers_promptly(database):
+    (oid,) = _enqueue(database, 5)
+    session = FakeSession()
+
+    async def scenario():
+        box = OperatorOutbox(Bot("123456:TEST-TOKEN", session=session), database, CHAT, poll=60)
+        box.wake()   # start() chaqirilmagan — leader emas
+        await asyncio.sleep(0.1)
+        await box.stop()
+    asyncio.run(scenario())
+    assert len(session.sent()) == 1
+    assert _status(database) == [(oid, "sent", 0)]
+
+
+def test_workers_draining_together_send_each_order_once(database):
+    _enqueue(database, 5, 6)
+    sessions = [FakeSession() for _ in range(3)]
+
+    async def scenario():
+        boxes = [OperatorOutbox(Bot("123456:TEST-TOKEN", session=s), database, CHAT, digest_min=10)
+                 for s in sessions]
+        await asyncio.gather(*(b.drain() for b in boxes))
+    asyncio.run(scenario())
+    assert sum(len(s.sent()) for s in sessions) == 2
+    assert [s for _, s, _ in _status(database)] == ["sent", "sent"]
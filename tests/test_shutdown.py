@@ -0,0 +1,19 @@
+import asyncio
+
+
+def _shutdown(main, monkeypatch, leader):
+    drained = []
+
+    async def drain():
+        drained.append(True)
+    monkeypatch.setattr(main.outbox, "drain", drain)
+    asyncio.run(main.on_shutdown(timeout=1.0, leader=leader))
+    return drained
+
+
+def test_non_leader_does_not_drain_outbox(main_module, monkeypatch):
+    assert _shutdown(main_module, monkeypatch, leader=False) == []
+
+
+def test_leader_drains_outbox(main_module, monkeypatch):
+    assert _shutdown(main_module, monkeypatch, leader=True) == [True]
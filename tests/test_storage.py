@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from storage import FSM_TTL, SQLiteStorage, redis_storage
+
+KEY = StorageKey(bot_id=42, chat_id=5, user_id=5)
+
+
+async def _roundtrip(storage):
+    await storage.set_state(KEY, "Order:phone")
+    await storage.set_data(KEY, {"people": 2})
+    assert await storage.get_state(KEY) == "Order:phone"
+    assert await storage.get_data(KEY) == {"people": 2}
+    await storage.set_state(KEY, None)
+    await storage.set_data(KEY, {})
+    assert await storage.get_state(KEY) is None and await storage.get_data(KEY) == {}
+
+
+def test_sqlite_storage_roundtrip_off_loop(tmp_path):
+    async def scenario():
+        storage = SQLiteStorage(str(tmp_path / "fsm.db"))
+        threads = []
+        execute = storage._row
+        storage._row = lambda k: threads.append(threading.current_thread()) or execute(k)
+        try:
+            await _roundtrip(storage)
+        finally:
+            await storage.close()
+        # sqlite chaqiruvlari event loop thread'ida emas
+        assert threads and threading.main_thread() not in threads
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_storage_expires_abandoned_state(tmp_path):
+    async def scenario():
+        storage = SQLiteStorage(str(tmp_path / "fsm.db"), ttl=1)
+        try:
+            await storage.set_state(KEY, "Order:phone")
+            await storage._run(storage._conn.execute, "UPDATE fsm SET updated_at = updated_at - 5")
+            assert await storage.get_state(KEY) is None
+        finally:
+            await storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_redis_storage_roundtrip_and_ttl():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis()
+        storage = redis_storage(redis)
+        try:
+            await storage.set_state(KEY, "Order:phone")
+            await storage.set_data(KEY, {"people": 2})
+            keys = await redis.keys("*")
+            assert len(keys) == 2
+            for k in keys:
+                assert 0 < await redis.ttl(k) <= FSM_TTL
+            await _roundtrip(storage)
+        finally:
+            await storage.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,42 @@
+import importlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+import webhook
+
+
+def _post(client, headers):
+    body = {"update_id": 1, "message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"},
+                                        "from": {"id": 1, "is_bot": False, "first_name": "a"},
+                                        "text": "/export users"}}
+    return client.post(webhook.WEBHOOK_PATH, json=body, headers=headers)
+
+
+def test_rejects_missing_or_wrong_secret():
+    client = TestClient(webhook.app)   # lifespan ishga tushmaydi
+    assert _post(client, {}).status_code == 403
+    assert _post(client, {"X-Telegram-Bot-Api-Secret-Token": "nope"}).status_code == 403
+    assert _post(client, {"X-Telegram-Bot-Api-Secret-Token": "тест".encode()}).status_code == 403
+
+
+def test_refuses_to_start_without_secret(monkeypatch):
+    monkeypatch.setenv("WEBHOOK_SECRET", "")
+    with pytest.raises(RuntimeError):
+        importlib.reload(webhook)
+    monkeypatch.setenv("WEBHOOK_SECRET", "test-secret")
+    importlib.reload(webhook)
+
+
+def test_metrics_not_public_on_webhook_app():
+    assert TestClient(webhook.app).get("/metrics").status_code == 404
+
+
+def test_metrics_route_requires_token():
+    from fastapi import FastAPI
+    from metrics import add_metrics_route
+    client = TestClient(add_metrics_route(FastAPI(), token="s3cret"))
+    assert client.get("/metrics").status_code == 403
+    assert client.get("/metrics", headers={"Authorization": "Bearer nope"}).status_code == 403
+    ok = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert ok.status_code == 200 and ok.headers["content-type"].startswith("text/plain")
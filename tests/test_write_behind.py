@@ -0,0 +1,52 @@
+import asyncio
+
+from conftest import message_update
+from db import DUPLICATE, WriteBehind
+
+
+def _row(uid, key, ts=1_700_000_000):
+    return (uid, "U", "u", "+998901234567", "Тошкент", "Чилонзор", "Андижон", "Асака",
+            2, "Йўқ", "-", ts, key)
+
+
+def test_async_order_reports_id_after_flush(database):
+    async def scenario():
+        wb = WriteBehind(database, flush_ms=10)
+        saved = []
+        assert await wb.add_order(_row(5, "k:1"), sync=False, on_saved=saved.append) is None
+        assert saved == []   # hali yozilmagan
+        await wb.add_order(_row(5, "k:1"), sync=False, on_saved=saved.append)   # takror
+        await wb.stop()
+        assert len(saved) == 1 and saved[0] != DUPLICATE
+
+    asyncio.run(scenario())
+
+
+def test_async_order_offered_to_drivers_after_flush(main_module, monkeypatch):
+    main = main_module
+    offered = []
+
+    async def offer(user, data):
+        offered.append(data["order_id"])
+    monkeypatch.setattr(main, "offer_to_drivers", offer)
+    m = message_update(88, "x").message.as_(main.bot)
+    data = {"phone": "+998901234567", "route_from": "Тошкент", "from_district": "Чилонзор",
+            "route_to": "Андижон", "to_district": "Асака", "people": 1, "cargo": "Йўқ"}
+
+    async def scenario():
+        monkeypatch.setattr(main.wb, "add_order", _async_only(main.wb.add_order))
+        await main.db.start()
+        await main.place_order(m, m.from_user, data)
+        assert offered == []
+        await main.wb.flush()
+        await asyncio.gather(*main._inflight)
+        await main.wb.stop()
+
+    asyncio.run(scenario())
+    assert len(offered) == 1 and offered[0]
+
+
+def _async_only(add_order):
+    async def wrapper(row, sync=True, on_saved=None):
+        return await add_order(row, sync=False, on_saved=on_saved)
+    return wrapper
@@ -0,0 +1,135 @@
+# throttle.py — foydalanuvchi bo'yicha token bucket: tez-tez bosishlarni handler'gacha to'xtatadi
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from metrics import THROTTLED
+
+THROTTLE_RULES    = os.getenv("THROTTLE_RULES", "default=3/8,page=2/4,stats=0.1/2,report=0.05/1,export=0.02/1")
+THROTTLE_DUP_MS   = int(os.getenv("THROTTLE_DUP_MS", "700"))     # bir xil sahifa tugmasi shu oynada — bitta
+THROTTLE_MAX_KEYS = int(os.getenv("THROTTLE_MAX_KEYS", "50000"))
+THROTTLE_IDLE     = 600.0      # shuncha s tinch turgan foydalanuvchi yozuvi o'chadi
+THROTTLE_NOTICE   = "⏳ Juda tez! Birozdan so‘ng qayta urinib ko‘ring."
+
+Rule = Tuple[float, float]   # (sekundiga token, bucket sig'imi)
+
+
+def parse_rules(spec: str) -> Dict[str, Rule]:
+    """"default=3/8,page=2/4" -> {"default": (3.0, 8.0), "page": (2.0, 4.0)}.
+    Kalit: buyruq nomi, callback prefiksi, FSM holati ("OrderForm:choice"), "page" yoki "default"."""
+    rules: Dict[str, Rule] = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, val = part.partition("=")
+        rate, _, burst = val.partition("/")
+        rules[name.strip()] = (float(rate), float(burst or rate))
+    rules.setdefault("default", (3.0, 8.0))
+    return rules
+
+
+class _Bucket:
+    __slots__ = ("tokens", "stamp", "notified", "last_text", "last_at")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.stamp = now
+        self.notified = False
+        self.last_text: Optional[str] = None
+        self.last_at = 0.0
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    """Outer middleware (dp.message / dp.callback_query): filtrlar va handler'dan oldin.
+
+    Har (foydalanuvchi, qoida) uchun token bucket; token bo'lmasa yangilanish jim tashlanadi,
+    faqat birinchi marta qisqa ogohlantirish yuboriladi. Sahifa tugmasi (`page_texts`: matn
+    yoki callback prefiksi) THROTTLE_DUP_MS ichida takrorlansa — bitta bosish sifatida olinadi.
+    Yozuvlar LRU + bo'sh turish muddati bilan cheklangan."""
+
+    def __init__(self, rules: Optional[Dict[str, Rule]] = None, page_texts: Iterable[str] = (),
+                 exempt: Optional[Callable[[int], bool]] = None, dup_ms: int = THROTTLE_DUP_MS,
+                 max_keys: int = THROTTLE_MAX_KEYS, idle: float = THROTTLE_IDLE):
+        self.rules = rules if rules is not None else parse_rules(THROTTLE_RULES)
+        self.page_texts = frozenset(page_texts)
+        self.exempt = exempt
+        self.dup = dup_ms / 1000
+        self.max_keys = max(1, max_keys)
+        self.idle = idle
+        self._buckets: "OrderedDict[Tuple[int, str], _Bucket]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def rule_for(self, event: TelegramObject, raw_state: Optional[str]) -> str:
+        rules = self.rules
+        if isinstance(event, Message):
+            text = event.text or ""
+            if text.startswith("/"):
+                cmd = text[1:].split(maxsplit=1)[0].split("@", 1)[0] if len(text) > 1 else ""
+                if cmd in rules:
+                    return cmd
+            elif text in self.page_texts and "page" in rules:
+                return "page"
+        elif isinstance(event, CallbackQuery):
+            prefix = (event.data or "").split(":", 1)[0]
+            if prefix in self.page_texts and "page" in rules:
+                return "page"
+            if prefix in rules:
+                return prefix
+        if raw_state in rules:
+            return raw_state
+        return "default"
+
+    def _bucket(self, key: Tuple[int, str], burst: float, now: float) -> _Bucket:
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = _Bucket(burst, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        # Eng eski yozuvlardan bir nechtasini tekshirib, muddati o'tganlarini o'chiramiz (amortizatsiya)
+        for _ in range(2):
+            k, old = next(iter(self._buckets.items()))
+            if old is b or now - old.stamp < self.idle:
+                break
+            del self._buckets[k]
+        return b
+
+    def check(self, uid: int, rule: str, text: Optional[str], now: float) -> Tuple[bool, bool]:
+        """(o'tkazish, ogohlantirish yuborish)."""
+        rate, burst = self.rules.get(rule) or self.rules["default"]
+        b = self._bucket((uid, rule), burst, now)
+        if rule == "page" and text == b.last_text and now - b.last_at < self.dup:
+            return False, False   # takroriy sahifa bosishi — bitta deb hisoblanadi
+        b.tokens = min(burst, b.tokens + (now - b.stamp) * rate)
+        b.stamp = now
+        if b.tokens >= 1:
+            b.tokens -= 1
+            b.notified = False
+            b.last_text, b.last_at = text, now
+            return True, False
+        notify = not b.notified
+        b.notified = True
+        return False, notify
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is None or (self.exempt is not None and self.exempt(user.id)):
+            return await handler(event, data)
+        rule = self.rule_for(event, data.get("raw_state"))
+        text = event.text if isinstance(event, Message) else getattr(event, "data", None)
+        ok, notify = self.check(user.id, rule, text, time.monotonic())
+        if ok:
+            return await handler(event, data)
+        THROTTLED.inc(rule)
+        if isinstance(event, CallbackQuery):
+            # callback'ga baribir javob kerak (aks holda tugma "soat"da qoladi); alert faqat bir marta
+            await event.answer(THROTTLE_NOTICE if notify else None)
+        elif notify:
+            await event.answer(THROTTLE_NOTICE, parse_mode=None)
+        return None
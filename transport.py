@@ -0,0 +1,126 @@
+# transport.py — Bot API uchun sozlangan HTTP sessiya va chiquvchi so'rovlar navbati (ustuvorlik bilan)
+import os
+import json
+import time
+import asyncio
+import functools
+from collections import deque
+from contextlib import suppress
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Tuple
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates
+
+from metrics import API_QUEUE_SECONDS
+
+HTTP_POOL_SIZE  = int(os.getenv("HTTP_POOL_SIZE", "32"))      # api.telegram.org ga keep-alive ulanishlar
+HTTP_KEEPALIVE  = float(os.getenv("HTTP_KEEPALIVE", "75"))    # bo'sh ulanish shuncha s ochiq turadi
+# Bir vaqtda yuborilayotgan so'rovlar; qolgan ulanishlar long-poll getUpdates va fayllar uchun.
+# aiohttp HTTP/1.1 pipelining qilmaydi: bitta ulanishda bitta so'rov, cheklov shu yerda.
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", str(max(1, HTTP_POOL_SIZE - 4))))
+
+# Ustuvorlik: kichik son — oldinroq. Handler javoblari INTERACTIVE (standart).
+INTERACTIVE, NOTIFY, BULK = 0, 1, 2
+PRIORITY_NAMES = ("interactive", "notify", "bulk")
+
+_priority: ContextVar[int] = ContextVar("api_priority", default=INTERACTIVE)
+
+# orjson ixtiyoriy: bo'lsa reply_markup'lar tezroq seriyalanadi va javoblar tezroq o'qiladi
+try:
+    import orjson
+
+    def json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+    json_loads = orjson.loads
+except ImportError:   # pragma: no cover
+    json_dumps = functools.partial(json.dumps, ensure_ascii=False, separators=(",", ":"))
+    json_loads = json.loads
+
+
+def prioritized(level: int):
+    """async funksiya ichidagi barcha Bot API chaqiruvlari `level` ustuvorlikda ketadi
+    (shu jumladan u ichida yaratilgan vazifalar). Chiqishda avvalgi qiymat tiklanadi."""
+    def deco(fn: Callable[..., Awaitable[Any]]):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            token = _priority.set(level)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _priority.reset(token)
+        return wrapper
+    return deco
+
+
+class PriorityGate:
+    """`slots` ta joyli semafor; bo'shagan joy eng yuqori ustuvorlikdagi navbatga beriladi.
+    Bir ustuvorlik ichida — kelish tartibida."""
+
+    def __init__(self, slots: int = API_CONCURRENCY, levels: int = len(PRIORITY_NAMES)):
+        self.free = max(1, slots)
+        self._queues: List[Deque[asyncio.Future]] = [deque() for _ in range(levels)]
+
+    def depth(self, level: int) -> int:
+        return len(self._queues[level])
+
+    async def acquire(self, level: int):
+        if self.free > 0 and not any(self._queues[:level + 1]):
+            self.free -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._queues[level].append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()   # joy berilgan edi — keyingisiga o'tkazamiz
+            else:
+                with suppress(ValueError):   # release() allaqachon chiqarib tashlagan bo'lishi mumkin
+                    self._queues[level].remove(fut)
+            raise
+
+    def release(self):
+        for q in self._queues:
+            while q:
+                fut = q.popleft()
+                if not fut.done():
+                    fut.set_result(None)   # joy to'g'ridan-to'g'ri navbatdagiga o'tadi
+                    return
+        self.free += 1
+
+
+class SchedulerMiddleware(BaseRequestMiddleware):
+    """bot.session middleware: har so'rov PriorityGate orqali. getUpdates (long-poll) navbatsiz —
+    u joyni 30 s band qilib qo'ymasin."""
+
+    def __init__(self, gate: PriorityGate):
+        self.gate = gate
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+        level = _priority.get()
+        t0 = time.perf_counter()
+        await self.gate.acquire(level)
+        API_QUEUE_SECONDS.observe(time.perf_counter() - t0, PRIORITY_NAMES[level])
+        try:
+            return await make_request(bot, method)
+        finally:
+            self.gate.release()
+
+
+class TunedSession(AiohttpSession):
+    """Umumiy keep-alive ulanishlar puli + orjson + ustuvorlik navbati.
+    Navbat birinchi middleware: API metrikalari faqat tarmoq vaqtini o'lchaydi."""
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, keepalive: float = HTTP_KEEPALIVE,
+                 concurrency: int = API_CONCURRENCY, **kwargs: Any):
+        super().__init__(limit=pool_size, json_loads=json_loads, json_dumps=json_dumps, **kwargs)
+        self._connector_init.update(limit_per_host=pool_size, keepalive_timeout=keepalive)
+        self.gate = PriorityGate(concurrency)
+        self.middleware(SchedulerMiddleware(self.gate))
+
+    def queue_depths(self) -> Dict[Tuple[str], float]:
+        return {(name,): float(self.gate.depth(i)) for i, name in enumerate(PRIORITY_NAMES)}
@@ -0,0 +1,88 @@
+# webhook.py — FastAPI orqali webhook rejimi
+#   WEB_CONCURRENCY=4 uvicorn webhook:app --host 0.0.0.0 --port 8080
+#   (worker soni --workers emas, WEB_CONCURRENCY orqali: profil keshi TTL'i shunga qarab tanlanadi)
+import os
+import hmac
+import fcntl
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, Request, Response, HTTPException
+from aiogram.types import Update
+
+from main import bot, dp, on_startup, on_shutdown, ALLOWED_UPDATES, DB_PATH
+from metrics import add_metrics_route
+
+log = logging.getLogger("davon-taksi-bot.webhook")
+
+WEBHOOK_URL             = os.getenv("WEBHOOK_URL")                  # https://bot.example.uz
+WEBHOOK_PATH            = os.getenv("WEBHOOK_PATH", "/tg/webhook")
+WEBHOOK_SECRET          = os.getenv("WEBHOOK_SECRET", "")           # [A-Za-z0-9_-]{1,256}
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+LEADER_LOCK_PATH        = os.getenv("LEADER_LOCK_PATH", DB_PATH + ".leader")
+# Ilova internetga ochiq: /metrics faqat token bilan (Prometheus: authorization.credentials).
+# Bo'sh bo'lsa marshrut umuman qo'shilmaydi.
+METRICS_TOKEN           = os.getenv("METRICS_TOKEN", "")
+
+# Sirsiz webhook'ga har kim soxta yangilanish yubora oladi (masalan, admin nomidan /export)
+if not WEBHOOK_SECRET:
+    raise RuntimeError("WEBHOOK_SECRET o'rnatilmagan: webhook rejimi sirsiz ishga tushmaydi.")
+
+_leader_fd: Optional[int] = None
+
+
+def _acquire_leader() -> bool:
+    """Bir nechta uvicorn worker ichidan faqat bittasi set_webhook, buyruqlar va
+    broadcast resume'ni bajaradi. Lock jarayon tugaguncha ushlab turiladi."""
+    global _leader_fd
+    fd = os.open(LEADER_LOCK_PATH, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _leader_fd = fd
+    return True
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    leader = _acquire_leader()
+    log.info("[WEBHOOK] worker pid=%s leader=%s", os.getpid(), leader)
+    if leader and WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=False,
+        )
+    await on_startup(leader=leader, serve_metrics=False)   # /metrics shu ilovada (METRICS_TOKEN bilan)
+    await dp.emit_startup(bot=bot)
+    try:
+        yield
+    finally:
+        await dp.emit_shutdown(bot=bot)   # FSM storage ham shu yerda yopiladi
+        await on_shutdown(leader=leader)
+        await bot.session.close()
+
+
+app = FastAPI(lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
+if METRICS_TOKEN:
+    add_metrics_route(app, token=METRICS_TOKEN)   # har worker o'z metrikalarini beradi
+
+
+@app.post(WEBHOOK_PATH)
+async def telegram_webhook(request: Request) -> Response:
+    got = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(got.encode(), WEBHOOK_SECRET.encode()):
+        raise HTTPException(status_code=403)
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+    await dp.feed_update(bot, update)
+    return Response(status_code=200)
+
+
+@app.get("/healthz")
+async def healthz() -> dict:
+    return {"ok": True}